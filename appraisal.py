@@ -0,0 +1,212 @@
+# Batch appraisal: predicted prices and prediction intervals for many vehicles at once.
+#
+# A price ~ log(odometer) model is precomputed for every segment at several levels,
+# from fine (make/model/year/condition/title/location) to coarse (make only, then
+# all listings). Scoring joins the whole input table against each level in turn and
+# uses the finest segment that has enough listings, so thousands of rows are priced
+# with a few vectorized merges instead of filtering the data once per car.
+#
+# Python:
+#   models = build_segment_models(listings)
+#   priced = appraise(models, inventory)
+#
+# Command line:
+#   python appraisal.py build --data data/montana_listings.xlsx --out models.pkl
+#   python appraisal.py score --models models.pkl --input inventory.csv --output priced.csv
+
+import argparse
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# Segment levels, finest first; the empty level is the model of all listings
+DEFAULT_LEVELS = [
+    ['make', 'model', 'year', 'condition', 'title', 'location'],
+    ['make', 'model', 'year', 'condition'],
+    ['make', 'model', 'year'],
+    ['make', 'model'],
+    ['make'],
+    [],
+]
+
+ATTRIBUTES = ['make', 'model', 'year', 'odometer', 'condition', 'title', 'location']
+
+
+def read_table(path, sheet_name=0):
+    '''Read a CSV, Parquet or Excel file into a DataFrame.'''
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return pd.read_parquet(path)
+    if extension in ('.xlsx', '.xls'):
+        return pd.read_excel(path, sheet_name=sheet_name)
+    return pd.read_csv(path)
+
+
+def write_table(data, path):
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        data.to_parquet(path, index=False)
+    else:
+        data.to_csv(path, index=False)
+
+
+def _normalize(data):
+    '''Lower-case text attributes so lookups match the scraped listings.'''
+    data = data.copy()
+    for col in ['make', 'model', 'condition', 'title', 'location']:
+        if col in data.columns:
+            data[col] = data[col].astype('string').str.strip().str.lower()
+    if 'year' in data.columns:
+        data['year'] = pd.to_numeric(data['year'], errors='coerce').astype(float)
+    data['odometer'] = pd.to_numeric(data['odometer'], errors='coerce')
+    data['log_odometer'] = np.log1p(data['odometer'])
+    return data
+
+
+def fit_segment_level(data, keys):
+    '''Per-segment OLS of price on log_odometer from grouped sums.'''
+    work = data[keys + ['log_odometer', 'price']].dropna().copy()
+    work['xx'] = work['log_odometer'] ** 2
+    work['xy'] = work['log_odometer'] * work['price']
+    work['yy'] = work['price'] ** 2
+    sums_cols = ['log_odometer', 'price', 'xx', 'xy', 'yy']
+    if keys:
+        grouped = work.groupby(keys, observed=True)
+        sums = grouped[sums_cols].sum()
+        sums['n'] = grouped.size()
+    else:
+        sums = work[sums_cols].sum().to_frame().T
+        sums['n'] = len(work)
+
+    n = sums['n'].astype(float)
+    x_mean = sums['log_odometer'] / n
+    y_mean = sums['price'] / n
+    sxx = sums['xx'] - n * x_mean ** 2
+    sxy = sums['xy'] - n * x_mean * y_mean
+    syy = sums['yy'] - n * y_mean ** 2
+
+    # Segments without spread in mileage fall back to a flat (mean price) model
+    has_slope = sxx > 1e-9
+    slope = np.where(has_slope, sxy / sxx.where(has_slope, 1.0), 0.0)
+    ssr = np.maximum(syy - slope * sxy, 0.0)
+    df_resid = n - np.where(has_slope, 2, 1)
+
+    model = pd.DataFrame({
+        'n': n,
+        'intercept': y_mean - slope * x_mean,
+        'slope': slope,
+        'x_mean': x_mean,
+        'sxx': np.where(has_slope, sxx, np.inf),
+        'df_resid': df_resid,
+        'resid_std': np.sqrt(ssr / df_resid.where(df_resid > 0, np.nan)),
+    }, index=sums.index)
+    return model
+
+
+def build_segment_models(listings, levels=None):
+    '''Precompute the segment models for every level from a table of listings.'''
+    levels = DEFAULT_LEVELS if levels is None else levels
+    data = _normalize(listings)
+    data['price'] = pd.to_numeric(data['price'], errors='coerce')
+    data = data[(data['price'] > 0) & (data['odometer'] > 0)]
+    return {
+        'levels': levels,
+        'tables': [fit_segment_level(data, keys) for keys in levels],
+    }
+
+
+def save_models(models, path):
+    with open(path, 'wb') as f:
+        pickle.dump(models, f)
+
+
+def load_models(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def appraise(models, vehicles, level=0.90, min_count=10):
+    '''Predicted price and prediction interval for every row of vehicles.
+
+    Each row uses the finest segment level with at least min_count listings.
+    Adds predicted_price, price_lower, price_upper, segment_level and
+    segment_size columns to a copy of vehicles.
+    '''
+    data = _normalize(vehicles).reset_index(drop=True)
+    n_rows = len(data)
+    out = {name: np.full(n_rows, np.nan) for name in
+           ['intercept', 'slope', 'x_mean', 'sxx', 'df_resid', 'resid_std', 'n']}
+    chosen = np.full(n_rows, -1)
+
+    for level_number, (keys, table) in enumerate(zip(models['levels'], models['tables'])):
+        todo = chosen < 0
+        if not todo.any():
+            break
+        usable = table[(table['n'] >= min_count) & (table['df_resid'] > 0)]
+        if keys:
+            lookup = pd.MultiIndex.from_frame(data.loc[todo, keys]) if len(keys) > 1 else data.loc[todo, keys[0]]
+            positions = usable.index.get_indexer(lookup)
+        else:
+            positions = np.zeros(todo.sum(), dtype=int) if len(usable) else np.full(todo.sum(), -1)
+        found = positions >= 0
+        rows = np.flatnonzero(todo)[found]
+        for name in out:
+            out[name][rows] = usable[name].to_numpy()[positions[found]]
+        chosen[rows] = level_number
+
+    x = data['log_odometer'].to_numpy()
+    predicted = out['intercept'] + out['slope'] * x
+    # Prediction interval for a new listing in the segment
+    leverage = 1.0 + 1.0 / out['n'] + (x - out['x_mean']) ** 2 / out['sxx']
+    t_crit = stats.t.ppf(0.5 + level / 2, np.where(out['df_resid'] > 0, out['df_resid'], np.nan))
+    half_width = t_crit * out['resid_std'] * np.sqrt(leverage)
+
+    result = vehicles.reset_index(drop=True).copy()
+    result['predicted_price'] = predicted
+    # A listing never sells for less than nothing, however wide the interval
+    result['price_lower'] = np.maximum(predicted - half_width, 0.0)
+    result['price_upper'] = predicted + half_width
+    result['segment_level'] = [
+        ('/'.join(models['levels'][i]) or 'all') if i >= 0 else None for i in chosen
+    ]
+    result['segment_size'] = out['n']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Price many vehicles at once from segment models.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Fit segment models from a listings file.')
+    build.add_argument('--data', default=os.path.join('data', 'montana_listings.xlsx'))
+    build.add_argument('--sheet', default='in', help='Sheet name for Excel input.')
+    build.add_argument('--out', default='segment_models.pkl')
+
+    score = commands.add_parser('score', help='Price every row of a CSV/Parquet file.')
+    score.add_argument('--models', default='segment_models.pkl')
+    score.add_argument('--input', required=True)
+    score.add_argument('--output', required=True)
+    score.add_argument('--level', type=float, default=0.90, help='Prediction interval level.')
+    score.add_argument('--min-count', type=int, default=10, help='Smallest usable segment.')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        models = build_segment_models(read_table(args.data, sheet_name=args.sheet))
+        save_models(models, args.out)
+        print(f"Segment models saved to '{args.out}'.")
+    else:
+        vehicles = read_table(args.input)
+        missing = [col for col in ATTRIBUTES if col not in vehicles.columns]
+        if 'odometer' in missing or 'make' in missing:
+            parser.error(f'Input is missing required columns: {missing}')
+        for col in missing:
+            vehicles[col] = np.nan
+        priced = appraise(load_models(args.models), vehicles, level=args.level, min_count=args.min_count)
+        write_table(priced, args.output)
+        print(f"Priced {len(priced)} vehicles, saved to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# Cross-state arbitrage scanner for the national carbitrage data.
+#
+# For every make/model we fit a price ~ log(odometer) model per state. Each listing
+# is then scored by the price the same car is expected to fetch in the other states
+# minus its asking price. Scoring is done on chunks of rows at a time, as one
+# (rows x states) matrix, and only the best K listings of each make/model are kept
+# in a bounded min-heap. The scanner state (models, heaps, listings already seen, by
+# url or by a hash of the row) can be saved, so new listings can be scanned later
+# without redoing old ones.
+#
+#   python arbitrage_scanner.py --data data/carbitrage-data-updated.xlsx
+#   python arbitrage_scanner.py --data new_listings.csv --state scanner_state.pkl
+
+import argparse
+import heapq
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from appraisal import fit_segment_level, read_table
+
+SEGMENT = ['make', 'model']
+
+
+class ArbitrageScanner:
+    '''Scores listings against per-state segment models and keeps the top K per segment.'''
+
+    def __init__(self, models, top_k=20, chunk_size=200_000):
+        '''models is the table from fit_state_models, indexed by (make, model, state).'''
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+
+        # Dense (segment x state) arrays of coefficients, NaN where a state has no model
+        segments = models.index.droplevel('state').unique()
+        self.states = np.array(sorted(models.index.get_level_values('state').unique()))
+        self.segment_index = segments
+        seg_codes = segments.get_indexer(models.index.droplevel('state'))
+        state_codes = np.searchsorted(self.states, models.index.get_level_values('state'))
+        self.intercepts = np.full((len(segments), len(self.states)), np.nan)
+        self.slopes = np.full((len(segments), len(self.states)), np.nan)
+        self.intercepts[seg_codes, state_codes] = models['intercept'].to_numpy()
+        self.slopes[seg_codes, state_codes] = models['slope'].to_numpy()
+
+        self.heaps = {}
+        self.seen = set()
+        self._counter = 0  # tie-breaker so heap entries never compare rows
+
+    def _score_chunk(self, chunk):
+        '''Best other-state expected price and the gain over the asking price.'''
+        seg = self.segment_index.get_indexer(pd.MultiIndex.from_frame(chunk[SEGMENT]))
+        own_state = pd.Index(self.states).get_indexer(chunk['state'])
+        known = seg >= 0
+        x = np.log1p(chunk['odometer'].to_numpy(dtype=float))
+
+        expected = np.full((len(chunk), len(self.states)), np.nan)
+        expected[known] = self.intercepts[seg[known]] + self.slopes[seg[known]] * x[known, None]
+        # Ignore the listing's own state
+        rows = np.flatnonzero(own_state >= 0)
+        expected[rows, own_state[rows]] = np.nan
+
+        # Without any usable state model (small input, high min_count) nothing has another state
+        has_other = ~np.isnan(expected).all(axis=1) if len(self.states) else np.zeros(len(chunk), dtype=bool)
+        best_state = np.full(len(chunk), -1)
+        best_price = np.full(len(chunk), np.nan)
+        if has_other.any():
+            best_state[has_other] = np.nanargmax(expected[has_other], axis=1)
+            best_price[has_other] = expected[np.flatnonzero(has_other), best_state[has_other]]
+        gain = best_price - chunk['price'].to_numpy(dtype=float)
+        return seg, best_state, best_price, gain
+
+    def scan(self, listings):
+        '''Score new listings and update the per-segment top-K heaps. Returns rows scored.'''
+        listings = clean_listings(listings)
+        keys = listing_keys(listings)
+        new = ~keys.isin(self.seen) & ~keys.duplicated()
+        listings = listings[new.to_numpy()]
+        self.seen.update(keys[new])
+
+        for start in range(0, len(listings), self.chunk_size):
+            chunk = listings.iloc[start:start + self.chunk_size]
+            seg, best_state, best_price, gain = self._score_chunk(chunk)
+
+            # Only rows that beat the current minimum of their segment's full heap
+            threshold = np.full(len(self.segment_index), -np.inf)
+            for s, heap in self.heaps.items():
+                if len(heap) >= self.top_k:
+                    threshold[s] = heap[0][0]
+            candidates = np.flatnonzero((seg >= 0) & ~np.isnan(gain))
+            candidates = candidates[gain[candidates] > threshold[seg[candidates]]]
+
+            records = chunk.iloc[candidates].to_dict('records')
+            for i, record in zip(candidates, records):
+                record['best_state'] = self.states[best_state[i]]
+                record['expected_price_best_state'] = best_price[i]
+                record['expected_gain'] = gain[i]
+                heap = self.heaps.setdefault(seg[i], [])
+                entry = (gain[i], self._counter, record)
+                self._counter += 1
+                if len(heap) < self.top_k:
+                    heapq.heappush(heap, entry)
+                elif entry[0] > heap[0][0]:
+                    heapq.heapreplace(heap, entry)
+        return len(listings)
+
+    def opportunities(self):
+        '''Ranked table of the kept listings, best expected gain first.'''
+        records = [entry[2] for heap in self.heaps.values() for entry in heap]
+        if not records:
+            return pd.DataFrame()
+        table = pd.DataFrame(records).sort_values('expected_gain', ascending=False)
+        return table.reset_index(drop=True)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def clean_listings(data):
+    '''Same cleaning as price_mileage_6.py, keeping the url when present.'''
+    columns = ['make', 'model', 'year', 'odometer', 'price', 'location', 'state']
+    keep = columns + (['url'] if 'url' in data.columns else [])
+    data = data[keep].dropna(subset=columns).copy()
+    # Excel turns some model names into dates or numbers; compare them as text
+    for col in SEGMENT + ['state']:
+        data[col] = data[col].astype(str)
+    data['odometer'] = pd.to_numeric(data['odometer'], errors='coerce')
+    data['price'] = pd.to_numeric(data['price'], errors='coerce')
+    return data[(data['odometer'] > 0) & (data['price'] > 0)]
+
+
+def listing_keys(listings):
+    '''Identity of each listing for rescans: its url, or a hash of its fields when it has none.'''
+    hashes = pd.util.hash_pandas_object(listings.drop(columns='url', errors='ignore'), index=False)
+    keys = pd.Series(hashes.to_numpy(), index=listings.index, dtype=object)
+    if 'url' in listings.columns:
+        keys = listings['url'].astype(object).where(listings['url'].notna(), keys)
+    return keys
+
+
+def fit_state_models(listings, min_count=10):
+    '''Per (make, model, state) OLS of price on log odometer, from grouped sums.'''
+    data = clean_listings(listings)
+    data['log_odometer'] = np.log1p(data['odometer'])
+    models = fit_segment_level(data, SEGMENT + ['state'])
+    return models[(models['n'] >= min_count) & (models['df_resid'] > 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find listings that are cheap relative to other states.')
+    parser.add_argument('--data', default=os.path.join('data', 'carbitrage-data-updated.xlsx'))
+    parser.add_argument('--state', default='scanner_state.pkl',
+                        help='Saved scanner; if it exists only unseen listings are scanned.')
+    parser.add_argument('--out', default=os.path.join('data', 'arbitrage_opportunities.csv'))
+    parser.add_argument('--top-k', type=int, default=20, help='Listings kept per make/model.')
+    parser.add_argument('--min-count', type=int, default=10, help='Smallest usable state model.')
+    args = parser.parse_args()
+
+    listings = read_table(args.data)
+    if os.path.exists(args.state):
+        scanner = ArbitrageScanner.load(args.state)
+    else:
+        scanner = ArbitrageScanner(fit_state_models(listings, args.min_count), top_k=args.top_k)
+
+    scanned = scanner.scan(listings)
+    scanner.save(args.state)
+    scanner.opportunities().to_csv(args.out, index=False)
+    print(f"Scanned {scanned} new listings; opportunities saved to '{args.out}'.")
+
+
+if __name__ == '__main__':
+    main()
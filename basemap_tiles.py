@@ -0,0 +1,217 @@
+# Offline basemap tiles for the map panels.
+# The maps use the carto-positron style, so every page view fetches basemap tiles
+# from Carto, which is slow and does not work on the air-gapped analysis boxes.
+# This module downloads the raster tiles that cover Montana at the zoom levels the
+# dashboards use into a local store (a {z}/{x}/{y}.png directory or an .mbtiles file),
+# serves them from a small HTTP endpoint, and points the Plotly maps at it: with
+# BASEMAP_TILE_URL set, apply_basemap() swaps the style for a blank one with the
+# local tiles as a raster layer. Without it the maps keep carto-positron.
+#
+#   python basemap_tiles.py download --store cache/tiles          (on a connected box)
+#   python basemap_tiles.py serve --store cache/tiles --port 8765
+#   BASEMAP_TILE_URL=http://127.0.0.1:8765/{z}/{x}/{y}.png python price_mileage_6.py
+
+import argparse
+import math
+import os
+import sqlite3
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SOURCE_URL = 'https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png'
+ATTRIBUTION = '© OpenStreetMap contributors © CARTO'
+MAX_ZOOM = 11  # highest map zoom the dashboards use (map_clusters.MAX_ZOOM)
+MONTANA_BOUNDS = (-116.5, 44.0, -103.5, 49.5)  # (lon_min, lat_min, lon_max, lat_max) with a margin
+TILE_URL = os.environ.get('BASEMAP_TILE_URL', '')
+USER_AGENT = 'telling-stories-dashboard tile cache'
+
+
+def tile_range(bounds, zoom):
+    '''(x_min, y_min, x_max, y_max) of the 256 pixel XYZ tiles covering bounds.'''
+    lon_min, lat_min, lon_max, lat_max = bounds
+    n = 2 ** zoom
+
+    def tile(lat, lon):
+        lat = math.radians(max(min(lat, 85.05112878), -85.05112878))
+        x = int((lon + 180) / 360 * n)
+        y = int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    x_min, y_min = tile(lat_max, lon_min)
+    x_max, y_max = tile(lat_min, lon_max)
+    return x_min, y_min, x_max, y_max
+
+
+def tiles_for(bounds=MONTANA_BOUNDS, max_zoom=MAX_ZOOM):
+    '''Every (z, x, y) tile a map of bounds needs up to map zoom max_zoom.
+
+    mapbox-gl draws 256 pixel raster tiles one level above the map's zoom, so
+    the tiles go up to max_zoom + 1.
+    '''
+    for zoom in range(max_zoom + 2):
+        x_min, y_min, x_max, y_max = tile_range(bounds, zoom)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield zoom, x, y
+
+
+class TileStore:
+    '''PNG tiles in a {z}/{x}/{y}.png directory, or in an MBTiles file.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = None
+        if path.endswith('.mbtiles'):
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, '
+                            'tile_row INTEGER, tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))')
+            self.db.executemany('INSERT OR IGNORE INTO metadata VALUES (?, ?)',
+                                [('name', 'basemap'), ('format', 'png'), ('attribution', ATTRIBUTION)])
+            self.db.commit()
+
+    def _file(self, z, x, y):
+        return os.path.join(self.path, str(z), str(x), f'{y}.png')
+
+    def get(self, z, x, y):
+        '''Tile bytes, or None when the tile is not in the store.'''
+        if self.db is None:
+            try:
+                with open(self._file(z, x, y), 'rb') as f:
+                    return f.read()
+            except OSError:
+                return None
+        # MBTiles numbers rows from the bottom (TMS)
+        with self.lock:
+            row = self.db.execute('SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?',
+                                  (z, x, 2 ** z - 1 - y)).fetchone()
+        return row[0] if row else None
+
+    def has(self, z, x, y):
+        if self.db is None:
+            return os.path.exists(self._file(z, x, y))
+        return self.get(z, x, y) is not None
+
+    def put(self, z, x, y, data):
+        if self.db is None:
+            path = self._file(z, x, y)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            return
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)', (z, x, 2 ** z - 1 - y, data))
+            self.db.commit()
+
+
+def fetch_tile(z, x, y, source_url=SOURCE_URL):
+    request = urllib.request.Request(source_url.format(z=z, x=x, y=y), headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+def download_tiles(store, bounds=MONTANA_BOUNDS, max_zoom=MAX_ZOOM, source_url=SOURCE_URL, workers=4):
+    '''Fetch the missing tiles into store; returns (downloaded, already stored, failed).'''
+    tiles = list(tiles_for(bounds, max_zoom))
+    missing = [tile for tile in tiles if not store.has(*tile)]
+    downloaded, failed = 0, 0
+
+    def fetch(tile):
+        try:
+            return tile, fetch_tile(*tile, source_url=source_url)
+        except OSError:
+            return tile, None
+
+    # Only a few connections at a time, to stay polite to the tile server
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for tile, data in pool.map(fetch, missing):
+            if data is None:
+                failed += 1
+            else:
+                store.put(*tile, data)
+                downloaded += 1
+    return downloaded, len(tiles) - len(missing), failed
+
+
+def basemap_layout(tile_url=None):
+    '''mapbox layout settings for the basemap: local tiles if configured, else carto-positron.'''
+    tile_url = TILE_URL if tile_url is None else tile_url
+    if not tile_url:
+        return {'style': 'carto-positron'}
+    return {'style': 'white-bg',
+            'layers': [{'below': 'traces', 'sourcetype': 'raster', 'source': [tile_url],
+                        'sourceattribution': ATTRIBUTION}]}
+
+
+def apply_basemap(fig, tile_url=None):
+    '''Point a map figure at the local tile endpoint when one is configured.'''
+    fig.update_layout(mapbox=basemap_layout(tile_url))
+    return fig
+
+
+def make_handler(store):
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            try:
+                z, x, y = int(parts[-3]), int(parts[-2]), int(parts[-1].split('.')[0])
+            except (IndexError, ValueError):
+                self.send_error(404)
+                return
+            data = store.get(z, x, y)
+            if data is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'public, max-age=86400')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileHandler
+
+
+def serve(store, host='127.0.0.1', port=8765):
+    '''Serve the store's tiles at http://host:port/{z}/{x}/{y}.png until interrupted.'''
+    server = ThreadingHTTPServer((host, port), make_handler(store))
+    print(f'Serving tiles at http://{host}:{port}/{{z}}/{{x}}/{{y}}.png')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download and serve offline basemap tiles.')
+    parser.add_argument('command', choices=['download', 'serve'])
+    parser.add_argument('--store', default=os.path.join('cache', 'tiles'),
+                        help='Tile directory, or a path ending in .mbtiles.')
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM, help='Highest map zoom to cover.')
+    parser.add_argument('--source', default=SOURCE_URL)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    store = TileStore(args.store)
+    if args.command == 'download':
+        downloaded, stored, failed = download_tiles(store, max_zoom=args.max_zoom, source_url=args.source,
+                                                    workers=args.workers)
+        print(f'Downloaded {downloaded} tiles, {stored} already stored, {failed} failed.')
+    else:
+        serve(store, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# Bootstrap confidence intervals for the price ~ log(odometer) regression.
+# All resample indices are drawn as one NumPy matrix and the OLS slope and intercept
+# of every resample are computed with row-wise sums, so there is no Python loop per
+# resample. Large jobs are split into chunks and run in a process pool.
+
+import atexit
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Fewer resamples do not give usable 95% percentile intervals. The floor wins over
+# max_cells: above max_cells / MIN_RESAMPLES rows a call does more than max_cells work.
+MIN_RESAMPLES = 200
+
+
+def _fit_chunk(x, y, n_resamples, seed):
+    '''Intercepts and slopes of n_resamples bootstrap resamples of (x, y).'''
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(x), size=(n_resamples, len(x)))
+    xb = x[idx]
+    yb = y[idx]
+    x_mean = xb.mean(axis=1)
+    y_mean = yb.mean(axis=1)
+    xc = xb - x_mean[:, None]
+    sxx = np.einsum('ij,ij->i', xc, xc)
+    sxy = np.einsum('ij,ij->i', xc, yb - y_mean[:, None])
+    # A resample where every x is identical has no slope
+    slopes = np.divide(sxy, sxx, out=np.full(n_resamples, np.nan), where=sxx > 0)
+    return y_mean - slopes * x_mean, slopes
+
+
+class BootstrapService:
+    '''Bootstrap CIs for the OLS coefficients and predicted prices, cached per key.
+
+    max_cells caps resamples x rows so a call stays within an interactive budget,
+    but min_resamples takes precedence, so very large samples exceed the budget
+    rather than get unusable intervals. Jobs larger than parallel_cells are split
+    across a process pool, which close() (or leaving a with block, or exit) shuts down.
+    '''
+
+    def __init__(self, n_resamples=1000, max_cells=20_000_000, parallel_cells=2_000_000,
+                 chunk_cells=1_000_000, max_workers=None, cache_size=64, seed=0,
+                 min_resamples=MIN_RESAMPLES):
+        self.n_resamples = n_resamples
+        self.min_resamples = min(min_resamples, n_resamples)
+        self.max_cells = max_cells
+        self.parallel_cells = parallel_cells
+        self.chunk_cells = chunk_cells
+        self.max_workers = max_workers or os.cpu_count()
+        self.cache_size = cache_size
+        self.seed = seed
+        self._cache = OrderedDict()
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            atexit.register(self.close)
+        return self._pool
+
+    def close(self):
+        '''Shut down the worker processes, if any were started.'''
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+            atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def resample_fits(self, x, y):
+        '''Arrays of bootstrap intercepts and slopes (empty for fewer than two rows).'''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        n = len(x)
+        if n < 2:
+            return np.empty(0), np.empty(0)
+        n_resamples = max(self.min_resamples, min(self.n_resamples, self.max_cells // n))
+
+        # Split into chunks small enough to keep the index matrix in memory
+        per_chunk = max(1, self.chunk_cells // n)
+        sizes = [min(per_chunk, n_resamples - start) for start in range(0, n_resamples, per_chunk)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(sizes))
+
+        if n * n_resamples > self.parallel_cells and len(sizes) > 1:
+            pool = self._executor()
+            results = list(pool.map(_fit_chunk, [x] * len(sizes), [y] * len(sizes), sizes, seeds))
+        else:
+            results = [_fit_chunk(x, y, size, seed) for size, seed in zip(sizes, seeds)]
+
+        intercepts = np.concatenate([r[0] for r in results])
+        slopes = np.concatenate([r[1] for r in results])
+        return intercepts, slopes
+
+    def confidence_intervals(self, x, y, x_new=None, level=0.95, key=None):
+        '''Percentile CIs for the intercept, slope and predictions at x_new.
+
+        key identifies the data (e.g. its version and filter state); repeated calls
+        with the same key, x_new and level are served from the cache.
+        '''
+        if key is not None:
+            x_key = None if x_new is None else np.asarray(x_new, dtype=float).tobytes()
+            key = (key, x_key, level)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        intercepts, slopes = self.resample_fits(x, y)
+        ok = ~np.isnan(slopes)
+        intercepts, slopes = intercepts[ok], slopes[ok]
+        tail = (1 - level) / 2 * 100
+        bounds = [tail, 100 - tail]
+
+        result = {
+            'n_resamples': int(ok.sum()),
+            'level': level,
+            'intercept': tuple(np.percentile(intercepts, bounds)) if ok.any() else (np.nan, np.nan),
+            'slope': tuple(np.percentile(slopes, bounds)) if ok.any() else (np.nan, np.nan),
+        }
+        if x_new is not None:
+            x_new = np.atleast_1d(np.asarray(x_new, dtype=float))
+            if ok.any():
+                predictions = intercepts[:, None] + slopes[:, None] * x_new[None, :]
+                lower, upper = np.percentile(predictions, bounds, axis=0)
+            else:
+                lower = upper = np.full(len(x_new), np.nan)
+            result['x_new'] = x_new
+            result['prediction_lower'] = lower
+            result['prediction_upper'] = upper
+
+        if key is not None:
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
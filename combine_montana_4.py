@@ -2,6 +2,18 @@ import panel as pn
 import numpy as np  # Import numpy
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objs as go
+import json
+import sys
+from comparables import ComparablesIndex
+from plot_aggregation import aggregated_scatter, ranges_from_relayout
+from figure_state import PaneUpdater
+from plot_sampling import PlotSample
+from figure_payload import compact_figure
+from map_clusters import ClusterPyramid, cluster_map, view_from_relayout
+from basemap_tiles import apply_basemap
+from static_export import export_dashboard
+from warm_cache import FigureCache, dataset_version, filter_values, top_filter_states
 
 # Initialize Panel with Plotly support
 pn.extension("plotly")
@@ -15,6 +27,13 @@ df_clean = df.dropna(subset=['price', 'odometer', 'make', 'model',
 
 df_clean['log_odometer'] = np.log(df_clean['odometer'])
 df_clean['vehicle_type'] = df_clean['type']
+df_clean['listing_id'] = df_clean.index  # carried in each point so hovers map back to a row
+
+# KD-tree index for the comparable-listings table shown on hover
+comparables_index = ComparablesIndex(df_clean)
+
+# Sampling order for large selections: outliers first, then make/model x price decile strata
+plot_sample = PlotSample(df_clean)
 
 # ===== FILTER FOR TOP 5 MAKES AND MODELS ===== #
 # Identify the top 5 makes
@@ -37,26 +56,35 @@ top_models = (
 df_filtered = df_filtered[df_filtered.set_index(['make', 'model']).index.isin(top_models)]
 
 # ===== HELPER FUNCTIONS ===== #
-def create_scatter_plot(filtered_data):
-    """Generate a scatter plot."""
-    fig = px.scatter(
+def create_scatter_plot(filtered_data, x_range=None, y_range=None):
+    """Generate a scatter plot (a labelled sample or a density image when many points are in view)."""
+    fig = aggregated_scatter(
         filtered_data, 
-        x='log_odometer', y='price', trendline='ols',
+        'log_odometer', 'price', x_range, y_range, trendline=True, sampler=plot_sample,
+        custom_data=['listing_id'],
         labels={'log_odometer': 'Log of Odometer', 'price': 'Price'},
         title='Scatter Plot: Price vs Log of Odometer'
     )
-    return fig
-
-def create_choropleth_map(filtered_data):
-    """Generate a map using latitude and longitude."""
+    # listing_id stays in customdata for the comparables hover callback
+    return compact_figure(fig, keep_customdata=True)
+
+def create_choropleth_map(make=None, model=None, zoom=6, center=None, bounds=None):
+    """Generate a map of listing clusters for the zoom level (listings when zoomed in)."""
+    pyramid = get_pyramid(make, model)
+    if center is None:
+        center = {'lat': pyramid.points['latitude'].mean(), 'lon': pyramid.points['longitude'].mean()}
+    if not pyramid.is_point_level(zoom):
+        fig = cluster_map(pyramid.clusters(zoom, bounds), color='mean_price', zoom=zoom, center=center,
+                          title='Map: Vehicle Prices by Location')
+        return compact_figure(fig)
     fig = px.scatter_mapbox(
-        filtered_data, 
+        pyramid.clusters(zoom, bounds), 
         lat='latitude', lon='longitude', color='price',
-        hover_name='make', zoom=6, height=500,
+        hover_name='make', custom_data=['listing_id'], zoom=zoom, center=center, height=500,
         title='Map: Vehicle Prices by Location',
         mapbox_style="carto-positron"
     )
-    return fig
+    return compact_figure(apply_basemap(fig), keep_customdata=True)
 
 def filter_data(make=None, model=None):
     """Filter the dataset based on selected make and model."""
@@ -67,6 +95,40 @@ def filter_data(make=None, model=None):
         filtered_df = filtered_df[filtered_df['model'] == model]
     return filtered_df
 
+# Cluster pyramids are built once per make/model selection
+pyramids = {}
+
+def get_pyramid(make=None, model=None):
+    key = (make or None, model or None)
+    if key not in pyramids:
+        pyramids[key] = ClusterPyramid(filter_data(make, model), value_columns=('price', 'residual'))
+    return pyramids[key]
+
+# Views rendered at deploy time (python combine_montana_4.py --warm-cache), shared by all workers
+figure_cache = FigureCache(version=dataset_version(r'data\\montana_listings.xlsx'))
+
+def view_key(make=None, model=None):
+    return ('combine_montana_4', filter_values(make), filter_values(model))
+
+def view_figures(make=None, model=None):
+    """Scatter and map for a make/model selection, from the warm cache when possible."""
+    cached = figure_cache.get(*view_key(make, model))
+    if cached is not None:
+        return go.Figure(cached['scatter']), go.Figure(cached['map'])
+    return create_scatter_plot(filter_data(make=make, model=model)), create_choropleth_map(make, model)
+
+def warm_figure_cache():
+    """Render every top make and make/model view into the shared cache."""
+    states = top_filter_states(df_filtered, n_makes=5, n_models=5)
+    for state in states:
+        make = state['make'][0] if state['make'] else None
+        model = state['model'][0] if state['model'] else None
+        scatter = create_scatter_plot(filter_data(make=make, model=model))
+        payload = {'scatter': json.loads(scatter.to_json()),
+                   'map': json.loads(create_choropleth_map(make, model).to_json())}
+        figure_cache.put(payload, *view_key(make, model))
+    print(f"Warmed {len(states)} views in '{figure_cache.directory}'.")
+
 # Update models based on selected make
 def update_model_options(event):
     """Update the model options based on the selected make."""
@@ -85,14 +147,49 @@ model_widget = pn.widgets.Select(name='Model', options=[''], width=150)
 make_widget.param.watch(update_model_options, 'value')
 
 # Create initial plots
-scatter_pane = pn.pane.Plotly(create_scatter_plot(df_filtered), height=500, width=700)
-map_pane = pn.pane.Plotly(create_choropleth_map(df_filtered), height=500, width=700)
+initial_scatter, initial_map = view_figures()
+scatter_pane = pn.pane.Plotly(initial_scatter, height=500, width=700)
+map_pane = pn.pane.Plotly(initial_map, height=500, width=700)
+
+# Later updates only push changed trace data to the panes
+scatter_updater = PaneUpdater(scatter_pane)
+map_updater = PaneUpdater(map_pane)
+
+# Table of the 10 closest comparables for the hovered listing
+comparables_columns = ['rank', 'make', 'model', 'year', 'odometer', 'price', 'location', 'distance_km']
+comparables_pane = pn.pane.DataFrame(pd.DataFrame(columns=comparables_columns), width=700, index=False)
+
+def show_comparables(event):
+    """Look up comparables for the listing under the mouse."""
+    points = (event.new or {}).get('points', [])
+    # The OLS trendline trace has no custom data, so skip hovers on it
+    ids = [point['customdata'][0] for point in points if point.get('customdata')]
+    if ids:
+        comparables_pane.object = comparables_index.query(ids[0], k=10)[comparables_columns].round(2)
+
+scatter_pane.param.watch(show_comparables, 'hover_data')
+map_pane.param.watch(show_comparables, 'hover_data')
 
 # Update function to refresh both graphs
 def update_graphs(event=None):
+    scatter_fig, map_fig = view_figures(make_widget.value, model_widget.value)
+    scatter_updater.update(scatter_fig)
+    map_updater.update(map_fig)
+
+# Redraw the scatter for the zoomed window, so points come back when zoomed in
+def zoom_scatter(event):
+    x_range, y_range = ranges_from_relayout(event.new)
     filtered_df = filter_data(make=make_widget.value, model=model_widget.value)
-    scatter_pane.object = create_scatter_plot(filtered_df)
-    map_pane.object = create_choropleth_map(filtered_df)
+    scatter_updater.update(create_scatter_plot(filtered_df, x_range, y_range))
+
+scatter_pane.param.watch(zoom_scatter, 'relayout_data')
+
+# Ask the pyramid for the clusters of the new zoom level and viewport
+def zoom_map(event):
+    zoom, center, bounds = view_from_relayout(event.new, 6, None)
+    map_updater.update(create_choropleth_map(make_widget.value, model_widget.value, zoom, center, bounds))
+
+map_pane.param.watch(zoom_map, 'relayout_data')
 
 # Attach callbacks to widgets
 make_widget.param.watch(update_graphs, 'value')
@@ -110,13 +207,32 @@ header = pn.pane.HTML(
 dashboard = pn.Column(
     header,
     widgets,  # Widgets at the top
-    pn.Row(scatter_pane, map_pane)  # Side-by-side graphs
+    pn.Row(scatter_pane, map_pane),  # Side-by-side graphs
+    pn.pane.HTML("<h2 style='font-size:18px;'>Closest Comparable Listings</h2>"),
+    comparables_pane
 )
 
 # ===== SERVE THE DASHBOARD ===== #
 # dashboard.show(port=5006)
 
 # ===== SAVE THE DASHBOARD TO HTML ===== #
-dashboard.save('vehicle_dashboard.html', embed=True)
+# The compact export stores the full Montana dataset once as compressed binary columns
+# and filters and draws the plots in the browser. Panel's embed=True export stores a figure for
+# every widget state, which is why it is limited to the top makes and models.
+COMPACT_EXPORT = True
+
+def main():
+    """Save the dashboard to HTML; --warm-cache renders the common views into the shared cache instead."""
+    if '--warm-cache' in sys.argv:
+        warm_figure_cache()
+        return
+
+    if COMPACT_EXPORT:
+        export_dashboard(df_clean, 'vehicle_dashboard.html', title='Vehicle Dashboard: Montana Listings')
+    else:
+        dashboard.save('vehicle_dashboard.html', embed=True)
+
+    print("Dashboard saved as 'vehicle_dashboard.html'. You can open it locally in a browser.")
 
-print("Dashboard saved as 'vehicle_dashboard.html'. You can open it locally in a browser.")
+if __name__ == '__main__':
+    main()
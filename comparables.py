@@ -0,0 +1,153 @@
+# Comparable-listings search.
+# For every make/model we build one KD-tree over (year, log_odometer, location).
+# Latitude/longitude are turned into 3D points on the Earth's surface, so straight-line
+# distance in the tree follows great-circle (haversine) distance closely at the
+# distances that matter for comparables. Each feature is scaled by a weight, so a
+# "unit" of distance means the same thing for years, mileage and kilometres.
+# A top-k query is one tree lookup, and batches of listings are queried together.
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+# One unit of distance = 1 model year = 0.25 in log mileage (~28%) = 100 km
+DEFAULT_WEIGHTS = {'year': 1.0, 'log_odometer': 4.0, 'km': 0.01}
+
+
+def _sphere_km(lat, lon):
+    '''Latitude/longitude in degrees to 3D coordinates in km.'''
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return EARTH_RADIUS_KM * np.column_stack([
+        np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)
+    ])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    '''Great-circle distance in km.'''
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class ComparablesIndex:
+    '''Top-k similar listings with the same make and model.'''
+
+    def __init__(self, data, weights=None, group_columns=('make', 'model')):
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.group_columns = list(group_columns)
+        data = data.dropna(subset=self.group_columns + ['year', 'odometer', 'latitude', 'longitude'])
+        data = data[data['odometer'] > 0]
+        self.data = data
+        self.features = self._features(data)
+
+        # One tree per make/model, holding positions into self.data
+        self.trees = {}
+        self.tree_of_row = np.empty(len(data), dtype=object)
+        for key, positions in data.groupby(self.group_columns, sort=False).indices.items():
+            self.trees[key] = (cKDTree(self.features[positions]), positions)
+            self.tree_of_row[positions] = [key] * len(positions)
+
+    def _features(self, data):
+        w = self.weights
+        log_odometer = data['log_odometer'] if 'log_odometer' in data else np.log(data['odometer'])
+        return np.column_stack([
+            w['year'] * data['year'].to_numpy(dtype=float),
+            w['log_odometer'] * np.asarray(log_odometer, dtype=float),
+            w['km'] * _sphere_km(data['latitude'], data['longitude']),
+        ])
+
+    def nearest(self, position, k=10, exclude_self=True):
+        '''Positions and distances of the k nearest comparables of the listing at position.
+
+        Pure array lookup with no DataFrame work, for hover callbacks.
+        '''
+        tree, tree_positions = self.trees[self.tree_of_row[position]]
+        distances, neighbours = tree.query(self.features[position], k=min(k + int(exclude_self), tree.n))
+        matches = tree_positions[np.atleast_1d(neighbours)]
+        distances = np.atleast_1d(distances)
+        if exclude_self:
+            keep = matches != position
+            matches, distances = matches[keep], distances[keep]
+        return matches[:k], distances[:k]
+
+    def query_batch(self, listings=None, k=10, exclude_self=True, positions=None):
+        '''Comparables for every row of listings (same columns as the index data).
+
+        Returns a DataFrame with query_id, rank, distance, distance_km and the
+        comparable listing's columns. Queries are grouped by make/model so each
+        tree is searched once with all of its query points.
+
+        With exclude_self, a listing's own row is dropped only when the listing is a
+        row of the index data: positions gives row positions in self.data (and then
+        replaces listings), else they are looked up from the index labels. The match
+        must be that row and at distance 0, so a new listing that happens to share a
+        label with an indexed one is not dropped.
+        '''
+        if positions is not None:
+            positions = np.asarray(positions)
+            listings = self.data.iloc[positions]
+            self_positions = positions
+        elif exclude_self and self.data.index.is_unique:
+            self_positions = self.data.index.get_indexer(listings.index)
+        else:
+            self_positions = np.full(len(listings), -1)
+        valid = (listings[self.group_columns + ['year', 'odometer', 'latitude', 'longitude']].notna().all(axis=1)
+                 & (listings['odometer'] > 0)).to_numpy()
+        listings, self_positions = listings[valid], np.asarray(self_positions)[valid]
+        query_features = self._features(listings)
+        frames, query_rows = [], []
+        for key, positions in listings.groupby(self.group_columns, sort=False).indices.items():
+            if key not in self.trees:
+                continue
+            tree, tree_positions = self.trees[key]
+            # Ask for one extra neighbour so the listing itself can be dropped
+            k_query = min(k + int(exclude_self), tree.n)
+            distances, neighbours = tree.query(query_features[positions], k=k_query)
+            distances = distances.reshape(len(positions), -1)
+            neighbours = neighbours.reshape(len(positions), -1)
+
+            rows = np.repeat(positions, neighbours.shape[1])
+            match_positions = tree_positions[neighbours.ravel()]
+            frame = self.data.iloc[match_positions].copy()
+            frame.insert(0, 'query_id', listings.index[rows].to_numpy())
+            frame.insert(1, 'distance', distances.ravel())
+            if exclude_self:
+                keep = (match_positions != self_positions[rows]) | (distances.ravel() > 0)
+                frame, rows = frame[keep], rows[keep]
+            frames.append(frame)
+            query_rows.append(rows)
+
+        if not frames:
+            return pd.DataFrame()
+        result = pd.concat(frames)
+        # Ranks and distances go by query row, as query labels need not be unique
+        query_rows = np.concatenate(query_rows)
+        rank = pd.Series(query_rows).groupby(query_rows).cumcount().to_numpy() + 1
+        result['rank'] = rank
+        result, query_rows = result[rank <= k], query_rows[rank <= k]
+        result['distance_km'] = haversine_km(
+            listings['latitude'].to_numpy()[query_rows], listings['longitude'].to_numpy()[query_rows],
+            result['latitude'].to_numpy(), result['longitude'].to_numpy()
+        )
+        return result
+
+    def query(self, listing, k=10, exclude_self=True):
+        '''Comparables for one listing, given as an index label of the data or a row.'''
+        if not isinstance(listing, (pd.Series, dict)):
+            position = self.data.index.get_loc(listing)
+            matches, distances = self.nearest(position, k, exclude_self)
+            result = self.data.iloc[matches].copy()
+            result.insert(0, 'query_id', listing)
+            result.insert(1, 'distance', distances)
+            result['rank'] = np.arange(1, len(matches) + 1)
+            result['distance_km'] = haversine_km(
+                self.data['latitude'].iloc[position], self.data['longitude'].iloc[position],
+                result['latitude'].to_numpy(), result['longitude'].to_numpy()
+            )
+            return result
+        listing = listing if isinstance(listing, pd.Series) else pd.Series(listing)
+        query = listing.to_frame().T.infer_objects()
+        return self.query_batch(query, k=k, exclude_self=exclude_self)
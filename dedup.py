@@ -0,0 +1,189 @@
+# Near-duplicate / cross-posted listing detection.
+# The same car is often posted in several Craigslist locations or reposted with a new
+# url, which counts it more than once in every regression. Each listing is turned into
+# a set of tokens (words of the name and title text plus make, model, year and rounded
+# mileage and price), summarized by a MinHash signature, and LSH banding puts listings
+# with similar signatures in the same bucket. Only listings sharing a bucket are
+# compared, so the work grows with the number of listings rather than with pairs.
+# A candidate pair counts as a duplicate only if the two listings themselves agree
+# (estimated Jaccard similarity, price and mileage), and a cluster only takes in a
+# listing that agrees with every listing already in it, so dealer listings sharing
+# boilerplate text are not chained together into one car.
+
+import numpy as np
+import pandas as pd
+
+TEXT_COLUMNS = ['name', 'title_text']
+_MERSENNE_PRIME = (1 << 61) - 1
+PRICE_TOLERANCE = 0.05     # relative difference still treated as the same asking price
+ODOMETER_TOLERANCE = 0.02  # relative difference still treated as the same mileage
+WINDOW = 8                 # bucket neighbours (in price/mileage order) compared with each listing
+
+
+def listing_tokens(data):
+    '''Flat (row position, token) arrays for all listings.'''
+    rows, tokens = [], []
+    for col in TEXT_COLUMNS:
+        if col in data.columns:
+            text = data[col].fillna('').astype(str).str.lower().reset_index(drop=True)
+            words = text.str.findall(r'[a-z0-9]+').explode().dropna()
+            rows.append(words.index.to_numpy())
+            tokens.append((col + ':' + words).to_numpy(dtype=object))
+
+    # Attributes; mileage and price are rounded so small edits still match
+    attributes = {
+        'make': data.get('make'),
+        'model': data.get('model'),
+        'year': data.get('year'),
+        'odometer': pd.to_numeric(data['odometer'], errors='coerce') // 1000 if 'odometer' in data else None,
+        'price': pd.to_numeric(data['price'], errors='coerce') // 500 if 'price' in data else None,
+    }
+    for name, values in attributes.items():
+        if values is not None:
+            rows.append(np.arange(len(data)))
+            tokens.append((name + '=' + values.astype(str).str.lower()).to_numpy(dtype=object))
+
+    rows = np.concatenate(rows)
+    order = np.argsort(rows, kind='stable')
+    return rows[order], np.concatenate(tokens)[order]
+
+
+def _mod_mersenne(x):
+    '''x mod 2^61 - 1 for uint64 arrays.'''
+    p = np.uint64(_MERSENNE_PRIME)
+    x = (x & p) + (x >> np.uint64(61))
+    return np.where(x >= p, x - p, x)
+
+
+def _mulmod_mersenne(x, a):
+    '''(x * a) mod 2^61 - 1 for uint64 arrays with values below 2^61, without overflow.'''
+    low32 = np.uint64(0xFFFFFFFF)
+    x_hi, x_lo = x >> np.uint64(32), x & low32
+    a_hi, a_lo = a >> np.uint64(32), a & low32
+    # x * a = hi * 2^64 + mid * 2^32 + lo, and 2^61 = 1 (mod p), so 2^64 = 8
+    hi = x_hi * a_hi
+    mid = x_hi * a_lo + x_lo * a_hi
+    lo = _mod_mersenne(x_lo * a_lo)
+    mid = (mid >> np.uint64(29)) + ((mid & np.uint64((1 << 29) - 1)) << np.uint64(32))
+    return _mod_mersenne(_mod_mersenne(hi << np.uint64(3)) + _mod_mersenne(mid) + lo)
+
+
+def minhash_signatures(rows, tokens, n_rows, num_perm=64, seed=1, chunk_tokens=2_000_000):
+    '''MinHash signature (num_perm values) for each row, from tokens sorted by row.
+
+    Permutation k hashes a token to (a_k * h + b_k) mod 2^61 - 1, a universal family.
+    '''
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    hashes = _mod_mersenne(pd.util.hash_array(tokens))
+
+    # Every row has at least its attribute tokens, so each row has a start position
+    starts = np.searchsorted(rows, np.arange(n_rows))
+    signatures = np.empty((n_rows, num_perm), dtype=np.uint64)
+
+    # Process rows in chunks so the (tokens x permutations) matrix stays small
+    rows_per_chunk = max(1, int(chunk_tokens * n_rows / max(len(rows), 1)))
+    for first in range(0, n_rows, rows_per_chunk):
+        last = min(first + rows_per_chunk, n_rows)
+        lo = starts[first]
+        hi = starts[last] if last < n_rows else len(hashes)
+        permuted = _mod_mersenne(_mulmod_mersenne(hashes[lo:hi, None], a[None, :]) + b[None, :])
+        signatures[first:last] = np.minimum.reduceat(permuted, starts[first:last] - lo, axis=0)
+    return signatures
+
+
+def _close(values, i, j, tolerance):
+    '''Pairs whose values differ by at most tolerance (relative); missing only matches missing.'''
+    if values is None:
+        return np.ones(len(i), dtype=bool)
+    return np.isclose(values[i], values[j], rtol=tolerance, atol=0, equal_nan=True)
+
+
+def candidate_pairs(signatures, price, odometer, bands, window=WINDOW):
+    '''(i, j) row pairs with i < j that share an LSH bucket in some band.
+
+    Within a bucket each row is paired with the next window rows in price and mileage
+    order, so a large bucket (shared boilerplate) does not produce all of its pairs.
+    '''
+    n, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    sort_price = np.nan_to_num(price, nan=-1.0) if price is not None else np.zeros(n)
+    sort_odometer = np.nan_to_num(odometer, nan=-1.0) if odometer is not None else np.zeros(n)
+    pairs = []
+    for band in range(bands):
+        band_values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        keys = pd.util.hash_pandas_object(pd.DataFrame(band_values), index=False).to_numpy()
+        codes, _ = pd.factorize(keys)
+        order = np.lexsort((sort_odometer, sort_price, codes))
+        for step in range(1, min(window, n - 1) + 1):
+            same = codes[order[:-step]] == codes[order[step:]]
+            first, second = order[:-step][same], order[step:][same]
+            pairs.append(np.minimum(first, second).astype(np.int64) * n + np.maximum(first, second))
+    if not pairs:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    pairs = np.unique(np.concatenate(pairs))
+    return pairs // n, pairs % n
+
+
+def _complete_linkage(n, i, j, similarity):
+    '''Cluster labels where every two listings in a cluster are an agreeing pair.'''
+    agree = set(zip(i.tolist(), j.tolist()))
+    labels = np.arange(n)
+    members = {}
+    for k in np.argsort(-similarity, kind='stable'):
+        first, second = labels[i[k]], labels[j[k]]
+        if first == second:
+            continue
+        left, right = members.get(first, [first]), members.get(second, [second])
+        if all((min(x, y), max(x, y)) in agree for x in left for y in right):
+            for row in right:
+                labels[row] = first
+            members[first] = left + right
+            members.pop(second, None)
+    return pd.factorize(labels)[0]
+
+
+def duplicate_clusters(data, num_perm=64, bands=16, threshold=0.8,
+                       price_tolerance=PRICE_TOLERANCE, odometer_tolerance=ODOMETER_TOLERANCE):
+    '''Cluster id for every row; rows in the same cluster are near-duplicates.
+
+    Candidate pairs come from the LSH buckets. A pair agrees when its signatures
+    match on at least threshold of the positions (the estimated Jaccard similarity)
+    and its price and mileage are within the tolerances. Clusters are built
+    greedily from the most similar pairs and only merge when every pair across the
+    two clusters agrees.
+    '''
+    n = len(data)
+    if n == 0:
+        return np.empty(0, dtype=int)
+    rows, tokens = listing_tokens(data)
+    signatures = minhash_signatures(rows, tokens, n, num_perm=num_perm)
+    price = pd.to_numeric(data['price'], errors='coerce').to_numpy(dtype=float) if 'price' in data else None
+    odometer = pd.to_numeric(data['odometer'], errors='coerce').to_numpy(dtype=float) if 'odometer' in data else None
+
+    i, j = candidate_pairs(signatures, price, odometer, bands)
+    similarity = (signatures[i] == signatures[j]).mean(axis=1)
+    keep = ((similarity >= threshold) & _close(price, i, j, price_tolerance)
+            & _close(odometer, i, j, odometer_tolerance))
+    return _complete_linkage(n, i[keep], j[keep], similarity[keep])
+
+
+def flag_duplicates(data, **kwargs):
+    '''Add dup_cluster, dup_count and is_duplicate columns.
+
+    Within a cluster the most recently posted listing (or the first row when
+    there is no time_posted column) is kept as the original.
+    '''
+    data = data.copy()
+    data['dup_cluster'] = duplicate_clusters(data, **kwargs)
+    data['dup_count'] = data.groupby('dup_cluster')['dup_cluster'].transform('size')
+    order = data.sort_values('time_posted', ascending=False, kind='stable') if 'time_posted' in data else data
+    data['is_duplicate'] = order.duplicated('dup_cluster').reindex(data.index)
+    return data
+
+
+def collapse_duplicates(data, **kwargs):
+    '''Keep one listing per near-duplicate cluster.'''
+    flagged = flag_duplicates(data, **kwargs)
+    return flagged[~flagged['is_duplicate']].drop(columns=['dup_cluster', 'is_duplicate'])
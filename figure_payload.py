@@ -0,0 +1,114 @@
+# Smaller, faster Plotly figures.
+# Three passes over a finished figure before it is handed to Streamlit, Dash or Panel:
+#   - SVG scatter traces with many points are swapped for WebGL (scattergl) traces
+#   - numeric arrays are stored as float32 when that keeps them within rtol, so
+#     plotly >= 6 writes them as base64 typed arrays ({'dtype': 'f4', 'bdata': ...})
+#     instead of long JSON number lists
+#   - customdata columns that the hovertemplate never shows are dropped
+# Integer arrays are only compacted when float32 holds them exactly, and customdata
+# that callbacks read back (keep_customdata) is never touched.
+
+import re
+
+import numpy as np
+import plotly.graph_objs as go
+
+WEBGL_THRESHOLD = 1000
+NUMERIC_ATTRIBUTES = ['x', 'y', 'z', 'lat', 'lon']
+MARKER_ATTRIBUTES = ['color', 'size']
+
+
+def compact_array(values, rtol=1e-6):
+    '''values as a float32 array when the round trip stays within rtol, else unchanged.
+
+    Integers (ids, counts) must round-trip exactly, i.e. stay within 2**24.
+    '''
+    if values is None or isinstance(values, (str, dict)):
+        return values
+    arr = np.asarray(values)
+    if arr.size == 0 or arr.dtype.kind not in 'iuf' or arr.dtype == np.float32:
+        return values
+    with np.errstate(invalid='ignore', over='ignore'):
+        small = arr.astype(np.float32)
+        if arr.dtype.kind in 'iu':
+            close = (small.astype(arr.dtype) == arr).all() and np.abs(arr).max() <= 2 ** 24
+        else:
+            close = np.isclose(small, arr, rtol=rtol, atol=0, equal_nan=True).all()
+    return small if close else values
+
+
+def use_webgl(fig, threshold=WEBGL_THRESHOLD):
+    '''Replace go.Scatter traces with more than threshold points by go.Scattergl.'''
+    traces = []
+    for trace in fig.data:
+        if trace.type == 'scatter' and trace.x is not None and len(trace.x) > threshold:
+            props = trace.to_plotly_json()
+            props.pop('type', None)
+            trace = go.Scattergl(props, skip_invalid=True)
+        traces.append(trace)
+    fig.data = []
+    fig.add_traces(traces)
+    return fig
+
+
+def drop_unused_hover(fig, keep_customdata=False):
+    '''Drop customdata columns not referenced by the trace's hovertemplate.
+
+    keep_customdata leaves customdata alone for callbacks that read it from
+    hover events (e.g. the listing_id used for the comparables table).
+    '''
+    if keep_customdata:
+        return fig
+    for trace in fig.data:
+        customdata = getattr(trace, 'customdata', None)
+        if customdata is None:
+            continue
+        template = trace.hovertemplate or ''
+        used = sorted({int(i) for i in re.findall(r'customdata\[(\d+)\]', template)})
+        if not used:
+            trace.customdata = None
+            continue
+        columns = np.asarray(customdata)
+        if columns.ndim != 2 or len(used) == columns.shape[1]:
+            continue
+        # Keep the referenced columns and renumber them in the template
+        renumber = {old: new for new, old in enumerate(used)}
+        trace.customdata = columns[:, used]
+        trace.hovertemplate = re.sub(r'customdata\[(\d+)\]',
+                                     lambda m: f'customdata[{renumber[int(m.group(1))]}]', template)
+    return fig
+
+
+def _compact(obj, attr, rtol):
+    values = obj[attr]
+    small = compact_array(values, rtol)
+    if small is not values:
+        # Plotly ignores an assignment that compares equal to the current value,
+        # which a float32 copy of exactly representable numbers does
+        obj[attr] = None
+        obj[attr] = small
+
+
+def compact_arrays(fig, rtol=1e-6, keep_customdata=False):
+    '''Store the numeric arrays of every trace as float32 where precision allows.
+
+    keep_customdata leaves customdata as it is, for callbacks that read ids from it.
+    '''
+    for trace in fig.data:
+        for attr in NUMERIC_ATTRIBUTES:
+            if attr in trace:
+                _compact(trace, attr, rtol)
+        if 'marker' in trace:
+            for attr in MARKER_ATTRIBUTES:
+                if attr in trace.marker:
+                    _compact(trace.marker, attr, rtol)
+        if getattr(trace, 'customdata', None) is not None and not keep_customdata:
+            _compact(trace, 'customdata', rtol)
+    return fig
+
+
+def compact_figure(fig, webgl_threshold=WEBGL_THRESHOLD, keep_customdata=False, rtol=1e-6):
+    '''WebGL traces, trimmed hover data and float32 arrays, in that order.'''
+    fig = use_webgl(fig, webgl_threshold)
+    fig = drop_unused_hover(fig, keep_customdata)
+    return compact_arrays(fig, rtol, keep_customdata)
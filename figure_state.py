@@ -0,0 +1,131 @@
+# Incremental figure updates for the Dash and Panel dashboards.
+# Replacing a figure on every widget change re-sends the template, the layout and
+# every trace. When the new figure has the same traces as the one on screen (same
+# types, names and modes), only the trace data and the few layout fields that follow
+# the data are sent: as a Dash Patch, or as an in-place update of the Panel pane's
+# figure. Figures with a different trace structure (e.g. the density image replacing
+# the scatter, or the cluster map replacing the listing map) are sent in full.
+# Dashboards that keep one static layout can skip building a figure for a patch:
+# dash_trace_update() takes plain trace dicts and the layout fields that changed.
+# Plotly only writes numpy arrays as base64 typed arrays inside a figure, so arrays
+# in a Dash Patch are encoded here to keep the patch as compact as the figure.
+
+import base64
+
+import numpy as np
+
+DATA_KEYS = ['x', 'y', 'z', 'lat', 'lon', 'text', 'hovertext', 'customdata', 'hovertemplate', 'marker']
+LAYOUT_KEYS = ['title', 'xaxis.range', 'yaxis.range', 'mapbox.zoom', 'mapbox.center']
+
+
+def trace_signature(fig):
+    '''Type, name and mode of each trace; data can be patched while this is unchanged.'''
+    if fig is None:
+        return None
+    return [[trace.type, trace.name, getattr(trace, 'mode', None)] for trace in fig.data]
+
+
+def trace_updates(trace):
+    '''Data properties of a trace, None for those it does not set.'''
+    props = trace.to_plotly_json()
+    return {key: props.get(key) for key in DATA_KEYS if key in trace}
+
+
+def layout_updates(fig):
+    '''Layout fields that change with the data, as dotted paths.'''
+    layout = fig.layout.to_plotly_json()
+    updates = {}
+    for path in LAYOUT_KEYS:
+        # Only touch the axes of cartesian figures and the mapbox of map figures
+        root = path.split('.')[0]
+        if root != 'title' and root not in layout:
+            continue
+        value = layout
+        for part in path.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        updates[path] = value
+    # Axes without a fixed range go back to autoscaling
+    for axis in ('xaxis', 'yaxis'):
+        if axis + '.range' in updates:
+            updates[axis + '.autorange'] = updates[axis + '.range'] is None
+    return updates
+
+
+def typed_array(value):
+    '''Numeric numpy arrays as plotly.js typed array specs, other values unchanged.'''
+    if isinstance(value, dict):
+        return {key: typed_array(item) for key, item in value.items()}
+    if not isinstance(value, np.ndarray) or value.dtype.kind not in 'iuf' or value.dtype.itemsize > 8:
+        return value
+    if value.dtype.kind in 'iu' and value.dtype.itemsize == 8:
+        return value  # plotly.js has no 64 bit integer arrays
+    value = np.ascontiguousarray(value)
+    spec = {'dtype': value.dtype.str.lstrip('<|='), 'bdata': base64.b64encode(value.tobytes()).decode('ascii')}
+    if value.ndim > 1:
+        spec['shape'] = ','.join(str(n) for n in value.shape)
+    return spec
+
+
+def _patch(trace_data, layout):
+    from dash import Patch
+
+    patched = Patch()
+    for i, data in enumerate(trace_data):
+        for key, value in data.items():
+            patched['data'][i][key] = typed_array(value)
+    for path, value in layout.items():
+        target = patched['layout']
+        *parents, last = path.split('.')
+        for part in parents:
+            target = target[part]
+        target[last] = value
+    return patched
+
+
+def dict_signature(traces):
+    '''trace_signature of a figure made from plain trace dicts.'''
+    return [[trace['type'], trace.get('name'), trace.get('mode')] for trace in traces]
+
+
+def build_figure(traces, layout, base_layout):
+    '''go.Figure of trace dicts on base_layout, with the data-dependent layout fields set.'''
+    import plotly.graph_objs as go
+
+    fig = go.Figure(data=traces, layout=base_layout)
+    fig.update_layout(layout)
+    return fig
+
+
+def dash_trace_update(traces, layout, signature, base_layout):
+    '''(figure or Patch, signature) from trace dicts and dotted layout fields.
+
+    For dashboards whose static layout (base_layout) is built once: while the trace
+    structure on screen is unchanged only the trace arrays and layout fields are
+    sent, and the full figure is only assembled when it changes.
+    '''
+    new_signature = dict_signature(traces)
+    if signature != new_signature:
+        return build_figure(traces, layout, base_layout), new_signature
+    trace_data = [{key: trace[key] for key in DATA_KEYS if key in trace} for trace in traces]
+    return _patch(trace_data, layout), new_signature
+
+
+class PaneUpdater:
+    '''Updates a pn.pane.Plotly in place when the trace structure is unchanged.'''
+
+    def __init__(self, pane):
+        self.pane = pane
+
+    def update(self, fig):
+        current = self.pane.object
+        if trace_signature(current) != trace_signature(fig):
+            self.pane.object = fig
+            return
+        with current.batch_update():
+            for old, new in zip(current.data, fig.data):
+                for key, value in trace_updates(new).items():
+                    old[key] = value
+            current.layout.update({path.replace('.', '_'): value
+                                   for path, value in layout_updates(fig).items()})
+        # Panel only sends the data sources that changed
+        self.pane.param.trigger('object')
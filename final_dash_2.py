@@ -7,108 +7,224 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
-import statsmodels.api as sm
 import plotly.express as px
+import io
 import os
+from outlier_sketches import SegmentSummaries
+from bootstrap_ci import BootstrapService
+from ols_kernel import simple_ols
+from dedup import flag_duplicates
+from shared_dataset import SharedDataset
+from warm_cache import dataset_version
+from figure_payload import compact_figure
+from map_clusters import ClusterPyramid, cluster_map, viewport_bounds, MAX_ZOOM
+from basemap_tiles import apply_basemap
+from plot_aggregation import aggregated_scatter
+from trendlines import trendline_traces, BAND_POINTS
 
 # Set file path dynamically based on the location of the python file.
 # this is necessary for the app to work on the streamlit cloud
 current_file_dir = os.path.dirname(os.path.abspath(__file__))
 file_path = os.path.join(current_file_dir, 'data', 'montana_listings.csv')
 
-# Load the dataset
-df = pd.read_csv(file_path)
+# Price sketches are kept per make/model/year. Title, condition and vehicle type are
+# left out: with them nearly every listing is its own segment.
+segment_columns = ['make', 'model', 'year']
 
-# Rename problematic column
-df = df.rename(columns={'type': 'vehicle_type'})
+# Load, clean and index the dataset once per process. Every session gets the same
+# read-only dataset and works on arrays of row positions into it, so memory stays
+# flat as users are added (st.cache_data would give every caller its own copy).
+@st.cache_resource
+def load_dataset(file_path, version):
+    '''Cleaned listings, duplicate flags and filter indexes, shared by all sessions.'''
+    df = pd.read_csv(file_path)
 
-# Convert price to numeric, removing any non-numeric values
-df['price'] = pd.to_numeric(df['price'], errors='coerce')
-df['odometer'] = pd.to_numeric(df['odometer'], errors='coerce')
+    # Rename problematic column
+    df = df.rename(columns={'type': 'vehicle_type'})
 
-# Drop rows with NaN values in price or odometer
-df = df.dropna(subset=['price', 'odometer'])
+    # Convert price to numeric, removing any non-numeric values
+    df['price'] = pd.to_numeric(df['price'], errors='coerce')
+    df['odometer'] = pd.to_numeric(df['odometer'], errors='coerce')
+
+    # Drop rows with NaN values in price or odometer
+    df = df.dropna(subset=['price', 'odometer'])
+    df['log_odometer'] = np.log1p(df['odometer'])
+
+    # Listings that repeat another listing (MinHash/LSH clusters)
+    df['is_duplicate'] = flag_duplicates(df)['is_duplicate'].to_numpy(dtype=bool)
+    return SharedDataset.from_frame(df, index_columns=['make', 'model', 'title', 'condition', 'vehicle_type'])
+
+version = dataset_version(file_path)
+dataset = load_dataset(file_path, version)
 
 # Sidebar for outlier exclusion based on price range
 st.sidebar.header('Outlier Exclusion')
 min_price, max_price = st.sidebar.slider(
-    'Select price range', int(df['price'].min()), int(df['price'].max()), (0, 50000)
+    'Select price range', int(np.nanmin(dataset.column('price'))), int(np.nanmax(dataset.column('price'))), (0, 50000)
 )
 exclude_outliers = st.sidebar.checkbox('Exclude Outliers', value=True)
 
-# Function to exclude outliers based on the IQR method
-def remove_outliers(data, column, threshold=1.5):
-    '''Exclude outliers in a specified column using the IQR method.'''
-    q1 = data[column].quantile(0.25)
-    q3 = data[column].quantile(0.75)
-    iqr = q3 - q1
-    return data[(data[column] >= q1 - threshold * iqr) & (data[column] <= q3 + threshold * iqr)]
-
-# Check if outliers should be excluded
-if exclude_outliers:
-    df = remove_outliers(df, 'price')
+# The same car is often cross-posted or reposted; keep one listing per car
+collapse_duplicates = st.sidebar.checkbox('Collapse Duplicate Listings', value=True)
+keep_rows = ~dataset.column('is_duplicate') if collapse_duplicates else None
 
-# Filter data based on user-selected price range
-filtered_data = df[(df['price'] >= min_price) & (df['price'] <= max_price)]
+# Build the per-segment price sketches once per process instead of on every rerun
+@st.cache_resource
+def build_price_summaries(file_path, version, collapse_duplicates, _dataset, _keep_rows):
+    '''Quantile sketches and moments of price for every filter segment.'''
+    rows = _dataset.select(mask=_keep_rows)
+    return SegmentSummaries(_dataset.frame(rows, segment_columns + ['price']), 'price', segment_columns)
+
+price_summaries = build_price_summaries(file_path, version, collapse_duplicates, dataset, keep_rows)
+
+# Function to exclude outliers based on the IQR method
+def remove_outliers(data, column, threshold=1.5, summaries=None, selections=None, ranges=None):
+    '''Exclude outliers in a specified column using the IQR method.
+    If the summaries cover the selection, the quartiles come from merging the
+    sketches of the selected segments instead of sorting the column.'''
+    if summaries is not None and summaries.covers(selections, ranges):
+        lower, upper = summaries.iqr_bounds(threshold, selections, ranges)
+    else:
+        # Filters finer than the summaries; data is already that selection
+        q1 = data[column].quantile(0.25)
+        q3 = data[column].quantile(0.75)
+        iqr = q3 - q1
+        lower, upper = q1 - threshold * iqr, q3 + threshold * iqr
+    return data[(data[column] >= lower) & (data[column] <= upper)]
 
 # Sidebar Filters
 st.sidebar.header('Filters')
 
 # Sidebar Filters
-make_filter = st.sidebar.multiselect('Make', df['make'].unique())
-model_filter = st.sidebar.multiselect('Model', df['model'].unique())
-title_filter = st.sidebar.multiselect('Title', df['title'].unique())
-condition_filter = st.sidebar.multiselect('Condition', df['condition'].unique())
-vehicle_type_filter = st.sidebar.multiselect('Vehicle Type', df['vehicle_type'].unique())
+make_filter = st.sidebar.multiselect('Make', dataset.labels('make'))
+model_filter = st.sidebar.multiselect('Model', dataset.labels('model'))
+title_filter = st.sidebar.multiselect('Title', dataset.labels('title'))
+condition_filter = st.sidebar.multiselect('Condition', dataset.labels('condition'))
+vehicle_type_filter = st.sidebar.multiselect('Vehicle Type', dataset.labels('vehicle_type'))
 
 # Year filter using a range slider
-min_year = int(df['year'].min())
-max_year = int(df['year'].max())
+min_year = int(np.nanmin(dataset.column('year')))
+max_year = int(np.nanmax(dataset.column('year')))
 year_filter = st.sidebar.slider('Year', min_year, max_year, (min_year, max_year))
 
-# Apply filters
-filtered_df = df[
-    (df['make'].isin(make_filter) if make_filter else pd.Series([True] * len(df))) &
-    (df['model'].isin(model_filter) if model_filter else pd.Series([True] * len(df))) &
-    (df['title'].isin(title_filter) if title_filter else pd.Series([True] * len(df))) &
-    (df['condition'].isin(condition_filter) if condition_filter else pd.Series([True] * len(df))) &
-    (df['vehicle_type'].isin(vehicle_type_filter) if vehicle_type_filter else pd.Series([True] * len(df))) &
-    (df['year'].between(year_filter[0], year_filter[1]))
-]
+# Apply filters: positions of the matching rows from the shared indexes;
+# only those rows are copied out for this rerun
+rows = dataset.select(
+    selections={
+        'make': make_filter, 'model': model_filter, 'title': title_filter,
+        'condition': condition_filter, 'vehicle_type': vehicle_type_filter
+    },
+    ranges={'year': year_filter},
+    mask=keep_rows
+)
+filtered_df = dataset.frame(rows)
+
+# Check if outliers should be excluded; the fences are those of the filtered subset
+if exclude_outliers:
+    filtered_df = remove_outliers(
+        filtered_df, 'price',
+        summaries=price_summaries,
+        selections={
+            'make': make_filter, 'model': model_filter, 'title': title_filter,
+            'condition': condition_filter, 'vehicle_type': vehicle_type_filter
+        },
+        ranges={'year': year_filter}
+    )
+
+# Key identifying the current filter selection, used by the per-filter caches below
+filter_state = (
+    tuple(make_filter), tuple(model_filter), tuple(title_filter), tuple(condition_filter),
+    tuple(vehicle_type_filter), tuple(year_filter), exclude_outliers, collapse_duplicates
+)
+
+# Log of mileage, computed once at load and shared by the plot, regression and residuals
+log_odometer = filtered_df['log_odometer']
+
+# NumPy-only fit: coefficients, p-values, R² and correlation in one pass.
+# Shared by the chart and the regression summary below.
+model = simple_ols(log_odometer, filtered_df['price'])
 
 # Scatter plot of price vs log(mileage)
 st.header('Price vs Log(Mileage) with Regression Line')
-fig, ax = plt.subplots()
-sns.regplot(
-    x=np.log1p(filtered_df['odometer']), 
-    y=filtered_df['price'], 
-    ax=ax, 
-    scatter_kws={'alpha': 0.5}, 
-    line_kws={'color': 'red'}
-)
-ax.set_xlabel('Log(Odometer)')
-ax.set_ylabel('Price')
-ax.set_title('Scatter Plot with OLS Regression Line')
-st.pyplot(fig)
+
+# The static chart is rendered once per data version and filter state and served from
+# cache as PNG bytes. Its 95% band is the closed-form OLS interval rather than a bootstrap.
+@st.cache_data(max_entries=64)
+def render_regplot(version, filter_state, _x, _y, _fit):
+    '''PNG of the scatter, the OLS line and its 95% confidence band.'''
+    fig, ax = plt.subplots()
+    ax.scatter(_x, _y, alpha=0.5, s=12)
+    grid = np.linspace(_fit.x_min, _fit.x_max, BAND_POINTS)
+    lower, upper = _fit.confidence_band(grid)
+    ax.fill_between(grid, lower, upper, color='red', alpha=0.15)
+    ax.plot(grid, _fit.predict(grid), color='red')
+    ax.set_xlabel('Log(Odometer)')
+    ax.set_ylabel('Price')
+    ax.set_title('Scatter Plot with OLS Regression Line')
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+chart_type = st.radio('Chart Type', ['Static', 'Interactive'], horizontal=True)
+if len(filtered_df) < 3:
+    st.warning('Not enough listings for a regression with the current filters.')
+elif chart_type == 'Static':
+    st.image(render_regplot(version, filter_state, log_odometer, filtered_df['price'], model))
+else:
+    # Vector chart: points (or a density image for large selections) plus the same line and band
+    plot_df = pd.DataFrame({'log_odometer': log_odometer, 'price': filtered_df['price']})
+    fig = aggregated_scatter(plot_df, 'log_odometer', 'price', opacity=0.5,
+                             labels={'log_odometer': 'Log(Odometer)', 'price': 'Price'},
+                             title='Scatter Plot with OLS Regression Line')
+    fig.add_traces(trendline_traces(model, band=True))
+    st.plotly_chart(compact_figure(fig))
 
 # Regression Analysis Summary
-X = sm.add_constant(np.log1p(filtered_df['odometer']))
-model = sm.OLS(filtered_df['price'], X).fit()
-coef_significance = model.pvalues.iloc[1] < 0.05 
-corr_coef = np.corrcoef(np.log1p(filtered_df['odometer']), filtered_df['price'])[0, 1]
+coef_significance = model.pvalues[1] < 0.05 
+corr_coef = model.corr
 
 # print regression summary statistics and correlation
 st.markdown(f'**Correlation Coefficient**: {corr_coef:.2f}')
 st.markdown(f'**R²**: {model.rsquared:.2f}')
 st.markdown(f'**Number of Observations**: {len(filtered_df)}')
-st.markdown(f'**Coefficient Interpretation**: A 1% increase in mileage results in a {model.params.iloc[1]:.2f} change in price.')
+st.markdown(f'**Coefficient Interpretation**: A 1% increase in mileage results in a {model.params[1]:.2f} change in price.')
 st.markdown(f'**Statistical Significance at \u03B1 = 0.05**: {'Yes' if coef_significance else 'No'}')
 
-# Calculate residuals for the choropleth
-# want to use Johns residuals, this should be explained in the app.
-# filtered_df['predicted_price'] = model.predict(X)
-# filtered_df['residual'] = filtered_df['price'] - filtered_df['predicted_price']
+# The full statsmodels table is only imported and built when asked for
+if st.checkbox('Show full regression summary'):
+    import statsmodels.api as sm
+    st.text(sm.OLS(filtered_df['price'], sm.add_constant(log_odometer)).fit().summary())
+
+# Bootstrap confidence intervals, so small segments show how reliable the slope is
+@st.cache_resource
+def get_bootstrap_service():
+    '''One bootstrap service (and its per-version, per-filter cache) shared by all sessions.'''
+    return BootstrapService()
+
+example_miles = np.array([50_000, 100_000, 150_000])
+boot = get_bootstrap_service().confidence_intervals(
+    log_odometer, filtered_df['price'],
+    x_new=np.log1p(example_miles), key=(version, filter_state)
+)
+st.markdown(
+    f'**95% Bootstrap CI for the Mileage Coefficient**: '
+    f'{boot['slope'][0]:.2f} to {boot['slope'][1]:.2f} ({boot['n_resamples']} resamples)'
+)
+st.dataframe(pd.DataFrame({
+    'Odometer': example_miles,
+    'Predicted Price': model.params[0] + model.params[1] * np.log1p(example_miles),
+    'CI Lower': boot['prediction_lower'],
+    'CI Upper': boot['prediction_upper']
+}).round(0))
+
+# Calculate residuals for the choropleth from the model shown above.
+# The stored 'residual' column comes from a different model, so the map would not
+# match the regression on screen. Predictions reuse the fitted coefficients in one
+# vectorized pass, which is cheaper than hashing and copying a cached result.
+predicted_price = model.params[0] + model.params[1] * log_odometer.to_numpy()
+residual = filtered_df['price'].to_numpy() - predicted_price
+filtered_df = filtered_df.assign(predicted_price=predicted_price, residual=residual)
 
 # Choropleth of Residuals
 st.header('Geographic Distribution')
@@ -117,20 +233,46 @@ st.header('Geographic Distribution')
 if 'latitude' in filtered_df.columns and 'longitude' in filtered_df.columns:
     # Remove any rows where lat/lon is null
     geo_df = filtered_df.dropna(subset=['latitude', 'longitude'])
-    
-    fig = px.scatter_mapbox(
-        geo_df,
-        lat='latitude',
-        lon='longitude',
-        color='residual',
-        color_continuous_scale='RdBu',
-        zoom=4,
-        center={'lat': 46.8797, 'lon': -110.3626},  # Center of Montana
-        mapbox_style='carto-positron',  # Use a free mapbox style
-        title='Geographic Distribution of Prices and Residuals',
-        hover_data=['make', 'model', 'year', 'price']  # Add hover information
-    )
-    st.plotly_chart(fig)
+
+    # Listings are drawn as clusters of the chosen zoom level; single listings only when fully zoomed in
+    @st.cache_resource(max_entries=64)
+    def get_cluster_pyramid(version, filter_state, _geo_df):
+        '''Cluster pyramid of price and residual for the current data version and filters.'''
+        return ClusterPyramid(_geo_df, value_columns=('price', 'residual'))
+
+    pyramid = get_cluster_pyramid(version, filter_state, geo_df)
+    map_zoom = st.slider('Map Zoom', 4, MAX_ZOOM, 4)
+    map_location = st.selectbox('Center Map On', ['Montana'] + sorted(geo_df['location'].dropna().astype(str).unique()))
+    if map_location == 'Montana':
+        map_center = {'lat': 46.8797, 'lon': -110.3626}  # Center of Montana
+    else:
+        in_location = geo_df[geo_df['location'].astype(str) == map_location]
+        map_center = {'lat': in_location['latitude'].mean(), 'lon': in_location['longitude'].mean()}
+    map_bounds = viewport_bounds(map_center, map_zoom)
+
+    if pyramid.is_point_level(map_zoom):
+        fig = px.scatter_mapbox(
+            pyramid.clusters(map_zoom, map_bounds),
+            lat='latitude',
+            lon='longitude',
+            color='residual',
+            color_continuous_scale='RdBu',
+            zoom=map_zoom,
+            center=map_center,
+            mapbox_style='carto-positron',  # Use a free mapbox style
+            title='Geographic Distribution of Prices and Residuals',
+            hover_data=['make', 'model', 'year', 'price']  # Add hover information
+        )
+        apply_basemap(fig)
+    else:
+        fig = cluster_map(
+            pyramid.clusters(map_zoom, map_bounds), color='mean_residual', zoom=map_zoom,
+            center=map_center, colorscale='RdBu',
+            title='Geographic Distribution of Prices and Residuals'
+        )
+    st.caption('Residuals are actual minus predicted price from the regression above, for the current filters. '
+               'Markers are clusters of listings sized by count; raise the zoom to see individual listings.')
+    st.plotly_chart(compact_figure(fig))
 else:
     st.warning('Geographic data (latitude/longitude) not found in dataset.')
 
@@ -151,6 +293,8 @@ if st.button('Run Model'):
         st.error('Please select at least one categorical variable.')
     else:
         try:
+            import statsmodels.api as sm
+
             # Create design matrix
             X_custom = pd.DataFrame({'log_odometer': np.log1p(filtered_df['odometer'])})
             
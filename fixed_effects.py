@@ -0,0 +1,120 @@
+# Hedonic regression with high-dimensional fixed effects.
+# Instead of building a dummy column for every make, model or location, the fixed
+# effects are absorbed by repeatedly demeaning the outcome and the regressors within
+# each grouping (alternating projections / method of alternating projections).
+# Only integer group codes and a few float columns are kept, so memory is linear
+# in the number of rows no matter how many levels the fixed effects have.
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def _group_means(values, codes, n_groups, counts):
+    '''Mean of every column of values within each group, broadcast back to rows.'''
+    sums = np.column_stack([
+        np.bincount(codes, weights=values[:, j], minlength=n_groups)
+        for j in range(values.shape[1])
+    ])
+    return (sums / counts[:, None])[codes]
+
+
+def absorb(values, group_codes, tol=1e-8, max_iter=1000):
+    '''Remove the fixed effects given by group_codes from every column of values.
+
+    group_codes is a list of integer code arrays, one per fixed effect. With a single
+    fixed effect one pass is exact; with several, the demeaning is repeated until the
+    columns stop changing (alternating projections).
+    '''
+    values = np.array(values, dtype=float, copy=True)
+    if values.ndim == 1:
+        values = values[:, None]
+    groups = []
+    for codes in group_codes:
+        n_groups = codes.max() + 1
+        groups.append((codes, n_groups, np.bincount(codes, minlength=n_groups).astype(float)))
+
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        previous = values.copy() if len(groups) > 1 else None
+        for codes, n_groups, counts in groups:
+            values -= _group_means(values, codes, n_groups, counts)
+        if previous is None:
+            break
+        change = np.abs(values - previous).max()
+        scale = max(np.abs(values).max(), 1.0)
+        if change <= tol * scale:
+            break
+    return values, iterations
+
+
+def fe_regression(data, y, x, fe, cluster=None, tol=1e-8, max_iter=1000):
+    '''Regress y on the columns x, absorbing the fixed effects in fe.
+
+    Parameters: data is a DataFrame, y a column name, x a list of regressor columns,
+    fe a list of categorical columns to absorb (e.g. ['make', 'location']) and
+    cluster an optional column for cluster-robust standard errors.
+    Returns a dict with a coefficient table and fit statistics.
+    '''
+    x = [x] if isinstance(x, str) else list(x)
+    fe = [fe] if isinstance(fe, str) else list(fe)
+    columns = [y] + x + fe + ([cluster] if cluster and cluster not in fe else [])
+    data = data[columns].dropna()
+
+    group_codes = [pd.factorize(data[col])[0] for col in fe]
+    values = data[[y] + x].to_numpy(dtype=float)
+    demeaned, iterations = absorb(values, group_codes, tol=tol, max_iter=max_iter)
+    y_tilde, X_tilde = demeaned[:, 0], demeaned[:, 1:]
+
+    n, k = X_tilde.shape
+    xtx_inv = np.linalg.pinv(X_tilde.T @ X_tilde)
+    coef = xtx_inv @ (X_tilde.T @ y_tilde)
+    resid = y_tilde - X_tilde @ coef
+
+    # Degrees of freedom used by the absorbed effects (exact for one fixed effect)
+    absorbed = sum(codes.max() + 1 for codes in group_codes) - max(len(group_codes) - 1, 0)
+    df_resid = n - k - absorbed
+
+    if cluster:
+        cluster_codes = pd.factorize(data[cluster])[0]
+        n_clusters = cluster_codes.max() + 1
+        scores = X_tilde * resid[:, None]
+        cluster_scores = np.column_stack([
+            np.bincount(cluster_codes, weights=scores[:, j], minlength=n_clusters)
+            for j in range(k)
+        ])
+        meat = cluster_scores.T @ cluster_scores
+        # Small-sample correction counting the absorbed effects as parameters, as
+        # statsmodels does for the same model fitted with dummy columns
+        correction = n_clusters / (n_clusters - 1) * (n - 1) / df_resid
+        cov = correction * xtx_inv @ meat @ xtx_inv
+        df_t = n_clusters - 1
+    else:
+        sigma2 = resid @ resid / df_resid
+        cov = sigma2 * xtx_inv
+        n_clusters = None
+        df_t = df_resid
+
+    se = np.sqrt(np.diag(cov))
+    t_values = coef / se
+    p_values = 2 * stats.t.sf(np.abs(t_values), df_t)
+
+    # Within R² is the share of the demeaned variation explained by the regressors
+    within_r2 = 1 - resid @ resid / (y_tilde @ y_tilde)
+
+    table = pd.DataFrame({
+        'Coefficient': coef,
+        'Standard Error': se,
+        't': t_values,
+        'P>|t|': p_values,
+    }, index=x)
+
+    return {
+        'table': table,
+        'nobs': n,
+        'within_r2': within_r2,
+        'df_resid': df_resid,
+        'n_clusters': n_clusters,
+        'fixed_effects': {col: int(codes.max() + 1) for col, codes in zip(fe, group_codes)},
+        'iterations': iterations,
+    }
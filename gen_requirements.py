@@ -12,7 +12,6 @@ packages = [
     "pandas",
     "numpy",
     "matplotlib",
-    "seaborn",
     "statsmodels",
     "plotly"
 ]
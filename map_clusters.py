@@ -0,0 +1,127 @@
+# Zoom-level cluster pyramid for the listing maps.
+# Many listings share the same coordinates (Craigslist gives a town, not an address),
+# so drawing every listing is both heavy and overplotted. The pyramid bins listings
+# on a Web Mercator pixel grid once per zoom level and keeps the count, centroid and
+# mean price / residual of every cell. The map then asks for the cells of its current
+# zoom inside the current viewport; individual listings are only drawn at the highest
+# zoom.
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+from basemap_tiles import basemap_layout
+
+TILE_SIZE = 512   # pixels per world tile at zoom 0 (mapbox-gl convention)
+CELL_PIXELS = 48  # cluster cell size on screen
+MAX_ZOOM = 11     # from this zoom on, individual listings are shown
+
+
+def mercator_pixels(lat, lon, zoom):
+    '''Web Mercator pixel coordinates of (lat, lon) at a zoom level.'''
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    lon = np.asarray(lon, dtype=float)
+    world = TILE_SIZE * 2.0 ** zoom
+    x = (lon + 180) / 360 * world
+    sin_lat = np.sin(np.radians(lat))
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * world
+    return x, y
+
+
+def viewport_bounds(center, zoom, width=700, height=500):
+    '''(lon_min, lat_min, lon_max, lat_max) of a map of width x height pixels.'''
+    cx, cy = mercator_pixels(center['lat'], center['lon'], zoom)
+    world = TILE_SIZE * 2.0 ** zoom
+    lon_min = (cx - width / 2) / world * 360 - 180
+    lon_max = (cx + width / 2) / world * 360 - 180
+    lats = []
+    for y in (cy + height / 2, cy - height / 2):
+        n = np.pi - 2 * np.pi * y / world
+        lats.append(np.degrees(np.arctan(np.sinh(n))))
+    return lon_min, lats[0], lon_max, lats[1]
+
+
+def view_from_relayout(relayout_data, zoom, center):
+    '''(zoom, center, bounds) after a Plotly mapbox relayout event.
+
+    Falls back to the given zoom / center when the event does not carry them;
+    bounds is None when the map did not report its visible corners.
+    '''
+    relayout_data = relayout_data or {}
+    zoom = relayout_data.get('mapbox.zoom', zoom)
+    center = relayout_data.get('mapbox.center', center)
+    corners = (relayout_data.get('mapbox._derived') or {}).get('coordinates')
+    bounds = None
+    if corners:
+        lons, lats = zip(*corners)
+        bounds = (min(lons), min(lats), max(lons), max(lats))
+    return zoom, center, bounds
+
+
+class ClusterPyramid:
+    '''Per-zoom grid clusters of listings with count and mean values.'''
+
+    def __init__(self, data, value_columns=('price', 'residual'), lat='latitude', lon='longitude',
+                 max_zoom=MAX_ZOOM, cell_pixels=CELL_PIXELS):
+        self.lat, self.lon = lat, lon
+        self.max_zoom = max_zoom
+        self.value_columns = [col for col in value_columns if col in data.columns]
+        self.points = data.dropna(subset=[lat, lon])
+
+        self.levels = {}
+        for zoom in range(max_zoom):
+            x, y = mercator_pixels(self.points[lat], self.points[lon], zoom)
+            cells = pd.DataFrame({
+                'cell_x': (x // cell_pixels).astype(np.int64),
+                'cell_y': (y // cell_pixels).astype(np.int64),
+                'latitude': self.points[lat].to_numpy(),
+                'longitude': self.points[lon].to_numpy(),
+            })
+            for col in self.value_columns:
+                cells[col] = self.points[col].to_numpy()
+            grouped = cells.groupby(['cell_x', 'cell_y'])
+            level = grouped[['latitude', 'longitude']].mean()
+            level['count'] = grouped.size()
+            for col in self.value_columns:
+                level['mean_' + col] = grouped[col].mean()
+            self.levels[zoom] = level.reset_index()
+
+    def clusters(self, zoom, bounds=None):
+        '''Clusters of the level for zoom inside bounds, or the listings at the highest zoom.'''
+        level = int(np.clip(np.floor(zoom), 0, self.max_zoom))
+        if level >= self.max_zoom:
+            table, lat, lon = self.points, self.lat, self.lon
+        else:
+            table, lat, lon = self.levels[level], 'latitude', 'longitude'
+        if bounds is not None:
+            lon_min, lat_min, lon_max, lat_max = bounds
+            inside = table[lon].between(lon_min, lon_max) & table[lat].between(lat_min, lat_max)
+            table = table[inside]
+        return table
+
+    def is_point_level(self, zoom):
+        return np.floor(zoom) >= self.max_zoom
+
+
+def cluster_map(clusters, color='mean_price', zoom=6, center=None, title=None, height=500,
+                colorscale='Viridis'):
+    '''Scattermapbox of clusters; marker area grows with the listing count.'''
+    counts = clusters['count'].to_numpy()
+    size = 6 + 4 * np.sqrt(counts)
+    hover = 'Listings: ' + clusters['count'].map('{:,}'.format)
+    for col in clusters.columns:
+        if col.startswith('mean_'):
+            hover = hover + f'<br>Mean {col[5:]}: ' + clusters[col].map('{:,.0f}'.format)
+    fig = go.Figure(go.Scattermapbox(
+        lat=clusters['latitude'], lon=clusters['longitude'], mode='markers',
+        marker=dict(size=np.minimum(size, 40), color=clusters[color], colorscale=colorscale,
+                    showscale=True, colorbar=dict(title=color.replace('_', ' ').title())),
+        text=hover,
+        hoverinfo='text',
+    ))
+    fig.update_layout(
+        title=title, height=height,
+        mapbox=dict(zoom=zoom, center=center, **basemap_layout()),
+        margin=dict(l=0, r=0, t=40 if title else 0, b=0),
+    )
+    return fig
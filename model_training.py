@@ -0,0 +1,115 @@
+# Cross-validated model training for the custom regression section.
+# Runs k-fold CV for OLS and for Ridge and Lasso over a regularization path.
+# Folds are fitted in parallel across cores. Within a fold the Ridge path comes
+# from a single SVD and the Lasso path is walked from the largest alpha down with
+# warm starts, so each step starts from the previous solution.
+
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from sklearn.model_selection import KFold
+
+
+def _standardize(X_train, X_test):
+    mean = X_train.mean(axis=0)
+    scale = X_train.std(axis=0)
+    scale[scale == 0] = 1.0
+    return (X_train - mean) / scale, (X_test - mean) / scale
+
+
+def _fit_fold(X, y, train_idx, test_idx, ridge_alphas, lasso_alphas):
+    '''Out-of-fold predictions for OLS and every alpha on both paths.'''
+    X_train, X_test = _standardize(X[train_idx], X[test_idx])
+    y_train = y[train_idx]
+    y_mean = y_train.mean()
+    yc = y_train - y_mean
+    predictions = {}
+
+    ols = LinearRegression().fit(X_train, y_train)
+    predictions[('OLS', 0.0)] = ols.predict(X_test)
+
+    # Ridge: one SVD gives the solution for every alpha
+    U, s, Vt = np.linalg.svd(X_train, full_matrices=False)
+    Uty = U.T @ yc
+    for alpha in ridge_alphas:
+        coef = Vt.T @ (s / (s ** 2 + alpha) * Uty)
+        predictions[('Ridge', alpha)] = X_test @ coef + y_mean
+
+    # Lasso: walk from the largest alpha down, starting each fit from the last one
+    lasso = Lasso(warm_start=True, max_iter=5000)
+    for alpha in sorted(lasso_alphas, reverse=True):
+        lasso.set_params(alpha=alpha)
+        lasso.fit(X_train, y_train)
+        predictions[('Lasso', alpha)] = lasso.predict(X_test)
+
+    return test_idx, predictions
+
+
+def cross_validate_models(X, y, n_splits=5, n_alphas=20, n_jobs=-1, random_state=42):
+    '''Run k-fold CV for OLS, Ridge and Lasso and pick the model with the lowest CV MSE.
+
+    Returns a dict with the CV results table, the chosen model (refit on all rows),
+    the out-of-fold predictions of the chosen model and the elapsed time.
+    '''
+    start = time.perf_counter()
+    feature_names = list(X.columns) if isinstance(X, pd.DataFrame) else None
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(X)
+
+    # Alpha grids; the Lasso grid starts where every coefficient is zero
+    Xs, _ = _standardize(X, X)
+    ridge_alphas = n * np.logspace(-4, 1, n_alphas)
+    alpha_max = max(np.abs(Xs.T @ (y - y.mean())).max() / n, 1e-12)
+    lasso_alphas = alpha_max * np.logspace(0, -3, n_alphas)
+
+    folds = KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X)
+    fold_results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_fold)(X, y, train_idx, test_idx, ridge_alphas, lasso_alphas)
+        for train_idx, test_idx in folds
+    )
+
+    # Collect out-of-fold predictions per candidate and score them
+    candidates = list(fold_results[0][1].keys())
+    oof = {candidate: np.empty(n) for candidate in candidates}
+    fold_mse = {candidate: [] for candidate in candidates}
+    for test_idx, predictions in fold_results:
+        for candidate, pred in predictions.items():
+            oof[candidate][test_idx] = pred
+            fold_mse[candidate].append(np.mean((y[test_idx] - pred) ** 2))
+
+    results = pd.DataFrame([
+        {'model': name, 'alpha': alpha,
+         'cv_mse': np.mean(fold_mse[(name, alpha)]),
+         'cv_mse_std': np.std(fold_mse[(name, alpha)])}
+        for name, alpha in candidates
+    ]).sort_values('cv_mse').reset_index(drop=True)
+
+    best_name, best_alpha = results.loc[0, 'model'], results.loc[0, 'alpha']
+    mean, scale = X.mean(axis=0), X.std(axis=0)
+    scale[scale == 0] = 1.0
+    if best_name == 'OLS':
+        estimator = LinearRegression()
+    elif best_name == 'Ridge':
+        estimator = Ridge(alpha=best_alpha)
+    else:
+        estimator = Lasso(alpha=best_alpha, max_iter=5000)
+    estimator.fit((X - mean) / scale, y)
+
+    # Coefficients on the original feature scale
+    coef = estimator.coef_ / scale
+    intercept = estimator.intercept_ - (coef * mean).sum()
+
+    return {
+        'results': results,
+        'best_model': best_name,
+        'best_alpha': best_alpha,
+        'estimator': estimator,
+        'coefficients': pd.Series(coef, index=feature_names),
+        'intercept': intercept,
+        'oof_predictions': oof[(best_name, best_alpha)],
+        'elapsed': time.perf_counter() - start,
+    }
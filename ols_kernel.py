@@ -0,0 +1,169 @@
+# Small NumPy-only statistics kernel for the two-parameter price ~ log(mileage) fit.
+# The dashboards only need the intercept, slope and a handful of fit statistics,
+# so importing statsmodels and building a design matrix on every callback is
+# unnecessary. Everything here comes from five sums over the two arrays.
+# statsmodels is still used where the full summary() table is shown.
+
+import math
+
+import numpy as np
+
+
+# ===== STUDENT t DISTRIBUTION ===== #
+def _betacf(a, b, x, max_iter=200, eps=3e-16):
+    '''Continued fraction for the regularized incomplete beta function (Lentz's method).'''
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < eps:
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    '''Regularized incomplete beta function I_x(a, b).'''
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    log_front = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                 + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return math.exp(log_front) * _betacf(a, b, x) / a
+    return 1.0 - math.exp(log_front) * _betacf(b, a, 1.0 - x) / b
+
+
+def t_two_sided_pvalue(t, df):
+    '''Two-sided p-value of a t statistic with df degrees of freedom.'''
+    if df <= 0 or not np.isfinite(t):
+        return 0.0 if np.isinf(t) else np.nan
+    return _betainc(df / 2.0, 0.5, df / (df + t * t))
+
+
+def t_quantile(level, df):
+    '''Two-sided critical value: the t with P(|T| > t) = 1 - level, by bisection.'''
+    if df <= 0:
+        return np.nan
+    alpha = 1.0 - level
+    lo, hi = 0.0, 1.0
+    while t_two_sided_pvalue(hi, df) > alpha:
+        hi *= 2.0
+    for _ in range(100):
+        mid = (lo + hi) / 2.0
+        if t_two_sided_pvalue(mid, df) > alpha:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo < 1e-10 * hi:
+            break
+    return (lo + hi) / 2.0
+
+
+# ===== SIMPLE OLS ===== #
+class OLSResult:
+    '''Fit statistics of y = b0 + b1 * x, named like statsmodels results.'''
+
+    def __init__(self, params, bse, tvalues, pvalues, rsquared, rsquared_adj,
+                 fvalue, f_pvalue, nobs, corr, resid_std, x_mean=np.nan, sxx=np.nan,
+                 x_min=np.nan, x_max=np.nan):
+        self.params = params
+        self.bse = bse
+        self.tvalues = tvalues
+        self.pvalues = pvalues
+        self.rsquared = rsquared
+        self.rsquared_adj = rsquared_adj
+        self.fvalue = fvalue
+        self.f_pvalue = f_pvalue
+        self.nobs = nobs
+        self.corr = corr
+        self.resid_std = resid_std
+        # Summary of x, for confidence bands and trendline end points
+        self.x_mean = x_mean
+        self.sxx = sxx
+        self.x_min = x_min
+        self.x_max = x_max
+
+    @property
+    def intercept(self):
+        return self.params[0]
+
+    @property
+    def slope(self):
+        return self.params[1]
+
+    def predict(self, x):
+        return self.params[0] + self.params[1] * np.asarray(x, dtype=float)
+
+    def confidence_band(self, x, level=0.95):
+        '''(lower, upper) confidence interval of the mean prediction at x.'''
+        x = np.asarray(x, dtype=float)
+        df_resid = self.nobs - 2
+        se = self.resid_std * np.sqrt(1.0 / self.nobs + (x - self.x_mean) ** 2 / self.sxx)
+        half_width = t_quantile(level, df_resid) * se
+        fitted = self.predict(x)
+        return fitted - half_width, fitted + half_width
+
+
+def simple_ols(x, y):
+    '''Fit y on x with an intercept and return an OLSResult.
+
+    Coefficients, standard errors, t and p-values, R², adjusted R², F and the
+    correlation all come from the sums below; values are shifted by their first
+    element so the sums of squares stay accurate for large prices.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n < 3:
+        nan2 = np.full(2, np.nan)
+        return OLSResult(nan2, nan2, nan2, nan2, np.nan, np.nan, np.nan, np.nan, n, np.nan, np.nan)
+
+    dx = x - x[0]
+    dy = y - y[0]
+    sx, sy = dx.sum(), dy.sum()
+    sxx = dx @ dx - sx * sx / n
+    syy = dy @ dy - sy * sy / n
+    sxy = dx @ dy - sx * sy / n
+    x_mean, y_mean = x[0] + sx / n, y[0] + sy / n
+
+    slope = sxy / sxx if sxx > 0 else np.nan
+    intercept = y_mean - slope * x_mean
+
+    df_resid = n - 2
+    ssr = max(syy - slope * sxy, 0.0)
+    sigma2 = ssr / df_resid
+    se_slope = math.sqrt(sigma2 / sxx) if sxx > 0 else np.nan
+    se_intercept = math.sqrt(sigma2 * (1.0 / n + x_mean * x_mean / sxx)) if sxx > 0 else np.nan
+
+    rsquared = 1.0 - ssr / syy if syy > 0 else np.nan
+    rsquared_adj = 1.0 - (1.0 - rsquared) * (n - 1) / df_resid
+    corr = sxy / math.sqrt(sxx * syy) if sxx > 0 and syy > 0 else np.nan
+
+    params = np.array([intercept, slope])
+    bse = np.array([se_intercept, se_slope])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tvalues = params / bse
+    pvalues = np.array([t_two_sided_pvalue(t, df_resid) for t in tvalues])
+
+    # With one regressor, F is the squared t statistic of the slope
+    fvalue = tvalues[1] ** 2
+    return OLSResult(params, bse, tvalues, pvalues, rsquared, rsquared_adj,
+                     fvalue, pvalues[1], n, corr, math.sqrt(sigma2),
+                     x_mean=x_mean, sxx=sxx, x_min=x.min(), x_max=x.max())
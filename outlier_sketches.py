@@ -0,0 +1,209 @@
+# Mergeable price summaries for outlier exclusion.
+# The dashboards used to call quantile(0.25) / quantile(0.75) (or mean / std) on the
+# full price column every time a widget changed, which sorts every row on every rerun.
+# Here we build one small quantile sketch and one moment summary per segment
+# (e.g. make/model/year) when the data is loaded. The IQR or std dev cut-offs for
+# any filtered subset then come from merging the sketches of the selected segments.
+
+import numpy as np
+import pandas as pd
+
+
+# ===== QUANTILE SKETCH ===== #
+def _compact(values, weights, k):
+    '''Shrink sorted (value, weight) pairs down to about k items (KLL-style compaction).'''
+    if len(values) <= k:
+        return values, weights
+    # Keep every stride-th item and give it the weight of the items it replaces
+    cum_weight = np.cumsum(weights)
+    total = cum_weight[-1]
+    targets = (np.arange(k) + 0.5) * (total / k)
+    idx = np.searchsorted(cum_weight, targets, side='left')
+    idx = np.minimum(idx, len(values) - 1)
+    return values[idx], np.full(k, total / k)
+
+
+def weighted_quantile(values, weights, q):
+    '''Quantile of sorted weighted values, using linear interpolation like pandas.'''
+    if len(values) == 0:
+        return np.nan
+    cum_weight = np.cumsum(weights)
+    total = cum_weight[-1]
+    # Center rank of each item; with unit weights this is just 0, 1, ..., n-1
+    centers = cum_weight - weights + (weights - 1) / 2
+    return float(np.interp(q * (total - 1), centers, values))
+
+
+class QuantileSketch:
+    '''Fixed-size quantile sketch that can be merged with other sketches.'''
+
+    def __init__(self, values=None, weights=None, k=128):
+        self.k = k
+        self.values = np.empty(0) if values is None else np.asarray(values, dtype=float)
+        self.weights = np.ones(len(self.values)) if weights is None else np.asarray(weights, dtype=float)
+
+    @classmethod
+    def from_values(cls, values, k=128):
+        values = np.sort(np.asarray(values, dtype=float))
+        values = values[~np.isnan(values)]
+        values, weights = _compact(values, np.ones(len(values)), k)
+        return cls(values, weights, k)
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def merge(self, other):
+        '''Return a new sketch summarizing both inputs.'''
+        values = np.concatenate([self.values, other.values])
+        weights = np.concatenate([self.weights, other.weights])
+        order = np.argsort(values, kind='stable')
+        values, weights = _compact(values[order], weights[order], max(self.k, other.k))
+        return QuantileSketch(values, weights, max(self.k, other.k))
+
+    def quantile(self, q):
+        return weighted_quantile(self.values, self.weights, q)
+
+
+# ===== MOMENT SUMMARY ===== #
+class Moments:
+    '''Count, mean and sum of squared deviations; merges exactly (Chan et al.).'''
+
+    def __init__(self, n=0.0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_values(cls, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls()
+        mean = values.mean()
+        return cls(float(len(values)), float(mean), float(((values - mean) ** 2).sum()))
+
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return Moments()
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.n / n
+        m2 = self.m2 + other.m2 + delta ** 2 * self.n * other.n / n
+        return Moments(n, mean, m2)
+
+    @property
+    def std(self):
+        '''Sample standard deviation (ddof=1), matching pandas Series.std().'''
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+
+
+# ===== PER-SEGMENT SUMMARIES ===== #
+class SegmentSummaries:
+    '''Quantile sketches and moments of one column for every segment of a DataFrame.
+
+    All sketch items are pooled into one array that is sorted by value once at build
+    time. Merging the sketches of any set of segments is then a boolean mask over the
+    pool, which keeps it sorted, so a quantile is a cumsum and an interpolation.
+    '''
+
+    def __init__(self, data, column, segment_columns, k=128):
+        self.column = column
+        self.segment_columns = list(segment_columns)
+
+        values = pd.to_numeric(data[column], errors='coerce')
+        keep = values.notna()
+        values = values[keep].to_numpy(dtype=float)
+        if self.segment_columns:
+            groups = data.loc[keep, self.segment_columns].groupby(
+                self.segment_columns, dropna=False, sort=False
+            )
+            seg_ids = groups.ngroup().to_numpy()
+            self.segments = groups.size().reset_index()[self.segment_columns]
+        else:
+            seg_ids = np.zeros(len(values), dtype=np.int64)
+            self.segments = pd.DataFrame(index=[0])
+        n_segments = len(self.segments)
+
+        # Moments per segment, vectorized with bincount
+        self.n = np.bincount(seg_ids, minlength=n_segments).astype(float)
+        sums = np.bincount(seg_ids, weights=values, minlength=n_segments)
+        self.mean = np.divide(sums, self.n, out=np.zeros(n_segments), where=self.n > 0)
+        self.m2 = np.bincount(seg_ids, weights=(values - self.mean[seg_ids]) ** 2, minlength=n_segments)
+
+        # Sketch per segment. Segments of at most k values are kept exactly and go into
+        # the pool all at once; only the larger ones are compacted one by one
+        order = np.lexsort((values, seg_ids))
+        sorted_values = values[order]
+        sorted_segments = seg_ids[order]
+        bounds = np.searchsorted(sorted_segments, np.arange(n_segments + 1))
+        sizes = np.diff(bounds)
+        exact = sizes[sorted_segments] <= k
+        pool_values = [sorted_values[exact]]
+        pool_weights = [np.ones(int(exact.sum()))]
+        pool_segments = [sorted_segments[exact]]
+        for seg in np.flatnonzero(sizes > k):
+            seg_values = sorted_values[bounds[seg]:bounds[seg + 1]]
+            seg_values, seg_weights = _compact(seg_values, np.ones(len(seg_values)), k)
+            pool_values.append(seg_values)
+            pool_weights.append(seg_weights)
+            pool_segments.append(np.full(len(seg_values), seg))
+        pool_values = np.concatenate(pool_values)
+        pool_order = np.argsort(pool_values, kind='stable')
+        self.pool_values = pool_values[pool_order]
+        self.pool_weights = np.concatenate(pool_weights)[pool_order]
+        self.pool_segments = np.concatenate(pool_segments)[pool_order]
+
+    def state(self):
+        '''The summaries as arrays plus the small segment table, e.g. to publish them.'''
+        return dict(vars(self))
+
+    @classmethod
+    def from_state(cls, state):
+        '''SegmentSummaries from state(), without touching the data again.'''
+        summaries = cls.__new__(cls)
+        summaries.__dict__.update(state)
+        return summaries
+
+    def covers(self, selections=None, ranges=None):
+        '''True when every active filter is on a segment column, so the summaries can answer it.'''
+        active = [col for col, allowed in (selections or {}).items() if allowed]
+        active += list(ranges or {})
+        return all(col in self.segment_columns for col in active)
+
+    def segment_mask(self, selections=None, ranges=None):
+        '''Boolean mask over segments for {column: allowed values} and {column: (low, high)}.'''
+        mask = np.ones(len(self.segments), dtype=bool)
+        for col, allowed in (selections or {}).items():
+            if allowed:
+                mask &= self.segments[col].isin(list(allowed)).to_numpy()
+        for col, (low, high) in (ranges or {}).items():
+            mask &= self.segments[col].between(low, high).to_numpy()
+        return mask
+
+    def sketch(self, selections=None, ranges=None):
+        '''Merged quantile sketch of the selected segments.'''
+        keep = self.segment_mask(selections, ranges)[self.pool_segments]
+        return QuantileSketch(self.pool_values[keep], self.pool_weights[keep])
+
+    def moments(self, selections=None, ranges=None):
+        '''Merged moments of the selected segments.'''
+        mask = self.segment_mask(selections, ranges)
+        n = self.n[mask].sum()
+        if n == 0:
+            return Moments()
+        mean = (self.n[mask] * self.mean[mask]).sum() / n
+        m2 = (self.m2[mask] + self.n[mask] * (self.mean[mask] - mean) ** 2).sum()
+        return Moments(float(n), float(mean), float(m2))
+
+    def iqr_bounds(self, threshold=1.5, selections=None, ranges=None):
+        '''Lower and upper IQR fences for the selected segments.'''
+        sketch = self.sketch(selections, ranges)
+        q1, q3 = sketch.quantile(0.25), sketch.quantile(0.75)
+        iqr = q3 - q1
+        return q1 - threshold * iqr, q3 + threshold * iqr
+
+    def std_bounds(self, std_dev, selections=None, ranges=None):
+        '''Mean +/- std_dev standard deviations for the selected segments.'''
+        moments = self.moments(selections, ranges)
+        return moments.mean - std_dev * moments.std, moments.mean + std_dev * moments.std
@@ -0,0 +1,162 @@
+# Server-side aggregation for large scatter plots.
+# Above a point limit the price vs log(mileage) scatter is drawn as a 2D density image:
+# the points are binned with np.histogram2d on the server and only the grid of counts
+# is sent to the browser, so the payload no longer grows with the number of listings.
+# When the user zooms in far enough that the visible window holds fewer points than
+# the limit, the individual points are drawn again. With a PlotSample (plot_sampling.py)
+# views between SAMPLE_POINTS and the limit are drawn as an outlier-preserving sample,
+# and the title says how many of the points are shown.
+# aggregated_traces() makes the same choice but returns plain trace dicts and the
+# layout fields that follow the data, for callbacks that keep one static layout and
+# only send new trace arrays.
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objs as go
+
+from figure_payload import WEBGL_THRESHOLD, compact_array
+from trendlines import add_trendline
+
+POINT_LIMIT = 20_000
+SAMPLE_POINTS = 5_000
+DENSITY_BINS = 200
+# Empty bins are left blank; the color stops are bunched at the low end so
+# sparse regions stay visible next to dense ones
+DENSITY_COLORSCALE = [[0, '#deebf7'], [0.02, '#9ecae1'], [0.1, '#4292c6'], [0.4, '#08519c'], [1, '#08306b']]
+
+
+def ranges_from_relayout(relayout_data):
+    '''(x_range, y_range) from a Plotly relayout event; None for autoscaled axes.'''
+    relayout_data = relayout_data or {}
+    ranges = []
+    for axis in ('xaxis', 'yaxis'):
+        if f'{axis}.range[0]' in relayout_data:
+            ranges.append((relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']))
+        elif f'{axis}.range' in relayout_data:
+            ranges.append(tuple(relayout_data[f'{axis}.range']))
+        else:
+            ranges.append(None)
+    return tuple(ranges)
+
+
+def in_view(data, x, y, x_range=None, y_range=None):
+    '''Rows of data inside the visible window.'''
+    mask = np.ones(len(data), dtype=bool)
+    if x_range is not None:
+        mask &= data[x].between(*sorted(x_range)).to_numpy()
+    if y_range is not None:
+        mask &= data[y].between(*sorted(y_range)).to_numpy()
+    return data[mask]
+
+
+def finite_values(data, x, y):
+    '''x and y as float arrays, without the rows where either is missing.'''
+    x_values = data[x].to_numpy(dtype=float)
+    y_values = data[y].to_numpy(dtype=float)
+    ok = np.isfinite(x_values) & np.isfinite(y_values)
+    return x_values[ok], y_values[ok]
+
+
+def density_trace(x_values, y_values, x_range, y_range, bins=DENSITY_BINS):
+    '''Heatmap trace (as a dict) of the point counts on a bins x bins grid over the window.'''
+    counts, x_edges, y_edges = np.histogram2d(x_values, y_values, bins=bins, range=[x_range, y_range])
+    return dict(
+        type='heatmap',
+        name='',
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=np.where(counts > 0, counts, np.nan).T,
+        colorscale=DENSITY_COLORSCALE,
+        hovertemplate='Listings: %{z:.0f}<extra></extra>',
+        colorbar=dict(title=dict(text='Listings')),
+    )
+
+
+def density_figure(data, x, y, x_range=None, y_range=None, bins=DENSITY_BINS,
+                   trendline=False, labels=None, title=None):
+    '''2D histogram image of (x, y), binned server-side.'''
+    labels = labels or {}
+    x_values, y_values = finite_values(data, x, y)
+    x_range = sorted(x_range) if x_range is not None else (x_values.min(), x_values.max())
+    y_range = sorted(y_range) if y_range is not None else (y_values.min(), y_values.max())
+
+    fig = go.Figure([density_trace(x_values, y_values, x_range, y_range, bins)])
+    if trendline:
+        add_trendline(fig, x_values, y_values)
+    fig.update_layout(
+        title=title,
+        xaxis_title=labels.get(x, x),
+        yaxis_title=labels.get(y, y),
+        xaxis=dict(range=list(x_range)),
+        yaxis=dict(range=list(y_range)),
+    )
+    return fig
+
+
+def aggregated_traces(data, x, y, x_range=None, y_range=None, max_points=POINT_LIMIT, bins=DENSITY_BINS,
+                      sampler=None, sample_points=SAMPLE_POINTS, labels=None, title=None):
+    '''(traces, layout) for the view aggregated_scatter would draw, without building a figure.
+
+    traces are plain dicts (a scatter of the shown points, or the density heatmap)
+    with float32 coordinates; layout holds the fields that follow the data as dotted
+    paths: title.text and the axis ranges, with autorange where no range is fixed.
+    '''
+    labels = labels or {}
+    visible = in_view(data, x, y, x_range, y_range)
+    if len(visible) > max_points:
+        x_values, y_values = finite_values(visible, x, y)
+        x_range = sorted(x_range) if x_range is not None else [x_values.min(), x_values.max()]
+        y_range = sorted(y_range) if y_range is not None else [y_values.min(), y_values.max()]
+        traces = [density_trace(x_values, y_values, x_range, y_range, bins)]
+    else:
+        points = visible
+        if sampler is not None and len(visible) > sample_points:
+            points = sampler.sample(visible, sample_points)
+        if len(points) < len(visible):
+            title = f'{title or ""} (showing {len(points):,} of {len(visible):,} points)'
+        traces = [dict(
+            type='scattergl' if len(points) > WEBGL_THRESHOLD else 'scatter',
+            name='',
+            mode='markers',
+            showlegend=False,
+            x=compact_array(points[x].to_numpy()),
+            y=compact_array(points[y].to_numpy()),
+            hovertemplate=f'{labels.get(x, x)}=%{{x}}<br>{labels.get(y, y)}=%{{y}}<extra></extra>',
+        )]
+    layout = {'title.text': title}
+    for axis, axis_range in (('xaxis', x_range), ('yaxis', y_range)):
+        layout[axis + '.range'] = None if axis_range is None else [float(v) for v in axis_range]
+        layout[axis + '.autorange'] = axis_range is None
+    return traces, layout
+
+
+def aggregated_scatter(data, x, y, x_range=None, y_range=None, max_points=POINT_LIMIT,
+                       bins=DENSITY_BINS, trendline=False, sampler=None, sample_points=SAMPLE_POINTS,
+                       **px_kwargs):
+    '''px.scatter for small views, a server-side density image above max_points.
+
+    x_range / y_range are the currently visible window (from ranges_from_relayout);
+    the switch between points and density is made on the rows inside that window.
+    When a sampler is given, views with more than sample_points (but at most
+    max_points) rows are drawn as a sample of sample_points rows; the trendline is
+    still fit on every visible row.
+    '''
+    visible = in_view(data, x, y, x_range, y_range)
+    if len(visible) > max_points:
+        return density_figure(visible, x, y, x_range, y_range, bins=bins, trendline=trendline,
+                              labels=px_kwargs.get('labels'), title=px_kwargs.get('title'))
+    points = visible
+    if sampler is not None and len(visible) > sample_points:
+        points = sampler.sample(visible, sample_points)
+
+    fig = px.scatter(points, x=x, y=y, **px_kwargs)
+    if trendline:
+        add_trendline(fig, visible[x], visible[y])
+    if len(points) < len(visible):
+        title = px_kwargs.get('title') or ''
+        fig.update_layout(title=f'{title} (showing {len(points):,} of {len(visible):,} points)')
+    if x_range is not None:
+        fig.update_xaxes(range=list(x_range))
+    if y_range is not None:
+        fig.update_yaxes(range=list(y_range))
+    return fig
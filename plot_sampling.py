@@ -0,0 +1,90 @@
+# Outlier-preserving stratified sampling for large scatter plots.
+# A uniform sample of a big selection hides exactly the very cheap and very
+# expensive listings people look for. The sampler instead orders every row of the
+# dataset once: first the rows outside the IQR fences (of their make/model, or of
+# the whole dataset), then the remaining rows spread proportionally over make/model x
+# price decile strata. A sample of k rows from any selection is the first k rows of that
+# order that fall in the selection, and for the unfiltered data it is a plain slice.
+
+import numpy as np
+import pandas as pd
+
+STRATA = ['make', 'model']
+
+
+class PlotSample:
+    '''Precomputed sampling order for one version of a dataset.'''
+
+    def __init__(self, data, strata=STRATA, price='price', n_bins=10, threshold=1.5, seed=0):
+        '''data must have a unique index; subsets passed to sample() keep its labels.'''
+        rng = np.random.default_rng(seed)
+        self.index = data.index
+        n = len(data)
+        prices = pd.to_numeric(data[price], errors='coerce').to_numpy(dtype=float)
+
+        # Excel turns some model names into dates or numbers; group them as text.
+        # Missing values form their own group (with pandas 3 they stay NaN as text)
+        columns = [col for col in strata if col in data.columns]
+        if columns:
+            segment = data[columns].astype(str).groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+        else:
+            segment = np.zeros(n, dtype=int)
+        frame = pd.DataFrame({'segment': segment, 'price': prices})
+
+        # Price decile within the make/model; missing prices get their own bin
+        pct = frame.groupby('segment')['price'].rank(pct=True, method='first').to_numpy()
+        decile = np.where(np.isnan(pct), -1, np.minimum(np.ceil(pct * n_bins) - 1, n_bins - 1))
+        stratum = frame.assign(decile=decile).groupby(['segment', 'decile']).ngroup().to_numpy()
+
+        # Same 1.5 x IQR fences as remove_outliers, per make/model and overall
+        grouped = frame.groupby('segment')['price']
+        q1 = grouped.quantile(0.25).reindex(segment).to_numpy()
+        q3 = grouped.quantile(0.75).reindex(segment).to_numpy()
+        iqr = q3 - q1
+        outlier = (prices < q1 - threshold * iqr) | (prices > q3 + threshold * iqr)
+        all_q1, all_q3 = np.nanquantile(prices, [0.25, 0.75]) if n else (np.nan, np.nan)
+        all_iqr = all_q3 - all_q1
+        outlier |= (prices < all_q1 - threshold * all_iqr) | (prices > all_q3 + threshold * all_iqr)
+        self.outlier = outlier
+
+        # Systematic sampling within strata: rows get a random rank in their stratum and
+        # the key (rank + offset) / stratum size, with one random offset per stratum, so
+        # any prefix of the order holds each stratum in proportion to its size
+        shuffle = rng.permutation(n)
+        rank = np.empty(n)
+        rank[shuffle] = pd.Series(stratum[shuffle]).groupby(stratum[shuffle]).cumcount().to_numpy()
+        size = np.bincount(stratum)
+        offset = rng.random(len(size))
+        key = np.where(outlier, -1.0, (rank + offset[stratum]) / size[stratum])
+        self.order = np.lexsort((rng.random(n), key))
+
+    def state(self):
+        '''The sampling order as arrays, e.g. to publish it with a shared dataset.'''
+        return {'order': self.order, 'outlier': self.outlier}
+
+    @classmethod
+    def from_state(cls, state, index):
+        '''A PlotSample from state() for the dataset with the given index (same rows, same order).'''
+        sample = cls.__new__(cls)
+        sample.index = index
+        sample.order = state['order']
+        sample.outlier = state['outlier']
+        return sample
+
+    def sample(self, subset, max_points):
+        '''At most max_points rows of subset: its outliers first, then an even spread.'''
+        if len(subset) <= max_points:
+            return subset
+        positions = self.index.get_indexer(subset.index)
+        if (positions < 0).any():
+            raise KeyError('subset has rows that are not in the sampled dataset')
+        if len(positions) == len(self.index):
+            chosen = self.order[:max_points]
+        else:
+            selected = np.zeros(len(self.index), dtype=bool)
+            selected[positions] = True
+            chosen = self.order[selected[self.order]][:max_points]
+        # Map dataset positions back to positions in subset, keeping subset's row order
+        in_subset = np.full(len(self.index), -1)
+        in_subset[positions] = np.arange(len(positions))
+        return subset.iloc[np.sort(in_subset[chosen])]
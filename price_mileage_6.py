@@ -1,30 +1,75 @@
 # this code produced a locally hosted dash app
 
+import argparse
+import json
 import pandas as pd
 import numpy as np
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
-import plotly.express as px
 import plotly.graph_objs as go
-import statsmodels.api as sm
-
-# load the data
-try:
-    df = pd.read_excel('data/carbitrage-data-updated.xlsx')
-except FileNotFoundError:
-    print("Data file not found. Please check the file path.")
-    df = pd.DataFrame()  # or provide a default DataFrame
-
-# clean the data
-df = df[['make', 'model', 'year', 'odometer', 'price', 'location', 'state']].dropna()
-df['odometer'] = pd.to_numeric(df['odometer'], errors='coerce')
-df['price'] = pd.to_numeric(df['price'], errors='coerce')
-df = df[(df['odometer'] > 0) & (df['price'] > 0)]  # Remove invalid entries
-df['log_odometer'] = np.log(df['odometer'])  # Add log of mileage
+from trendlines import fit_trendline
+from outlier_sketches import SegmentSummaries
+from dedup import collapse_duplicates
+from plot_aggregation import aggregated_traces, ranges_from_relayout
+from figure_state import build_figure, dash_trace_update, dict_signature
+from warm_cache import FigureCache, dataset_version, filter_values, top_filter_states
+from plot_sampling import PlotSample
+from shared_dataset import load_derived, load_shared, run_with_shared
+
+def load_listings():
+    """Read and clean the listings."""
+    # load the data
+    try:
+        df = pd.read_excel('data/carbitrage-data-updated.xlsx')
+    except FileNotFoundError:
+        print("Data file not found. Please check the file path.")
+        df = pd.DataFrame()  # or provide a default DataFrame
+
+    # clean the data
+    # collapse cross-posted and reposted listings so each car is counted once
+    if not df.empty:
+        df = collapse_duplicates(df)
+    df = df[['make', 'model', 'year', 'odometer', 'price', 'location', 'state']].dropna()
+    df['odometer'] = pd.to_numeric(df['odometer'], errors='coerce')
+    df['price'] = pd.to_numeric(df['price'], errors='coerce')
+    df = df[(df['odometer'] > 0) & (df['price'] > 0)]  # Remove invalid entries
+    df['log_odometer'] = np.log(df['odometer'])  # Add log of mileage
+    return df
+
+# Workers started with --publish-shared map the parent's cleaned copy instead of loading it
+df = load_shared(load_listings)
+
+# Price moments per make/model/year, so the std dev cut-off of a make, model or year
+# selection comes from merging summaries instead of rescanning the price column.
+# State and location are left out: with them nearly every listing is its own segment.
+# Workers restore both structures from the parent's shared block instead of rebuilding them.
+summary_columns = ['make', 'model', 'year']
+price_summaries = load_derived('price_summaries', lambda: SegmentSummaries(df, 'price', summary_columns),
+                               SegmentSummaries.from_state)
+
+# Sampling order for large selections, computed once for this version of the data:
+# outliers are always plotted, the rest is spread over make/model and price decile
+plot_sample = load_derived('plot_sample', lambda: PlotSample(df),
+                           lambda state: PlotSample.from_state(state, df.index))
+
+# Views rendered at deploy time (python price_mileage_6.py --warm-cache), shared by all workers
+figure_cache = FigureCache(version=dataset_version('data/carbitrage-data-updated.xlsx'))
+
+# Static part of the scatter's layout, built once; views only supply trace arrays,
+# the title and the axis ranges
+SCATTER_LAYOUT = go.Layout(
+    title='Price vs. Log of Mileage',
+    xaxis_title='Log of Odometer',
+    yaxis_title='Price',
+    plot_bgcolor='rgba(0,0,0,0)',
+    xaxis=dict(showgrid=True, gridcolor='rgba(200,200,200,0.2)'),
+    yaxis=dict(showgrid=True, gridcolor='rgba(200,200,200,0.2)'),
+)
 
 # Initialize Dash app
 app = dash.Dash(__name__)
+server = app.server  # for WSGI servers running several workers
 
 # Dashboard Layout
 app.layout = html.Div([
@@ -75,28 +120,36 @@ app.layout = html.Div([
     html.Div([
         dcc.Checklist(
             id='regression-checkbox',
-            options=[{'label': 'Show Regression Line', 'value': 'regression'}],
+            options=[{'label': 'Show Regression Line', 'value': 'regression'},
+                     {'label': 'Show 95% Confidence Band', 'value': 'band'}],
             value=[]
         ),
     ], style={'textAlign': 'center', 'marginTop': '20px'}),
 
     # Graph to display results
     dcc.Graph(id='scatter-plot'),
+    # Trace structure of the figure on screen, so callbacks can patch its data
+    dcc.Store(id='scatter-signature'),
 
     # Table for regression info
     html.Div(id='regression-info', style={'marginTop': '30px', 'textAlign': 'center'})
 ])
 
 # Helper function to filter outliers
-def filter_outliers(data, option, std_dev=None):
+def filter_outliers(data, option, std_dev=None, selections=None):
     if option == '100K':
         return data[data['price'] <= 100_000]
     if option == '1M':
         return data[data['price'] <= 1_000_000]
     elif option == 'std' and std_dev is not None:
-        mean = data['price'].mean()
-        std = data['price'].std()
-        return data[(data['price'] >= mean - std_dev * std) & (data['price'] <= mean + std_dev * std)]
+        if price_summaries.covers(selections):
+            # Mean and std of the selected segments, merged from the load-time summaries
+            lower, upper = price_summaries.std_bounds(std_dev, selections)
+        else:
+            # State and location are finer than the summaries; data is already that selection
+            mean, std = data['price'].mean(), data['price'].std()
+            lower, upper = mean - std_dev * std, mean + std_dev * std
+        return data[(data['price'] >= lower) & (data['price'] <= upper)]
     return data
 
 # Callback to update dropdown options dynamically
@@ -119,7 +172,8 @@ def update_dropdowns(selected_make):
     locations = [{'label': loc, 'value': loc} for loc in filtered_df['location'].unique()]
     return makes, models, states, years, locations
 @app.callback(
-    [Output('scatter-plot', 'figure'), Output('regression-info', 'children')],
+    [Output('scatter-plot', 'figure'), Output('regression-info', 'children'),
+     Output('scatter-signature', 'data')],
     [
         Input('make-dropdown', 'value'),
         Input('model-dropdown', 'value'),
@@ -127,12 +181,47 @@ def update_dropdowns(selected_make):
         Input('year-dropdown', 'value'),
         Input('location-dropdown', 'value'),
         Input('outlier-exclusion', 'value'),
-        Input('regression-checkbox', 'value')
-    ]
+        Input('std-dev-input', 'value'),
+        Input('regression-checkbox', 'value'),
+        Input('scatter-plot', 'relayoutData')
+    ],
+    [State('scatter-signature', 'data')]
 )
 def update_graph(selected_make, selected_model, selected_state, selected_year, 
-                 selected_location, outlier_option, regression_option):
-    filtered_df = filter_outliers(df, outlier_option)
+                 selected_location, outlier_option, std_dev, regression_option, relayout_data,
+                 signature):
+    x_range, y_range = ranges_from_relayout(relayout_data)
+    key = view_key(selected_make, selected_model, selected_state, selected_year,
+                   selected_location, outlier_option, std_dev, regression_option)
+
+    # Common views (no zoom) are served from the warm cache built at deploy time
+    if x_range is None and y_range is None:
+        cached = figure_cache.get(*key)
+        if cached is not None:
+            return cached['figure'], regression_table(cached['rows']), cached['signature']
+
+    traces, layout, rows = build_view(selected_make, selected_model, selected_state, selected_year,
+                                      selected_location, outlier_option, std_dev, regression_option,
+                                      x_range, y_range)
+
+    # Only the trace arrays are sent when the figure on screen has the same traces;
+    # the full figure is assembled around SCATTER_LAYOUT only when they change
+    figure, signature = dash_trace_update(traces, layout, signature, SCATTER_LAYOUT)
+    return figure, regression_table(rows), signature
+
+def view_key(selected_make, selected_model, selected_state, selected_year,
+             selected_location, outlier_option, std_dev, regression_option):
+    """Cache key of a view: the canonical form of every control."""
+    return ('price_mileage_6', filter_values(selected_make), filter_values(selected_model),
+            filter_values(selected_state), filter_values(selected_year),
+            filter_values(selected_location), outlier_option, std_dev,
+            filter_values(regression_option))
+
+def build_view(selected_make, selected_model, selected_state, selected_year,
+               selected_location, outlier_option, std_dev, regression_option,
+               x_range=None, y_range=None):
+    """Trace dicts, layout fields and regression table rows (or a message) for the selected filters."""
+    filtered_df = df
 
     if selected_make:
         filtered_df = filtered_df[filtered_df['make'].isin(selected_make)]
@@ -145,42 +234,76 @@ def update_graph(selected_make, selected_model, selected_state, selected_year,
     if selected_location:
         filtered_df = filtered_df[filtered_df['location'].isin(selected_location)]
 
-    if filtered_df.empty:
-        return go.Figure(data=[], layout=go.Layout(title="No Data Available")), "No data available."
+    # Outlier cut-offs are computed for the current selection
+    selections = {'make': selected_make, 'model': selected_model, 'state': selected_state,
+                  'year': selected_year, 'location': selected_location}
+    filtered_df = filter_outliers(filtered_df, outlier_option, std_dev, selections)
 
-    fig = px.scatter(filtered_df, x='log_odometer', y='price',
-                     labels={'log_odometer': 'Log of Odometer', 'price': 'Price'},
-                     title='Price vs. Log of Mileage')
+    if filtered_df.empty:
+        return [], {'title.text': "No Data Available"}, "No data available."
 
-    fig.update_layout(
-        plot_bgcolor='rgba(0,0,0,0)',
-        xaxis=dict(showgrid=True, gridcolor='rgba(200,200,200,0.2)'),
-        yaxis=dict(showgrid=True, gridcolor='rgba(200,200,200,0.2)')
-    )
+    # Every point when few are in view, a labelled outlier-preserving sample for mid-sized
+    # views, and the density image above the point limit
+    traces, layout = aggregated_traces(filtered_df, 'log_odometer', 'price', x_range, y_range,
+                                       sampler=plot_sample, title='Price vs. Log of Mileage',
+                                       labels={'log_odometer': 'Log of Odometer', 'price': 'Price'})
 
     if regression_option and 'regression' in regression_option:
-        X = sm.add_constant(filtered_df['log_odometer'])
-        model = sm.OLS(filtered_df['price'], X).fit()
-        coef_mileage = model.params['log_odometer']
+        # Two-point line (and optional band) from the fit's summary sums
+        model, lines = fit_trendline(filtered_df['log_odometer'], filtered_df['price'],
+                                     band='band' in regression_option, name='Regression Line')
+        traces += [line.to_plotly_json() for line in lines]
+        coef_mileage = model.slope
         interpretation = f"A 1% increase in mileage is associated with a {coef_mileage:.2f} change in price."
 
-        regression_line = model.params['const'] + model.params['log_odometer'] * filtered_df['log_odometer']
-        fig.add_trace(go.Scatter(x=filtered_df['log_odometer'], y=regression_line,
-                                 mode='lines', name='Regression Line'))
-
-        table = html.Table([
-            html.Tr([html.Th("Metric"), html.Th("Value")]),
-            html.Tr([html.Td("Sample Size"), html.Td(len(filtered_df))]),
-            html.Tr([html.Td("R²"), html.Td(f"{model.rsquared:.2f}")]),
-            html.Tr([html.Td("Adjusted R²"), html.Td(f"{model.rsquared_adj:.2f}")]),
-            html.Tr([html.Td("Mileage Impact"), html.Td(interpretation)])
-        ])
+        rows = [
+            ["Sample Size", len(filtered_df)],
+            ["R²", f"{model.rsquared:.2f}"],
+            ["Adjusted R²", f"{model.rsquared_adj:.2f}"],
+            ["Mileage Impact", interpretation]
+        ]
     else:
-        table = "No regression line shown."
+        rows = "No regression line shown."
+
+    return traces, layout, rows
 
-    return fig, table
+def regression_table(rows):
+    """html.Table of [metric, value] rows; messages are shown as they are."""
+    if isinstance(rows, str):
+        return rows
+    return html.Table(
+        [html.Tr([html.Th("Metric"), html.Th("Value")])] +
+        [html.Tr([html.Td(metric), html.Td(value)]) for metric, value in rows]
+    )
 
-# Run the app
+def warm_figure_cache(n_makes=10, n_models=3):
+    """Render the most common views into the shared cache (run at deploy time)."""
+    states = top_filter_states(df, n_makes, n_models)
+    for state in states:
+        for regression_option in ([], ['regression']):
+            controls = (state['make'], state['model'], None, None, None, None, None, regression_option)
+            traces, layout, rows = build_view(*controls)
+            fig = build_figure(traces, layout, SCATTER_LAYOUT)
+            payload = {'figure': json.loads(fig.to_json()), 'rows': rows,
+                       'signature': dict_signature(traces)}
+            figure_cache.put(payload, *view_key(*controls))
+    print(f"Warmed {2 * len(states)} views in '{figure_cache.directory}'.")
+
+# Run the app; --warm-cache renders the common views into the shared cache instead
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    parser = argparse.ArgumentParser(description='Price vs. log of mileage dashboard.')
+    parser.add_argument('--warm-cache', action='store_true', help='Precompute the most common views and exit.')
+    parser.add_argument('--top-makes', type=int, default=10)
+    parser.add_argument('--top-models', type=int, default=3)
+    parser.add_argument('--publish-shared', nargs=argparse.REMAINDER, metavar='COMMAND',
+                        help='Put the cleaned data in shared memory and run COMMAND, '
+                             'e.g. gunicorn -w 4 price_mileage_6:server, whose workers map it.')
+    args = parser.parse_args()
+    if args.publish_shared:
+        derived = {'price_summaries': price_summaries.state(), 'plot_sample': plot_sample.state()}
+        raise SystemExit(run_with_shared(df, args.publish_shared, derived))
+    elif args.warm_cache:
+        warm_figure_cache(args.top_makes, args.top_models)
+    else:
+        app.run_server(debug=True)
 
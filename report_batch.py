@@ -0,0 +1,245 @@
+# Batch of static per-segment reports: one HTML page per make, per make/model and
+# per state, each with the price vs log(mileage) scatter and trendline, a map of
+# residuals and the regression table, plus an index page linking them all.
+# The data is read and partitioned once; segments are rendered in a process pool.
+# A manifest keeps a content hash of every segment's rows, so a rerun only
+# re-renders the segments whose listings changed. plotly.js is written once next to
+# the pages (from the plotly package), so the reports also open offline.
+#
+#   python report_batch.py --data data/montana_listings.xlsx --sheet in --out html/reports
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from basemap_tiles import apply_basemap, basemap_layout
+from plot_aggregation import aggregated_scatter
+from static_export import PLOTLY_JS, write_plotly_js
+from ols_kernel import simple_ols
+from trendlines import trendline_traces
+
+LEVELS = {
+    'make': ['make'],
+    'make_model': ['make', 'model'],
+    'state': ['state'],
+}
+COLUMNS = ['make', 'model', 'state', 'year', 'odometer', 'price', 'latitude', 'longitude']
+RENDER_VERSION = '2'  # bump when the page layout changes, so every report is rebuilt
+
+_PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="{plotly_js}"></script>
+<style>
+  body {{ font-family: sans-serif; margin: 16px; }}
+  table {{ border-collapse: collapse; }}
+  td, th {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+'''
+
+
+def clean_listings(data):
+    '''Rows with a usable price and mileage; segment columns as text.'''
+    data = data[[col for col in COLUMNS if col in data.columns]]
+    data = data.dropna(subset=['make', 'model', 'price', 'odometer']).copy()
+    # Excel turns some model names into dates or numbers; treat them as text
+    for col in ('make', 'model', 'state'):
+        if col in data.columns:
+            data[col] = data[col].astype(str).str.strip().str.lower()
+    data['odometer'] = pd.to_numeric(data['odometer'], errors='coerce')
+    data['price'] = pd.to_numeric(data['price'], errors='coerce')
+    data = data[(data['odometer'] > 0) & (data['price'] > 0)]
+    data['log_odometer'] = np.log(data['odometer'])
+    return data
+
+
+def slug(values):
+    '''File name for a segment, e.g. ('ford', 'f-150') -> 'ford--f-150'.'''
+    return '--'.join(re.sub(r'[^a-z0-9]+', '-', str(value).lower()).strip('-') or 'na' for value in values)
+
+
+def unique_slugs(segment_values):
+    '''values -> file name for every segment of a level.
+
+    Segments whose slugs collide ('f 150' and 'f-150' both give f-150) all get a
+    short hash of their values appended, so no page overwrites another.
+    '''
+    names = {values: slug(values) for values in segment_values}
+    counts = pd.Series(list(names.values()), dtype=object).value_counts()
+    for values, name in names.items():
+        if counts.get(name, 0) > 1:
+            names[values] = name + '-' + hashlib.sha1('\0'.join(map(str, values)).encode('utf-8')).hexdigest()[:6]
+    return names
+
+
+def content_hash(segment):
+    '''Hash of a segment's rows, the render version, the plotly.js version and the basemap.'''
+    digest = hashlib.sha1(f'{RENDER_VERSION}|{PLOTLY_JS}'.encode('utf-8'))
+    digest.update(json.dumps(basemap_layout(), sort_keys=True).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(segment, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def partition(data, levels, min_count):
+    '''(level, values, rows) for every segment with at least min_count listings.'''
+    segments = []
+    for level, keys in levels.items():
+        if not all(key in data.columns for key in keys):
+            continue
+        for values, positions in data.groupby(keys, sort=True).indices.items():
+            if len(positions) >= min_count:
+                values = values if isinstance(values, tuple) else (values,)
+                segments.append((level, values, data.iloc[positions]))
+    return segments
+
+
+def render_segment(level, values, segment, path):
+    '''Write the report page of one segment; returns its summary row for the index.'''
+    name = ' '.join(values).title()
+    fit = simple_ols(segment['log_odometer'], segment['price'])
+
+    scatter = aggregated_scatter(segment, 'log_odometer', 'price', opacity=0.6,
+                                 labels={'log_odometer': 'Log of Odometer', 'price': 'Price'},
+                                 title=f'{name}: Price vs Log of Odometer')
+    scatter.add_traces(trendline_traces(fit, band=True))
+
+    # Residuals of the segment's own fit, averaged per location like resid_map.html
+    parts = [scatter.to_html(full_html=False, include_plotlyjs=False)]
+    geo = segment.assign(residual=segment['price'] - fit.predict(segment['log_odometer']))
+    geo = geo.dropna(subset=['latitude', 'longitude']) if 'latitude' in geo else geo.iloc[0:0]
+    if len(geo):
+        by_location = geo.groupby(['latitude', 'longitude'], as_index=False).agg(
+            avg_residual=('residual', 'mean'), listings=('residual', 'size'))
+        fig = px.scatter_mapbox(
+            by_location, lat='latitude', lon='longitude', color='avg_residual', size='listings',
+            color_continuous_scale='Cividis', range_color=[-30000, 30000], size_max=15,
+            labels={'avg_residual': 'Average Residual'}, zoom=5, height=500,
+            title=f'{name}: Average Residuals by Location', mapbox_style='carto-positron')
+        parts.append(apply_basemap(fig).to_html(full_html=False, include_plotlyjs=False))
+
+    rows = [
+        ('Listings', f'{fit.nobs:,}'),
+        ('Median Price', f'{segment["price"].median():,.0f}'),
+        ('Intercept', f'{fit.intercept:,.2f}'),
+        ('Mileage Coefficient', f'{fit.slope:,.2f}'),
+        ('p-value', f'{fit.pvalues[1]:.3g}'),
+        ('R²', f'{fit.rsquared:.2f}'),
+    ]
+    table = '<table><tr><th>Metric</th><th>Value</th></tr>' + ''.join(
+        f'<tr><td>{metric}</td><td>{value}</td></tr>' for metric, value in rows) + '</table>'
+
+    body = (f'<p><a href="../index.html">All reports</a></p><h1>{html.escape(name)}</h1>'
+            + table + ''.join(parts))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_PAGE.format(title=html.escape(name), plotly_js='../' + PLOTLY_JS, body=body))
+    return summary_row(level, values, fit, segment)
+
+
+def summary_row(level, values, fit, segment):
+    return {'level': level, 'segment': ' '.join(values).title(), 'listings': len(segment),
+            'median_price': float(segment['price'].median()), 'slope': float(fit.slope),
+            'rsquared': float(fit.rsquared)}
+
+
+def _render_task(task):
+    level, values, segment, path = task
+    return path, render_segment(level, values, segment, path)
+
+
+def write_index(out_dir, summaries):
+    '''Index page with one table per level, linking every report.'''
+    titles = {'make': 'Makes', 'make_model': 'Makes and Models', 'state': 'States'}
+    sections = []
+    for level in LEVELS:
+        rows = sorted((s for s in summaries.values() if s['level'] == level),
+                      key=lambda s: -s['listings'])
+        if not rows:
+            continue
+        lines = ''.join(
+            f'<tr><td><a href="{html.escape(s["href"])}">{html.escape(s["segment"])}</a></td>'
+            f'<td>{s["listings"]:,}</td><td>{s["median_price"]:,.0f}</td>'
+            f'<td>{s["slope"]:,.2f}</td><td>{s["rsquared"]:.2f}</td></tr>'
+            for s in rows)
+        sections.append(f'<h2>{titles.get(level, level)}</h2><table><tr><th>Segment</th><th>Listings</th>'
+                        f'<th>Median Price</th><th>Mileage Coefficient</th><th>R²</th></tr>{lines}</table>')
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(_PAGE.format(title='Segment Reports', plotly_js=PLOTLY_JS,
+                             body='<h1>Segment Reports</h1>' + ''.join(sections)))
+
+
+def build_reports(data, out_dir, levels=LEVELS, min_count=10, max_workers=None):
+    '''Render every changed segment report; returns (rendered, skipped).'''
+    data = clean_listings(data)
+    write_plotly_js(out_dir)
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    segments = partition(data, levels, min_count)
+    names = {level: unique_slugs([values for lvl, values, _ in segments if lvl == level]) for level in levels}
+    tasks, summaries, hashes = [], {}, {}
+    for level, values, segment in segments:
+        href = f'{level}/{names[level][values]}.html'
+        # Two segments writing the same page would silently overwrite each other
+        if href in hashes:
+            raise ValueError(f'two {level} segments map to {href}')
+        path = os.path.join(out_dir, level, names[level][values] + '.html')
+        hashes[href] = content_hash(segment)
+        previous = manifest.get(href)
+        if previous and previous['hash'] == hashes[href] and os.path.exists(path):
+            summaries[href] = previous['summary']
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tasks.append((level, values, segment, path))
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            chunksize = max(1, len(tasks) // (4 * (max_workers or os.cpu_count())))
+            for path, summary in pool.map(_render_task, tasks, chunksize=chunksize):
+                href = os.path.relpath(path, out_dir).replace(os.sep, '/')
+                summaries[href] = summary
+
+    for href in summaries:
+        summaries[href]['href'] = href
+    write_index(out_dir, summaries)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({href: {'hash': hashes[href], 'summary': summaries[href]} for href in summaries}, f)
+    return len(tasks), len(summaries) - len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render static reports per make, make/model and state.')
+    parser.add_argument('--data', default=os.path.join('data', 'montana_listings.xlsx'))
+    parser.add_argument('--sheet', default='in')
+    parser.add_argument('--out', default=os.path.join('html', 'reports'))
+    parser.add_argument('--levels', nargs='+', default=list(LEVELS), choices=list(LEVELS))
+    parser.add_argument('--min-count', type=int, default=10, help='Smallest segment that gets a report.')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    data = pd.read_excel(args.data, sheet_name=args.sheet)
+    os.makedirs(args.out, exist_ok=True)
+    levels = {level: LEVELS[level] for level in args.levels}
+    rendered, skipped = build_reports(data, args.out, levels, args.min_count, args.workers)
+    print(f"Rendered {rendered} reports, {skipped} unchanged; index at '{os.path.join(args.out, 'index.html')}'.")
+
+
+if __name__ == '__main__':
+    main()
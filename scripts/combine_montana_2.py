@@ -2,26 +2,52 @@ import panel as pn
 import numpy as np  # Import numpy
 import pandas as pd
 import plotly.express as px
+import os
+import sys
+
+# Shared helpers live in the repo root, one level up from this script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plot_aggregation import aggregated_scatter, ranges_from_relayout
+from figure_state import PaneUpdater
+from plot_sampling import PlotSample
+from basemap_tiles import apply_basemap
+from shared_dataset import load_derived, load_shared, run_with_shared
 
 # Initialize Panel with Plotly support
 pn.extension("plotly")
 
-# Load and clean data
-df = pd.read_excel(r'data\\montana_listings.xlsx', sheet_name='in')
+def load_listings():
+    """Load and clean the listings."""
+    df = pd.read_excel(r'data\\montana_listings.xlsx', sheet_name='in')
+
+    # Ensure the dataset has latitude and longitude columns
+    df_clean = df.dropna(subset=['price', 'odometer', 'make', 'model', 'condition', 
+                                 'title', 'type', 'transmission', 'drive', 'latitude', 'longitude']).copy()
+
+    df_clean['log_odometer'] = np.log(df_clean['odometer'])
+    df_clean['vehicle_type'] = df_clean['type']
+    # Only the columns the dashboard uses; free text like urls would be copied into every worker
+    return df_clean[['make', 'model', 'vehicle_type', 'transmission', 'title', 'condition', 'drive',
+                     'price', 'odometer', 'log_odometer', 'latitude', 'longitude']]
 
-# Ensure the dataset has latitude and longitude columns
-df_clean = df.dropna(subset=['price', 'odometer', 'make', 'model', 'condition', 
-                             'title', 'type', 'transmission', 'drive', 'latitude', 'longitude']).copy()
+# Workers started by the parent below map its cleaned copy instead of loading the file:
+#   python scripts/combine_montana_2.py --publish-shared panel serve scripts/combine_montana_2.py --num-procs 4
+df_clean = load_shared(load_listings)
 
-df_clean['log_odometer'] = np.log(df_clean['odometer'])
-df_clean['vehicle_type'] = df_clean['type']
+# Sampling order for large selections: outliers first, then make/model x price decile strata
+# (published with the data, so workers do not recompute it)
+plot_sample = load_derived('plot_sample', lambda: PlotSample(df_clean),
+                           lambda state: PlotSample.from_state(state, df_clean.index))
+if '--publish-shared' in sys.argv:
+    sys.exit(run_with_shared(df_clean, sys.argv[sys.argv.index('--publish-shared') + 1:],
+                             {'plot_sample': plot_sample.state()}))
 
 # ===== HELPER FUNCTIONS ===== #
-def create_scatter_plot(filtered_data):
-    """Generate a scatter plot."""
-    fig = px.scatter(
+def create_scatter_plot(filtered_data, x_range=None, y_range=None):
+    """Generate a scatter plot (a labelled sample or a density image when many points are in view)."""
+    fig = aggregated_scatter(
         filtered_data, 
-        x='log_odometer', y='price', trendline='ols',
+        'log_odometer', 'price', x_range, y_range, trendline=True, sampler=plot_sample,
         labels={'log_odometer': 'Log of Odometer', 'price': 'Price'},
         title='Scatter Plot: Price vs Log of Odometer'
     )
@@ -36,7 +62,7 @@ def create_choropleth_map(filtered_data):
         title='Map: Vehicle Prices by Location',
         mapbox_style="carto-positron"
     )
-    return fig
+    return apply_basemap(fig)
 
 def filter_data(make=None, model=None, vehicle_type=None, transmission=None, 
                 title=None, condition=None):
@@ -60,6 +86,10 @@ def filter_data(make=None, model=None, vehicle_type=None, transmission=None,
 scatter_pane = pn.pane.Plotly(create_scatter_plot(df_clean), height=500, width=700)
 map_pane = pn.pane.Plotly(create_choropleth_map(df_clean), height=500, width=700)
 
+# Later updates only push changed trace data to the panes
+scatter_updater = PaneUpdater(scatter_pane)
+map_updater = PaneUpdater(map_pane)
+
 # Create widgets with smaller sizes
 make_widget = pn.widgets.Select(name='Make', options=[''] + df_clean['make'].unique().tolist(), width=150)
 model_widget = pn.widgets.Select(name='Model', options=[''] + df_clean['model'].unique().tolist(), width=150)
@@ -68,9 +98,9 @@ transmission_widget = pn.widgets.Select(name='Transmission', options=[''] + df_c
 title_widget = pn.widgets.Select(name='Title', options=[''] + df_clean['title'].unique().tolist(), width=150)
 condition_widget = pn.widgets.Select(name='Condition', options=[''] + df_clean['condition'].unique().tolist(), width=150)
 
-# Update function to refresh both graphs
-def update_graphs(event=None):
-    filtered_df = filter_data(
+# Current selection of the filter widgets
+def current_selection():
+    return filter_data(
         make=make_widget.value,
         model=model_widget.value,
         vehicle_type=vehicle_type_widget.value,
@@ -78,8 +108,19 @@ def update_graphs(event=None):
         title=title_widget.value,
         condition=condition_widget.value
     )
-    scatter_pane.object = create_scatter_plot(filtered_df)
-    map_pane.object = create_choropleth_map(filtered_df)
+
+# Update function to refresh both graphs
+def update_graphs(event=None):
+    filtered_df = current_selection()
+    scatter_updater.update(create_scatter_plot(filtered_df))
+    map_updater.update(create_choropleth_map(filtered_df))
+
+# Redraw the scatter for the zoomed window, so points come back when zoomed in
+def zoom_scatter(event):
+    x_range, y_range = ranges_from_relayout(event.new)
+    scatter_updater.update(create_scatter_plot(current_selection(), x_range, y_range))
+
+scatter_pane.param.watch(zoom_scatter, 'relayout_data')
 
 # Attach callbacks to widgets
 for widget in [make_widget, model_widget, vehicle_type_widget, transmission_widget, title_widget, condition_widget]:
@@ -1,7 +1,12 @@
+import os
+import sys
 import pandas as pd
-import statsmodels.api as sm
 import numpy as np
 
+# Shared helpers live in the repo root, two levels up from this script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from fixed_effects import fe_regression
+
 # Load and clean the data
 df = pd.read_excel(r'data\\carbitrage-data.xlsx', sheet_name='carbitrage-data')
 df = df[['make', 'model', 'year', 'odometer', 'price', 'location']].dropna()
@@ -9,9 +14,11 @@ df['odometer'] = pd.to_numeric(df['odometer'], errors='coerce')
 df['price'] = pd.to_numeric(df['price'], errors='coerce')
 df = df[(df['odometer'] > 0) & (df['price'] > 0)]
 
-# Log transformation and dummies
+# Log transformation; make and location enter as absorbed fixed effects
+# instead of dense dummy columns
 df['log_odometer'] = np.log(df['odometer'])
-make_dummies = pd.get_dummies(df['make'], drop_first=True)
-location_dummies = pd.get_dummies(df['location'], drop_first=True)
+results = fe_regression(df, 'price', ['log_odometer'], fe=['make', 'location'], cluster='location')
 
-print(df)
\ No newline at end of file
+print(results['table'])
+print(f"Observations: {results['nobs']}, within R²: {results['within_r2']:.3f}")
+print(f"Absorbed levels: {results['fixed_effects']}")
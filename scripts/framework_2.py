@@ -4,45 +4,56 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error
+import os
+import sys
 
-# Cache the data to prevent reloading on every run
-@st.cache_data
+# Shared helpers live in the repo root, one level up from this script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outlier_sketches import SegmentSummaries
+from model_training import cross_validate_models
+from basemap_tiles import apply_basemap
+from shared_dataset import SharedDataset
+
+# Load the data once per process; every session shares the same read-only dataset
+@st.cache_resource
 def load_data(file_path):
     try:
-        data = pd.read_excel(file_path)
-        return data
+        return SharedDataset.from_frame(pd.read_excel(file_path))
     except Exception as e:
         st.error(f"Error loading data: {e}")
         return None
 
 # Load the dataset
 file_path = "data/montana_listings.xlsx"  # Adjust this path if needed
-data = load_data(file_path)
+dataset = load_data(file_path)
 
 # Error handling if data is not loaded correctly
-if data is None:
+if dataset is None:
     st.stop()
 
 # Sidebar for filters and outlier exclusion
 st.sidebar.header("Filters and Options")
 min_price, max_price = st.sidebar.slider(
-    "Select price range", int(data["price"].min()), int(data["price"].max()), (0, 50000)
+    "Select price range", int(np.nanmin(dataset.column("price"))), int(np.nanmax(dataset.column("price"))), (0, 50000)
 )
 exclude_outliers = st.sidebar.checkbox("Exclude Outliers", value=True)
 
-# Function to exclude outliers based on price
-def remove_outliers(df, column, threshold=1.5):
-    q1 = df[column].quantile(0.25)
-    q3 = df[column].quantile(0.75)
-    iqr = q3 - q1
-    return df[(df[column] >= q1 - threshold * iqr) & (df[column] <= q3 + threshold * iqr)]
+# Price sketches per make/model, built once per process rather than on every rerun
+@st.cache_resource
+def build_price_summaries(file_path, _dataset):
+    return SegmentSummaries(_dataset.frame(columns=["make", "model", "price"]), "price", ["make", "model"])
 
+# Sessions work on row positions into the shared dataset. Outliers are cut at the IQR
+# fences of the merged segment sketches instead of sorting the column
+price_ranges = {}
 if exclude_outliers:
-    data = remove_outliers(data, "price")
+    price_ranges["price"] = build_price_summaries(file_path, dataset).iqr_bounds(1.5)
+rows = dataset.select(ranges=price_ranges)
+prices = dataset.column("price", rows)
+filtered_rows = rows[(prices >= min_price) & (prices <= max_price)]
 
-filtered_data = data[(data["price"] >= min_price) & (data["price"] <= max_price)]
+# Only the filtered rows and the columns the charts use are copied out for this rerun
+filtered_data = dataset.frame(filtered_rows, ["price", "odometer", "latitude", "longitude"])
 
 # Scatter plot: Price vs. Log of Odometer
 st.header("Scatter Plot: Price vs. Log(Odometer)")
@@ -66,30 +77,49 @@ fig_choropleth = px.density_mapbox(
     center=dict(lat=46.8797, lon=-110.3626), zoom=6,
     mapbox_style="carto-positron", title="Residuals by Latitude and Longitude"
 )
+apply_basemap(fig_choropleth)
 st.plotly_chart(fig_choropleth)
 
 # Custom Regression Section
 st.header("Custom Regression Model")
 st.write("Use this section to create and explore custom regression models on the dataset.")
 
-target_column = st.selectbox("Select Target Column", data.columns)
-feature_columns = st.multiselect("Select Feature Columns", [col for col in data.columns if col != target_column])
+target_column = st.selectbox("Select Target Column", list(dataset.columns))
+feature_columns = st.multiselect("Select Feature Columns", [col for col in dataset.columns if col != target_column])
+
+n_splits = st.slider("Number of CV Folds", 3, 10, 5)
 
 if st.button("Train Model"):
     if not feature_columns:
         st.error("Please select at least one feature column.")
     else:
-        X_train, X_test, y_train, y_test = train_test_split(
-            data[feature_columns], data[target_column], test_size=0.3, random_state=42
+        # Categorical features become dummy columns; rows with missing values, or with a
+        # target that is not a number, are dropped
+        model_data = dataset.frame(rows, feature_columns + [target_column])
+        model_data[target_column] = pd.to_numeric(model_data[target_column], errors="coerce")
+        model_data = model_data.dropna()
+        X = pd.get_dummies(model_data[feature_columns], drop_first=True, dtype=float)
+        y = model_data[target_column]
+
+        # k-fold CV for OLS, Ridge and Lasso over a regularization path, folds in parallel
+        cv = cross_validate_models(X, y, n_splits=n_splits)
+        alpha_text = "" if cv["best_model"] == "OLS" else f" (alpha = {cv['best_alpha']:.4g})"
+        st.success(
+            f"Chosen model: {cv['best_model']}{alpha_text}. "
+            f"CV Mean Squared Error: {cv['results'].loc[0, 'cv_mse']:.2f}. "
+            f"Trained {len(cv['results'])} candidates in {cv['elapsed']:.2f} seconds."
         )
-        model = LinearRegression()
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-        mse = mean_squared_error(y_test, y_pred)
-        st.success(f"Model trained! Mean Squared Error: {mse:.2f}")
-
-        # Show predictions and residuals
-        results = pd.DataFrame({"Actual": y_test, "Predicted": y_pred, "Residual": y_test - y_pred})
+
+        # CV error for every candidate model
+        st.write(cv["results"])
+
+        # Coefficients of the chosen model, refit on all rows
+        st.write(pd.DataFrame({"Coefficient": cv["coefficients"]}))
+
+        # Show out-of-fold predictions and residuals
+        results = pd.DataFrame({
+            "Actual": y, "Predicted": cv["oof_predictions"], "Residual": y - cv["oof_predictions"]
+        })
         st.write(results)
 
 # Instructions and placeholders for future features
@@ -99,6 +129,6 @@ st.sidebar.write(
     """
     - Add additional filtering options (e.g., based on location or date).
     - Implement interactive elements (e.g., sliders for model hyperparameters).
-    - Explore additional regression models (e.g., Ridge, Lasso).
+    - Explore additional regression models (e.g., tree-based models).
     """
 )
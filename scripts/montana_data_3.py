@@ -2,7 +2,14 @@
 import pandas as pd  # For data manipulation
 import numpy as np  # For numerical operations like log transformation
 import plotly.express as px  # For interactive visualizations
-import statsmodels.api as sm  # For statistical models
+import base64
+import json
+import os
+import sys
+
+# Shared helpers live in the repo root, one level up from this script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trendlines import add_trendline  # Two-point OLS trendline from summary sums
 
 # Load your data from an Excel file into a DataFrame
 df = pd.read_excel(r'data\montana_listings.xlsx', sheet_name='in')
@@ -17,39 +24,39 @@ df_clean['log_odometer'] = np.log(df_clean['odometer'])
 # Rename the 'type' column for clarity
 df_clean['vehicle_type'] = df_clean['type']
 
-# Define a function to filter data dynamically based on multiple criteria
-def filter_data(make=None, model=None, vehicle_type=None, transmission=None, 
-                title=None, condition=None):
-    """Filter the dataset based on optional input criteria. Returns a subset DataFrame."""
-    filtered_df = df_clean
-    if make:
-        filtered_df = filtered_df[filtered_df['make'] == make]
-    if model:
-        filtered_df = filtered_df[filtered_df['model'] == model]
-    if vehicle_type:
-        filtered_df = filtered_df[filtered_df['vehicle_type'] == vehicle_type]
-    if transmission:
-        filtered_df = filtered_df[filtered_df['transmission'] == transmission]
-    if title:
-        filtered_df = filtered_df[filtered_df['title'] == title]
-    if condition:
-        filtered_df = filtered_df[filtered_df['condition'] == condition]
-    return filtered_df
-
-# Create a scatter plot with a trendline using Plotly Express
+# One integer code per row for every dropdown column, from a single factorize pass.
+# The page stores these codes and the plotted arrays once; a dropdown option only
+# names its column and code, and the browser selects the matching rows on click
+# instead of every option carrying its own copy of x and y.
+def column_codes(column):
+    """Row codes of column and its unique values (in order of appearance)."""
+    codes, uniques = pd.factorize(df_clean[column])
+    return codes.astype(np.int32), uniques
+
+def typed_array(values):
+    """Plotly-style base64 typed array spec, decoded by the page script below."""
+    return {'dtype': values.dtype.str.lstrip('<|='), 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+
+# The plotted columns as float32 arrays; plotly writes them as compact base64 typed arrays
+x_values = df_clean['log_odometer'].to_numpy(dtype=np.float32)
+y_values = df_clean['price'].to_numpy(dtype=np.float32)
+
+# Create a scatter plot using Plotly Express
 fig_2 = px.scatter(
     df_clean,
     x='log_odometer',
     y='price',
-    trendline='ols',  # Add an Ordinary Least Squares (OLS) trendline
     labels={'log_odometer': 'Log of Odometer', 'price': 'Price'},
     title='Price vs Log of Odometer',
     template='simple_white',  # Use a clean background theme
     opacity=0.7,  # Set transparency for better visibility
 )
 
-# Extract R² value from the OLS trendline for model fit evaluation
-results = px.get_trendline_results(fig_2).iloc[0]['px_fit_results']
+# Plot the float32 copies, which the dropdowns select from in the browser
+fig_2.data[0].update(x=x_values, y=y_values)
+
+# Add an Ordinary Least Squares (OLS) trendline and keep its R² for model fit evaluation
+results = add_trendline(fig_2, df_clean['log_odometer'], df_clean['price'])
 r_squared = results.rsquared
 
 # Update the plot title to include the R² value
@@ -66,19 +73,23 @@ dropdowns = [
     {'label': 'Select Title', 'column': 'title'},
     {'label': 'Select Condition', 'column': 'condition'},
 ]
-# Adjust dropdown menus and buttons
+# Adjust dropdown menus and buttons; 'skip' buttons only raise plotly_buttonclicked,
+# which the page script answers by restyling the scatter trace
+codes = {}
 buttons = []
 for i, dropdown in enumerate(dropdowns):
+    column_code, uniques = column_codes(dropdown['column'])
+    codes[dropdown['column']] = typed_array(column_code)
+    # The blank option shows every listing, same as 'Clear Filters'
+    options = [('', -1)] + [(option, code) for code, option in enumerate(uniques)]
     buttons.append({
         'buttons': [
             {
-                'method': 'restyle',
+                'method': 'skip',
                 'label': str(option),  # Ensure the label is a string
-                'args': [{'x': [filter_data(**{dropdown['column']: option})['log_odometer']],
-                          'y': [filter_data(**{dropdown['column']: option})['price']],
-                          'mode': 'markers'}]  # Plot only markers
+                'args': [dropdown['column'], code]
             }
-            for option in [''] + df_clean[dropdown['column']].unique().tolist()
+            for option, code in options
         ],
         'direction': 'down',
         'showactive': True,
@@ -93,11 +104,9 @@ for i, dropdown in enumerate(dropdowns):
 buttons.append({
     'buttons': [
         {
-            'method': 'restyle',
+            'method': 'skip',
             'label': 'Clear Filters',
-            'args': [{'x': [df_clean['log_odometer']],
-                      'y': [df_clean['price']],
-                      'mode': 'markers'}]  # Plot only markers
+            'args': [None, -1]
         }
     ],
     'type': 'buttons',
@@ -117,5 +126,30 @@ fig_2.update_layout(
     margin={'t': 150},  # Increase top margin to fit dropdowns and buttons
 )
 
+# Filters the shared arrays on a dropdown click: the rows whose code in the clicked
+# column matches, or every row for the blank option and 'Clear Filters'
+filter_script = """
+var gd = document.getElementById('{plot_id}');
+var codes = CODES;
+function decode(spec) {
+    if (!spec || spec.bdata === undefined) return spec;
+    var bytes = Uint8Array.from(atob(spec.bdata), function (c) { return c.charCodeAt(0); });
+    return spec.dtype === 'i4' ? new Int32Array(bytes.buffer) : new Float32Array(bytes.buffer);
+}
+var x = decode(gd.data[0].x), y = decode(gd.data[0].y);
+for (var column in codes) codes[column] = decode(codes[column]);
+gd.on('plotly_buttonclicked', function (event) {
+    var column = event.button.args[0], code = event.button.args[1];
+    var xs = x, ys = y;
+    if (column !== null && code >= 0) {
+        var rows = codes[column], keep = [];
+        for (var i = 0; i < rows.length; i++) if (rows[i] === code) keep.push(i);
+        xs = Float32Array.from(keep, function (i) { return x[i]; });
+        ys = Float32Array.from(keep, function (i) { return y[i]; });
+    }
+    Plotly.restyle(gd, {x: [xs], y: [ys], mode: 'markers'}, [0]);  // Plot only markers, in the scatter trace
+});
+""".replace('CODES', json.dumps(codes))
+
 # Save the interactive plot as an HTML file
-fig_2.write_html(r'html\dynamic_scatter.html')
\ No newline at end of file
+fig_2.write_html(r'html\dynamic_scatter.html', post_script=filter_script)
\ No newline at end of file
@@ -0,0 +1,233 @@
+# Read-only, columnar copy of the listings shared by every dashboard session.
+# The dataset is loaded, cleaned and indexed once per process and then never
+# modified: numeric columns are numpy arrays, text columns are int32 codes into a
+# list of labels, and the filter columns get an inverted index (row positions grouped
+# by code). A session's filter selection is just an array of row positions; only the
+# rows (and columns) a rerun actually shows are copied out into a DataFrame.
+#
+# For deployments with several worker processes the arrays can be published into one
+# shared memory block: a parent loads and cleans the data once, publishes it and
+# starts the workers with SHARED_DATASET set, and every worker maps the same block
+# instead of parsing the file again. Numeric columns are used in place (zero-copy);
+# each worker only holds the small label lists and pointer arrays for text columns.
+# Structures derived from the listings (price summaries, the plot sampling order) are
+# published in the same block, so workers restore them instead of rebuilding them.
+#
+#   python price_mileage_6.py --publish-shared gunicorn -w 4 price_mileage_6:server
+
+import os
+import pickle
+import struct
+import subprocess
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+SHARED_DATASET_ENV = 'SHARED_DATASET'
+_attached = {}
+_published = set()
+
+
+class SharedDataset:
+    '''Listings as read-only column arrays, with an inverted index per filter column.'''
+
+    def __init__(self, columns, categories, postings=None, derived=None):
+        '''columns: name -> array; categories: name -> labels of the coded text columns;
+        postings: name -> (order, starts), row positions sorted by code and where each code starts;
+        derived: key -> state dict (arrays and small values) of a structure built from the data.'''
+        self.columns = columns
+        self.categories = categories
+        self.postings = postings or {}
+        self.derived = derived or {}
+        self.n_rows = len(next(iter(columns.values()))) if columns else 0
+        for array in columns.values():
+            array.setflags(write=False)
+        for order, starts in self.postings.values():
+            order.setflags(write=False)
+            starts.setflags(write=False)
+        self._codes = {name: {label: code for code, label in enumerate(labels)}
+                       for name, labels in categories.items()}
+        # Code -1 (missing) picks the NaN at the end
+        self._lookup = {name: np.append(np.asarray(labels, dtype=object), np.nan)
+                        for name, labels in categories.items()}
+
+    @classmethod
+    def from_frame(cls, data, index_columns=()):
+        '''Build from a cleaned DataFrame; index_columns must be text columns.'''
+        columns, categories, postings = {}, {}, {}
+        for name in data.columns:
+            values = data[name]
+            if pd.api.types.is_numeric_dtype(values):
+                columns[name] = values.to_numpy()
+            else:
+                codes, labels = pd.factorize(values, sort=False)
+                columns[name] = codes.astype(np.int32)
+                categories[name] = list(labels)
+        for name in index_columns:
+            codes = columns[name]
+            # Missing values (code -1) sort first and get the first slot of starts
+            counts = np.bincount(codes + 1, minlength=len(categories[name]) + 1)
+            starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            postings[name] = (np.argsort(codes, kind='stable'), starts)
+        return cls(columns, categories, postings)
+
+    def labels(self, name):
+        '''Distinct values of a text column, in order of first appearance.'''
+        return list(self.categories[name])
+
+    def column(self, name, rows=None):
+        '''Raw array of a column (codes for text columns), optionally for some rows.'''
+        values = self.columns[name]
+        return values if rows is None else values[rows]
+
+    def _wanted_codes(self, name, labels):
+        return np.unique(np.array([self._codes[name].get(label, -2) for label in labels], dtype=np.int32))
+
+    def _posting_rows(self, name, codes):
+        order, starts = self.postings[name]
+        parts = [order[starts[code + 1]:starts[code + 2]] for code in codes if code >= 0]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def select(self, selections=None, ranges=None, mask=None):
+        '''Sorted row positions matching every filter.
+
+        selections: column -> list of labels (empty or None means no filter);
+        ranges: column -> (low, high), inclusive; mask: boolean array of rows to keep.
+        '''
+        wanted = {name: self._wanted_codes(name, labels)
+                  for name, labels in (selections or {}).items() if labels is not None and len(labels)}
+        # Start from the smallest posting list, then check the other filters on those rows only
+        indexed = [name for name in wanted if name in self.postings]
+        if indexed:
+            def size(name):
+                starts = self.postings[name][1]
+                return sum(starts[code + 2] - starts[code + 1] for code in wanted[name] if code >= 0)
+            first = min(indexed, key=size)
+            rows = self._posting_rows(first, wanted.pop(first))
+        else:
+            rows = np.arange(self.n_rows)
+        for name, codes in wanted.items():
+            rows = rows[np.isin(self.columns[name][rows], codes)]
+        for name, (low, high) in (ranges or {}).items():
+            values = self.columns[name][rows]
+            rows = rows[(values >= low) & (values <= high)]
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return rows
+
+    def frame(self, rows=None, columns=None):
+        '''DataFrame of the given rows and columns, indexed by row position.'''
+        names = list(self.columns) if columns is None else columns
+        data = {}
+        for name in names:
+            values = self.column(name, rows)
+            data[name] = self._lookup[name][values] if name in self.categories else values
+        index = pd.RangeIndex(self.n_rows) if rows is None else pd.Index(rows)
+        return pd.DataFrame(data, index=index, copy=False)
+
+
+def _aligned(size):
+    return -(-size // 8) * 8
+
+
+def publish(dataset, name=None):
+    '''Copy the dataset's arrays into one shared memory block.
+
+    Array values of dataset.derived go into the block as well; its other values
+    are pickled into the header with the labels. Returns the SharedMemory; keep it
+    open while workers use it and unlink it after.
+    '''
+    arrays = [('column', key, array) for key, array in dataset.columns.items()]
+    for key, (order, starts) in dataset.postings.items():
+        arrays += [('order', key, order), ('starts', key, starts)]
+    values = {}
+    for key, state in dataset.derived.items():
+        values[key] = {field: value for field, value in state.items() if not isinstance(value, np.ndarray)}
+        arrays += [('derived', (key, field), np.ascontiguousarray(value))
+                   for field, value in state.items() if isinstance(value, np.ndarray)]
+    layout, size = [], 0
+    for kind, key, array in arrays:
+        if array.dtype.kind == 'O':
+            raise TypeError(f'column {key!r} holds Python objects and cannot be shared')
+        layout.append((kind, key, array.dtype.str, array.shape, size))
+        size += _aligned(array.nbytes)
+    header = pickle.dumps({'arrays': layout, 'categories': dataset.categories, 'derived': values})
+    start = _aligned(8 + len(header))
+
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(start + size, 1))
+    struct.pack_into('<Q', shm.buf, 0, len(header))
+    shm.buf[8:8 + len(header)] = header
+    for (kind, key, dtype, shape, offset), (_, _, array) in zip(layout, arrays):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start + offset)[...] = array
+    _published.add(shm.name)
+    return shm
+
+
+def _open(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Before 3.13 the resource tracker would unlink the block when this worker exits
+        # (the publishing process keeps its registration, as it unlinks the block itself)
+        if os.name == 'posix' and name not in _published:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def attach(name):
+    '''The SharedDataset published under name, mapped without copying (once per process).'''
+    if name not in _attached:
+        shm = _open(name)
+        (length,) = struct.unpack_from('<Q', shm.buf, 0)
+        header = pickle.loads(shm.buf[8:8 + length])
+        start = _aligned(8 + length)
+        columns, parts, derived = {}, {}, header['derived']
+        for kind, key, dtype, shape, offset in header['arrays']:
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start + offset)
+            array.setflags(write=False)
+            if kind == 'column':
+                columns[key] = array
+            elif kind == 'derived':
+                derived[key[0]][key[1]] = array
+            else:
+                parts[kind, key] = array
+        postings = {key: (parts['order', key], parts['starts', key]) for kind, key in parts if kind == 'order'}
+        dataset = SharedDataset(columns, header['categories'], postings, derived)
+        dataset.shm = shm  # keeps the mapping alive
+        _attached[name] = dataset
+    return _attached[name]
+
+
+def load_shared(build):
+    '''The cleaned listings: mapped from the parent's block in a worker, else build().'''
+    name = os.environ.get(SHARED_DATASET_ENV)
+    if not name:
+        return build()
+    return attach(name).frame()
+
+
+def load_derived(key, build, restore):
+    '''A structure derived from the listings: restore(state) from the state the parent
+    published under key when running as a worker, else build().'''
+    name = os.environ.get(SHARED_DATASET_ENV)
+    if name:
+        derived = attach(name).derived
+        if key in derived:
+            return restore(derived[key])
+    return build()
+
+
+def run_with_shared(data, command, derived=None):
+    '''Publish data (and the derived states, key -> state dict), run command (which
+    starts the workers) with SHARED_DATASET set, and free the block when it exits.
+    Returns the command's exit code.'''
+    dataset = SharedDataset.from_frame(data)
+    dataset.derived = derived or {}
+    shm = publish(dataset)
+    try:
+        return subprocess.call(command, env=dict(os.environ, **{SHARED_DATASET_ENV: shm.name}))
+    finally:
+        shm.close()
+        shm.unlink()
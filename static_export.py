@@ -0,0 +1,316 @@
+# Compact static HTML export of the listing dashboard.
+# Panel's embed=True export stores full figure JSON for every widget state, which is
+# why combine_montana_4.py had to be cut down to the top makes and models. This export
+# stores the listings once instead: every column is a binary array (float32 for
+# numbers, integer codes plus a category list for text), all arrays are packed into
+# one gzip-compressed, base64 encoded blob, and the scatter and map are drawn from
+# those shared arrays by a small script in the page.
+#
+# Filtering also happens in the page: each filter column gets an inverted index
+# (row ids grouped by category code), a selection intersects those row lists, and
+# the OLS trendline and R squared are computed from running sums over the selected
+# rows. Export size and build time therefore do not depend on how many filter
+# combinations there are.
+#
+# plotly.js (the copy bundled with the plotly package) is written once next to the
+# page as plotly-<version>.min.js, so the page works offline without carrying 4.5 MB
+# of script itself; --plotly-js loads it from a URL instead, or inlines it with 'inline'.
+#
+#   python static_export.py --data data/montana_listings.xlsx --out html/vehicle_dashboard.html
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import string
+
+import numpy as np
+import pandas as pd
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+from basemap_tiles import basemap_layout
+
+NUMERIC_COLUMNS = ['odometer', 'price', 'year', 'latitude', 'longitude']
+CATEGORICAL_COLUMNS = ['make', 'model', 'type', 'transmission', 'title', 'condition', 'location']
+FILTER_COLUMNS = ['make', 'model', 'type', 'transmission', 'title', 'condition']
+PLOTLY_JS = f'plotly-{get_plotlyjs_version()}.min.js'  # local copy next to the exported pages
+
+
+def encode_columns(data, numeric=NUMERIC_COLUMNS, categorical=CATEGORICAL_COLUMNS):
+    '''(blob, schema): the columns packed into one byte string and their layout.
+
+    Numbers are stored as float32 (NaN for missing); text columns as int16 codes
+    into a sorted category list (-1 for missing), or int32 when there are more
+    than 32k categories. Every array starts on an 8 byte boundary so the browser
+    can view it in place.
+    '''
+    arrays, columns = [], []
+    offset = 0
+    for name in numeric + categorical:
+        if name not in data.columns:
+            continue
+        if name in numeric:
+            values = pd.to_numeric(data[name], errors='coerce').to_numpy(dtype=np.float32)
+            column = {'name': name, 'dtype': 'float32'}
+        else:
+            text = data[name].where(data[name].isna(), data[name].astype(str))
+            codes, categories = pd.factorize(text, sort=True)
+            dtype = np.int16 if len(categories) < 2 ** 15 else np.int32
+            values = codes.astype(dtype)
+            column = {'name': name, 'dtype': np.dtype(dtype).name, 'categories': list(categories)}
+        raw = values.tobytes()
+        column.update(offset=offset, length=len(values))
+        padding = -len(raw) % 8
+        arrays.append(raw + b'\0' * padding)
+        offset += len(raw) + padding
+        columns.append(column)
+    return b''.join(arrays), {'rows': len(data), 'columns': columns}
+
+
+def export_data(data):
+    '''Listings usable by the dashboard: positive price and mileage, known make and model.'''
+    data = data.dropna(subset=['price', 'odometer', 'make', 'model'])
+    return data[(data['price'] > 0) & (data['odometer'] > 0)]
+
+
+_TEMPLATE = string.Template('''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+$plotly_script
+<style>
+  body { font-family: sans-serif; margin: 16px; }
+  h1 { font-size: 24px; }
+  .row { display: flex; flex-wrap: wrap; gap: 8px; }
+</style>
+</head>
+<body>
+<h1>$title</h1>
+<div class="row" id="filters"></div>
+<div class="row">
+  <div id="scatter" style="width:700px;height:500px"></div>
+  <div id="map" style="width:700px;height:500px"></div>
+</div>
+<script>
+const SCHEMA = $schema;
+const PAYLOAD = "$payload";
+
+// base64 -> gunzip -> one ArrayBuffer, viewed in place as one typed array per column
+async function loadColumns() {
+  const bytes = Uint8Array.from(atob(PAYLOAD), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+  const buffer = await new Response(stream).arrayBuffer();
+  const types = {float32: Float32Array, int16: Int16Array, int32: Int32Array};
+  const columns = {};
+  for (const col of SCHEMA.columns) {
+    columns[col.name] = new types[col.dtype](buffer, col.offset, col.length);
+  }
+  return columns;
+}
+
+function categories(name) {
+  return SCHEMA.columns.find(c => c.name === name).categories;
+}
+
+// Row ids grouped by code (counting sort), so a filter value maps to its rows directly
+function invertedIndex(codes, nCategories) {
+  const starts = new Int32Array(nCategories + 1);
+  for (let i = 0; i < codes.length; i++) if (codes[i] >= 0) starts[codes[i] + 1]++;
+  for (let c = 0; c < nCategories; c++) starts[c + 1] += starts[c];
+  const rows = new Int32Array(starts[nCategories]);
+  const next = starts.slice(0, nCategories);
+  for (let i = 0; i < codes.length; i++) if (codes[i] >= 0) rows[next[codes[i]]++] = i;
+  return {starts: starts, rows: rows};
+}
+
+// Rows matching every active filter: start from the shortest posting list, check the rest by code
+function selectRows(columns, indexes, active) {
+  const names = Object.keys(active);
+  if (names.length === 0) {
+    const all = new Int32Array(SCHEMA.rows);
+    for (let i = 0; i < all.length; i++) all[i] = i;
+    return all;
+  }
+  const lists = names.map(name => {
+    const index = indexes[name], code = active[name];
+    return {name: name, rows: index.rows.subarray(index.starts[code], index.starts[code + 1])};
+  });
+  lists.sort((a, b) => a.rows.length - b.rows.length);
+  const rest = lists.slice(1).map(list => [columns[list.name], active[list.name]]);
+  return lists[0].rows.filter(row => rest.every(([codes, code]) => codes[row] === code));
+}
+
+function gather(values, rows) {
+  const out = new Float32Array(rows.length);
+  for (let i = 0; i < rows.length; i++) out[i] = values[rows[i]];
+  return out;
+}
+
+// OLS of y on x from running sums; returns the two trendline end points and R squared
+function olsFromSums(x, y) {
+  let n = 0, sx = 0, sy = 0, sxx = 0, sxy = 0, syy = 0, lo = Infinity, hi = -Infinity;
+  for (let i = 0; i < x.length; i++) {
+    if (!isFinite(x[i]) || !isFinite(y[i])) continue;
+    n++; sx += x[i]; sy += y[i]; sxx += x[i] * x[i]; sxy += x[i] * y[i]; syy += y[i] * y[i];
+    if (x[i] < lo) lo = x[i];
+    if (x[i] > hi) hi = x[i];
+  }
+  const cxx = sxx - sx * sx / n, cxy = sxy - sx * sy / n, cyy = syy - sy * sy / n;
+  if (n < 3 || cxx <= 0) return null;
+  const slope = cxy / cxx, intercept = (sy - slope * sx) / n;
+  return {x: [lo, hi], y: [intercept + slope * lo, intercept + slope * hi],
+          rsquared: cyy > 0 ? cxy * cxy / (cxx * cyy) : 0, n: n};
+}
+
+function hoverText(columns, rows) {
+  const makes = categories('make'), models = categories('model');
+  const text = new Array(rows.length);
+  for (let i = 0; i < rows.length; i++) {
+    const r = rows[i];
+    text[i] = makes[columns.make[r]] + ' ' + models[columns.model[r]] +
+              '<br>Year: ' + columns.year[r] + '<br>Price: ' + columns.price[r];
+  }
+  return text;
+}
+
+function draw(columns, logOdometer, rows) {
+  const x = gather(logOdometer, rows), y = gather(columns.price, rows);
+  const text = hoverText(columns, rows);
+  const fit = olsFromSums(x, y);
+  const traces = [{type: 'scattergl', mode: 'markers', x: x, y: y, text: text, hoverinfo: 'text',
+                   marker: {size: 4, opacity: 0.6}, name: 'Listings'}];
+  let title = 'Scatter Plot: Price vs Log of Odometer';
+  if (fit) {
+    traces.push({type: 'scatter', mode: 'lines', x: fit.x, y: fit.y, name: 'OLS trendline', line: {color: 'red'}});
+    title += ' (R\u00b2 = ' + fit.rsquared.toFixed(2) + ', n = ' + fit.n + ')';
+  }
+  Plotly.react('scatter', traces, {title: {text: title}, xaxis: {title: {text: 'Log of Odometer'}},
+                                   yaxis: {title: {text: 'Price'}}});
+  Plotly.react('map', [
+    {type: 'scattermapbox', lat: gather(columns.latitude, rows), lon: gather(columns.longitude, rows),
+     text: text, hoverinfo: 'text',
+     marker: {color: y, colorscale: 'Viridis', showscale: true, size: 6}}
+  ], {title: {text: 'Map: Vehicle Prices by Location'},
+      mapbox: Object.assign({zoom: 5, center: SCHEMA.center}, SCHEMA.basemap), margin: {t: 40}});
+}
+
+function setOptions(select, labels, codes) {
+  select.innerHTML = '';
+  select.add(new Option('', ''));
+  for (const code of codes) select.add(new Option(labels[code], code));
+}
+
+function start(columns) {
+  const logOdometer = columns.odometer.map(Math.log);
+  const indexes = {}, selects = {};
+  const container = document.getElementById('filters');
+  for (const name of SCHEMA.filters) {
+    const labels = categories(name);
+    indexes[name] = invertedIndex(columns[name], labels.length);
+    const label = document.createElement('label');
+    label.textContent = name.charAt(0).toUpperCase() + name.slice(1) + ' ';
+    const select = document.createElement('select');
+    setOptions(select, labels, labels.map((_, code) => code));
+    label.appendChild(select);
+    container.appendChild(label);
+    selects[name] = select;
+  }
+  const clear = document.createElement('button');
+  clear.textContent = 'Clear Filters';
+  container.appendChild(clear);
+
+  function update() {
+    const active = {};
+    for (const name of SCHEMA.filters) {
+      if (selects[name].value !== '') active[name] = Number(selects[name].value);
+    }
+    draw(columns, logOdometer, selectRows(columns, indexes, active));
+  }
+
+  // Model options follow the selected make
+  if (selects.make && selects.model) {
+    selects.make.addEventListener('change', () => {
+      const models = categories('model');
+      let codes = models.map((_, code) => code);
+      if (selects.make.value !== '') {
+        const rows = selectRows(columns, indexes, {make: Number(selects.make.value)});
+        codes = Array.from(new Set(Array.from(rows, row => columns.model[row]))).filter(c => c >= 0);
+        codes.sort((a, b) => a - b);
+      }
+      setOptions(selects.model, models, codes);
+    });
+  }
+  for (const name of SCHEMA.filters) selects[name].addEventListener('change', update);
+  clear.addEventListener('click', () => {
+    for (const name of SCHEMA.filters) selects[name].value = '';
+    if (selects.make) selects.make.dispatchEvent(new Event('change'));
+  });
+  update();
+}
+
+loadColumns().then(start);
+</script>
+</body>
+</html>
+''')
+
+
+def write_plotly_js(directory):
+    '''Copy the plotly package's plotly.js into directory once; returns its file name.'''
+    path = os.path.join(directory, PLOTLY_JS)
+    if not os.path.exists(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+    return PLOTLY_JS
+
+
+def plotly_script(src):
+    '''<script> tag loading plotly.js from src, or inlining the plotly package's copy for 'inline'.'''
+    if src == 'inline':
+        return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    return f'<script src="{src}"></script>'
+
+
+def export_dashboard(data, path, title='Vehicle Dashboard: Montana Listings', plotly_js=None):
+    '''Write the compact dashboard for data to path; returns the file size in bytes.
+
+    plotly_js is a URL to load plotly.js from, or 'inline' to embed it in the page;
+    by default the local copy is written next to the page and loaded from there.
+    '''
+    if plotly_js is None:
+        plotly_js = write_plotly_js(os.path.dirname(os.path.abspath(path)))
+    data = export_data(data)
+    blob, schema = encode_columns(data)
+    schema['filters'] = [col for col in FILTER_COLUMNS if col in data.columns]
+    schema['basemap'] = basemap_layout()
+    schema['center'] = {'lat': float(data['latitude'].mean()), 'lon': float(data['longitude'].mean())}
+
+    html = _TEMPLATE.substitute(
+        title=title,
+        plotly_script=plotly_script(plotly_js),
+        schema=json.dumps(schema, separators=(',', ':')).replace('</', '<\\/'),
+        payload=base64.b64encode(gzip.compress(blob, compresslevel=9)).decode('ascii'),
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the compact static dashboard.')
+    parser.add_argument('--data', default=os.path.join('data', 'montana_listings.xlsx'))
+    parser.add_argument('--sheet', default='in')
+    parser.add_argument('--out', default=os.path.join('html', 'vehicle_dashboard.html'))
+    parser.add_argument('--plotly-js', default=None,
+                        help="URL of plotly.js, or 'inline'; by default a local copy is written next to the page.")
+    args = parser.parse_args()
+
+    data = pd.read_excel(args.data, sheet_name=args.sheet)
+    size = export_dashboard(data, args.out, plotly_js=args.plotly_js)
+    print(f"Dashboard saved as '{args.out}' ({size / 1e6:.2f} MB).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from appraisal import appraise, build_segment_models, fit_segment_level, load_models, save_models
+from ols_kernel import simple_ols
+
+LEVELS = [['make', 'model'], ['make'], []]
+
+
+def listings(seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for make, model, n, base in [('ford', 'f-150', 60, 65_000), ('ford', 'focus', 40, 45_000),
+                                 ('toyota', 'tacoma', 50, 70_000), ('honda', 'civic', 5, 50_000)]:
+        odometer = rng.uniform(5_000, 200_000, n)
+        frames.append(pd.DataFrame({
+            'make': make, 'model': model, 'odometer': odometer,
+            'price': base - 2_000 * np.log1p(odometer) + rng.normal(0, 1_500, n),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_segment_fits_match_simple_ols_per_group():
+    data = listings()
+    data['log_odometer'] = np.log1p(data['odometer'])
+    table = fit_segment_level(data, ['make', 'model'])
+    for (make, model), group in data.groupby(['make', 'model']):
+        reference = simple_ols(group['log_odometer'], group['price'])
+        row = table.loc[(make, model)]
+        assert row['n'] == len(group)
+        assert row['intercept'] == pytest.approx(reference.intercept)
+        assert row['slope'] == pytest.approx(reference.slope)
+        assert row['resid_std'] == pytest.approx(reference.resid_std)
+
+
+def test_small_or_unknown_segments_fall_back_to_coarser_levels():
+    models = build_segment_models(listings(), levels=LEVELS)
+    vehicles = pd.DataFrame({
+        'make': ['Ford', 'ford', 'honda', 'tesla'],
+        'model': ['F-150', 'ranger', 'civic', 'model 3'],
+        'odometer': [60_000, 60_000, 60_000, 60_000],
+    })
+    priced = appraise(models, vehicles, min_count=10)
+    assert priced['segment_level'].tolist() == ['make/model', 'make', 'all', 'all']
+    assert priced['segment_size'].tolist() == [60, 100, 155, 155]
+    assert (priced['price_lower'] <= priced['predicted_price']).all()
+    assert (priced['predicted_price'] <= priced['price_upper']).all()
+
+
+def test_lower_bound_is_never_negative():
+    data = listings()
+    data['price'] = 500 + np.random.default_rng(1).normal(0, 5_000, len(data)).clip(-400, None)
+    priced = appraise(build_segment_models(data, levels=LEVELS), pd.DataFrame({
+        'make': ['ford'], 'model': ['focus'], 'odometer': [80_000],
+    }))
+    assert priced.loc[0, 'price_lower'] == 0
+
+
+def test_saved_models_score_the_same(tmp_path):
+    models = build_segment_models(listings(), levels=LEVELS)
+    path = tmp_path / 'models.pkl'
+    save_models(models, path)
+    vehicles = pd.DataFrame({'make': ['ford', 'toyota'], 'model': ['focus', 'tacoma'], 'odometer': [30_000, 120_000]})
+    pd.testing.assert_frame_equal(appraise(load_models(path), vehicles), appraise(models, vehicles))
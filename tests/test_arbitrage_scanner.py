@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from arbitrage_scanner import ArbitrageScanner, fit_state_models
+
+
+def listings(n=120, seed=0, urls=True):
+    '''One make/model in two states; Washington prices run 5,000 above Montana's.'''
+    rng = np.random.default_rng(seed)
+    state = np.repeat(['mt', 'wa'], n // 2)
+    odometer = rng.integers(10_000, 200_000, n)
+    price = 40_000 - 2_500 * np.log1p(odometer) + np.where(state == 'wa', 5_000, 0) + rng.normal(0, 500, n)
+    data = pd.DataFrame({'make': 'ford', 'model': 'f-150', 'year': 2015, 'odometer': odometer,
+                         'price': price.round(), 'location': 'x', 'state': state})
+    if urls:
+        data['url'] = [f'https://example.com/{i}' for i in range(n)]
+    return data
+
+
+def test_cheap_state_listings_score_against_the_other_state():
+    data = listings()
+    models = fit_state_models(data)
+    scanner = ArbitrageScanner(models, top_k=10)
+    assert scanner.scan(data) == len(data)
+    table = scanner.opportunities()
+    assert (table['state'] == 'mt').all() and (table['best_state'] == 'wa').all()
+    wa = models.loc[('ford', 'f-150', 'wa')]
+    expected = wa['intercept'] + wa['slope'] * np.log1p(table['odometer'])
+    np.testing.assert_allclose(table['expected_price_best_state'], expected)
+    np.testing.assert_allclose(table['expected_gain'], expected - table['price'])
+    assert table['expected_gain'].is_monotonic_decreasing
+
+
+def test_heaps_keep_only_the_top_k_overall():
+    data = listings(n=400)
+    scanner = ArbitrageScanner(fit_state_models(data), top_k=7, chunk_size=50)
+    scanner.scan(data)
+    kept = scanner.opportunities()
+    # Scoring everything at once and taking the best 7 gives the same listings
+    full = ArbitrageScanner(fit_state_models(data), top_k=len(data))
+    full.scan(data)
+    assert len(kept) == 7
+    assert kept['url'].tolist() == full.opportunities()['url'].head(7).tolist()
+
+
+def test_no_usable_models_scores_nothing():
+    data = listings(n=20)
+    scanner = ArbitrageScanner(fit_state_models(data, min_count=1_000))
+    assert scanner.scan(data) == len(data)
+    assert scanner.opportunities().empty
+
+
+def test_rescan_after_save_and_load_skips_seen_listings(tmp_path):
+    for urls in (True, False):
+        data = listings(urls=urls)
+        scanner = ArbitrageScanner(fit_state_models(data), top_k=5)
+        scanner.scan(data.iloc[:80])
+        path = tmp_path / f'scanner_{urls}.pkl'
+        scanner.save(path)
+        restored = ArbitrageScanner.load(path)
+        # Only the 40 unseen rows are scored; the kept listings are never duplicated
+        assert restored.scan(data) == 40
+        assert restored.scan(data) == 0
+        table = restored.opportunities()
+        assert len(table) == 5
+        assert not table.duplicated(subset=['odometer', 'price', 'state']).any()
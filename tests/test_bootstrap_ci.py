@@ -0,0 +1,50 @@
+import numpy as np
+
+from bootstrap_ci import BootstrapService
+
+
+def sample(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(8, 12, n)
+    return x, 40_000 - 2_500 * x + rng.normal(0, 2_000, n)
+
+
+def test_slope_interval_covers_the_true_slope():
+    x, y = sample(500)
+    result = BootstrapService(n_resamples=400).confidence_intervals(x, y, x_new=[10.0])
+    assert result['n_resamples'] == 400
+    low, high = result['slope']
+    assert low < -2_500 < high
+    assert result['prediction_lower'][0] < result['prediction_upper'][0]
+
+
+def test_resample_budget_never_falls_below_the_minimum():
+    x, y = sample(10_000)
+    service = BootstrapService(n_resamples=1000, max_cells=100_000)
+    intercepts, slopes = service.resample_fits(x, y)
+    assert len(slopes) == 200
+
+
+def test_too_few_rows_give_nan_intervals():
+    service = BootstrapService()
+    for n in (0, 1):
+        result = service.confidence_intervals(np.ones(n), np.ones(n), x_new=[1.0, 2.0])
+        assert result['n_resamples'] == 0
+        assert np.isnan(result['slope']).all() and np.isnan(result['prediction_lower']).all()
+
+
+def test_pool_is_shut_down_on_exit():
+    x, y = sample(2_000)
+    with BootstrapService(n_resamples=400, parallel_cells=1, chunk_cells=200_000, max_workers=2) as service:
+        intercepts, slopes = service.resample_fits(x, y)
+        assert service._pool is not None
+    assert service._pool is None and len(slopes) == 400
+
+
+def test_cache_is_keyed_on_prediction_points_and_level():
+    x, y = sample(500)
+    service = BootstrapService(n_resamples=200)
+    first = service.confidence_intervals(x, y, x_new=[10.0], key='all')
+    assert service.confidence_intervals(x, y, x_new=[10.0], key='all') is first
+    assert len(service.confidence_intervals(x, y, x_new=[9.0, 11.0], key='all')['x_new']) == 2
+    assert service.confidence_intervals(x, y, x_new=[10.0], level=0.8, key='all')['level'] == 0.8
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from comparables import ComparablesIndex
+
+
+def listings(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'make': 'ford', 'model': rng.choice(['f-150', 'escape'], n),
+        'year': rng.integers(2005, 2022, n),
+        'odometer': rng.integers(5_000, 200_000, n),
+        'latitude': rng.uniform(45, 49, n), 'longitude': rng.uniform(-115, -104, n),
+        'price': rng.integers(3_000, 50_000, n),
+    }, index=rng.permutation(np.arange(1000, 1000 + n)))
+
+
+def test_query_batch_drops_only_the_listing_itself():
+    data = listings()
+    index = ComparablesIndex(data)
+    result = index.query_batch(data, k=5)
+    assert not (result.index.to_numpy() == result['query_id'].to_numpy()).any()
+    assert (result.groupby('query_id').size() == 5).all()
+    # Same answer when the rows are given by position
+    by_position = index.query_batch(positions=np.arange(len(data)), k=5)
+    pd.testing.assert_frame_equal(result, by_position)
+
+
+def test_query_batch_keeps_exact_duplicates_and_outside_rows():
+    data = listings()
+    # An identical repost under another label is a comparable at distance 0
+    data = pd.concat([data, data.iloc[[0]].rename(index={data.index[0]: 1})])
+    index = ComparablesIndex(data)
+    result = index.query_batch(data.iloc[[0]], k=3)
+    assert 1 in result.index and data.index[0] not in result.index
+
+    # A new listing whose label collides with an indexed one is not its own comparable
+    outside = data.iloc[[5]].copy()
+    outside['odometer'] += 1_000
+    result = index.query_batch(outside, k=3)
+    assert data.index[5] in result.index
+    assert result['rank'].tolist() == [1, 2, 3]
+
+
+def test_query_matches_nearest():
+    data = listings()
+    index = ComparablesIndex(data)
+    label = data.index[7]
+    single = index.query(label, k=4)
+    batch = index.query_batch(data.loc[[label]], k=4)
+    assert single.index.tolist() == batch.index.tolist()
+    np.testing.assert_allclose(single['distance_km'], batch['distance_km'])
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from dedup import _MERSENNE_PRIME, _mulmod_mersenne, duplicate_clusters, flag_duplicates
+
+DEALER_TEXT = ('big sky auto sales financing available for all credit types trade ins welcome '
+               'call or text today for a test drive clean carfax warranty options available')
+
+
+def test_mulmod_is_exact_modular_product():
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, _MERSENNE_PRIME, 500, dtype=np.uint64)
+    a = rng.integers(0, _MERSENNE_PRIME, 500, dtype=np.uint64)
+    result = _mulmod_mersenne(x, a)
+    assert all(int(r) == int(u) * int(v) % _MERSENNE_PRIME for r, u, v in zip(result, x, a))
+
+
+def test_same_dealer_text_distinct_cars_stay_separate():
+    cars = pd.DataFrame({
+        'name': ['2018 ford f-150 xlt'] * 4,
+        'title_text': [DEALER_TEXT] * 4,
+        'make': 'ford', 'model': 'f-150', 'year': 2018,
+        'odometer': [42_000, 61_000, 88_000, 120_000],
+        'price': [31_000, 28_500, 24_000, 19_500],
+    })
+    labels = duplicate_clusters(cars)
+    assert len(set(labels)) == 4
+
+
+def test_repost_is_collapsed_but_chain_is_not():
+    cars = pd.DataFrame({
+        'name': ['2015 toyota tacoma trd'] * 4,
+        'title_text': [DEALER_TEXT] * 4,
+        'make': 'toyota', 'model': 'tacoma', 'year': 2015,
+        # 0 and 1 are the same car reposted; 1-2 and 2-3 are each within the
+        # tolerances, but 1 and 3 are not, so they must not end up together
+        'odometer': [90_000, 90_000, 91_500, 93_000],
+        'price': [22_000, 22_000, 22_900, 23_800],
+    })
+    flagged = flag_duplicates(cars)
+    labels = flagged['dup_cluster'].to_numpy()
+    assert labels[0] == labels[1]
+    assert labels[1] != labels[3]
+    for cluster in set(labels):
+        members = np.flatnonzero(labels == cluster)
+        prices = cars['price'].to_numpy()[members]
+        assert prices.max() <= prices.min() * 1.05
+    assert flagged['is_duplicate'].sum() == len(cars) - len(set(labels))
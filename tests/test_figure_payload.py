@@ -0,0 +1,18 @@
+import numpy as np
+import plotly.graph_objs as go
+
+from figure_payload import compact_array, compact_figure
+
+
+def test_large_integers_are_not_rounded():
+    ids = np.array([2 ** 24 + 1, 20_000_001, 5])
+    assert compact_array(ids) is ids
+    assert compact_array(np.array([1, 2, 3])).dtype == np.float32
+
+
+def test_kept_customdata_round_trips_ids():
+    ids = np.arange(2000) + 2 ** 24 + 1
+    fig = go.Figure(go.Scatter(x=np.arange(2000.0), y=np.arange(2000.0), customdata=ids[:, None]))
+    trace = compact_figure(fig, keep_customdata=True).to_plotly_json()['data'][0]
+    assert trace['type'] == 'scattergl' and trace['x']['dtype'] == 'f4'
+    assert (np.asarray(compact_figure(fig, keep_customdata=True).data[0].customdata)[:, 0] == ids).all()
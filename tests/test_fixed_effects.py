@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fixed_effects import absorb, fe_regression
+
+smf = pytest.importorskip('statsmodels.formula.api')
+
+
+def listings(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'make': rng.choice(['ford', 'toyota', 'honda', 'ram', 'jeep'], n),
+        'location': rng.choice(['billings', 'missoula', 'helena', 'bozeman'], n),
+        'log_odometer': rng.uniform(8, 12, n),
+        'age': rng.integers(0, 20, n).astype(float),
+    })
+    make_effect = data['make'].map({'ford': 0, 'toyota': 3_000, 'honda': 2_000, 'ram': 5_000, 'jeep': 1_000})
+    data['price'] = (40_000 - 2_000 * data['log_odometer'] - 500 * data['age'] + make_effect
+                     + rng.normal(0, 3_000, n))
+    return data
+
+
+def test_one_fixed_effect_matches_ols_with_dummies():
+    data = listings()
+    result = fe_regression(data, 'price', ['log_odometer', 'age'], ['make'])
+    reference = smf.ols('price ~ log_odometer + age + C(make)', data).fit()
+    table = result['table']
+    for col in ['log_odometer', 'age']:
+        assert table.loc[col, 'Coefficient'] == pytest.approx(reference.params[col])
+        assert table.loc[col, 'Standard Error'] == pytest.approx(reference.bse[col])
+    assert result['df_resid'] == reference.df_resid
+
+
+def test_clustered_errors_match_ols_with_dummies():
+    data = listings()
+    result = fe_regression(data, 'price', ['log_odometer', 'age'], ['make'], cluster='location')
+    groups = pd.factorize(data['location'])[0]
+    reference = smf.ols('price ~ log_odometer + age + C(make)', data).fit(
+        cov_type='cluster', cov_kwds={'groups': groups}, use_t=True)
+    table = result['table']
+    for col in ['log_odometer', 'age']:
+        assert table.loc[col, 'Coefficient'] == pytest.approx(reference.params[col])
+        assert table.loc[col, 'Standard Error'] == pytest.approx(reference.bse[col])
+        assert table.loc[col, 'P>|t|'] == pytest.approx(reference.pvalues[col])
+
+
+def test_two_fixed_effects_match_ols_with_dummies():
+    data = listings()
+    result = fe_regression(data, 'price', ['log_odometer', 'age'], ['make', 'location'], tol=1e-12)
+    reference = smf.ols('price ~ log_odometer + age + C(make) + C(location)', data).fit()
+    table = result['table']
+    for col in ['log_odometer', 'age']:
+        assert table.loc[col, 'Coefficient'] == pytest.approx(reference.params[col])
+        assert table.loc[col, 'Standard Error'] == pytest.approx(reference.bse[col])
+
+
+def test_absorb_without_iterations_returns_the_input():
+    values = np.arange(6.0)
+    demeaned, iterations = absorb(values, [np.array([0, 0, 1, 1, 2, 2])], max_iter=0)
+    assert iterations == 0
+    np.testing.assert_array_equal(demeaned[:, 0], values)
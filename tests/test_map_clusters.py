@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from map_clusters import ClusterPyramid, viewport_bounds
+
+
+def listings(n=3_000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'latitude': rng.uniform(44.5, 49, n), 'longitude': rng.uniform(-116, -104, n),
+        'price': rng.uniform(2_000, 60_000, n), 'residual': rng.normal(0, 5_000, n),
+    })
+
+
+def test_every_level_keeps_every_listing_and_the_means():
+    data = listings()
+    pyramid = ClusterPyramid(data, max_zoom=8)
+    previous = 0
+    for zoom in range(8):
+        level = pyramid.clusters(zoom)
+        assert level['count'].sum() == len(data)
+        weighted = (level['mean_price'] * level['count']).sum() / len(data)
+        assert np.isclose(weighted, data['price'].mean())
+        # Cells only split as the zoom grows
+        assert len(level) >= previous
+        previous = len(level)
+    assert pyramid.is_point_level(8) and len(pyramid.clusters(8)) == len(data)
+
+
+def test_clusters_are_cut_to_the_viewport():
+    data = listings()
+    pyramid = ClusterPyramid(data, max_zoom=8)
+    bounds = viewport_bounds({'lat': 46.5, 'lon': -110}, 7)
+    inside = pyramid.clusters(7, bounds)
+    lon_min, lat_min, lon_max, lat_max = bounds
+    assert inside['longitude'].between(lon_min, lon_max).all()
+    assert inside['latitude'].between(lat_min, lat_max).all()
+    assert 0 < len(inside) < len(pyramid.clusters(7))
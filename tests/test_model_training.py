@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sklearn')
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from sklearn.model_selection import KFold, cross_val_score
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from model_training import cross_validate_models
+
+
+def regression_data(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        'log_odometer': rng.uniform(8, 12, n),
+        'year': rng.integers(2000, 2024, n).astype(float),
+        'noise': rng.normal(0, 1, n),
+    })
+    y = 30_000 - 1_500 * X['log_odometer'] + 400 * (X['year'] - 2000) + rng.normal(0, 2_000, n)
+    return X, y
+
+
+def sklearn_cv_mse(estimator, X, y, n_splits=5):
+    folds = KFold(n_splits=n_splits, shuffle=True, random_state=42)
+    scores = cross_val_score(make_pipeline(StandardScaler(), estimator), X, y,
+                             cv=folds, scoring='neg_mean_squared_error')
+    return -scores.mean()
+
+
+def test_cv_errors_match_sklearn_cross_validation():
+    X, y = regression_data()
+    cv = cross_validate_models(X, y, n_splits=5, n_alphas=5, n_jobs=1)
+    for row in cv['results'].itertuples():
+        if row.model == 'OLS':
+            expected = sklearn_cv_mse(LinearRegression(), X, y)
+        elif row.model == 'Ridge':
+            expected = sklearn_cv_mse(Ridge(alpha=row.alpha), X, y)
+        else:
+            expected = sklearn_cv_mse(Lasso(alpha=row.alpha, max_iter=5000), X, y)
+        assert row.cv_mse == pytest.approx(expected, rel=1e-4)
+
+
+def test_chosen_model_is_refit_on_the_original_scale():
+    X, y = regression_data()
+    cv = cross_validate_models(X, y, n_splits=5, n_alphas=5, n_jobs=1)
+    assert cv['results'].loc[0, 'cv_mse'] == cv['results']['cv_mse'].min()
+    predictions = X.to_numpy() @ cv['coefficients'].to_numpy() + cv['intercept']
+    scaled = StandardScaler().fit_transform(X)
+    np.testing.assert_allclose(predictions, cv['estimator'].predict(scaled), rtol=1e-8)
+    assert cv['coefficients']['log_odometer'] < 0 < cv['coefficients']['year']
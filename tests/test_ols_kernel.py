@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from ols_kernel import simple_ols, t_quantile, t_two_sided_pvalue
+
+sm = pytest.importorskip('statsmodels.api')
+
+
+def sample(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.log(rng.uniform(5_000, 250_000, n))
+    return x, 60_000 - 4_000 * x + rng.normal(0, 6_000, n)
+
+
+@pytest.mark.parametrize('n', [5, 40, 5_000])
+def test_simple_ols_matches_statsmodels(n):
+    x, y = sample(n)
+    fit = simple_ols(x, y)
+    reference = sm.OLS(y, sm.add_constant(x)).fit()
+    np.testing.assert_allclose(fit.params, reference.params, rtol=1e-9)
+    np.testing.assert_allclose(fit.bse, reference.bse, rtol=1e-9)
+    np.testing.assert_allclose(fit.tvalues, reference.tvalues, rtol=1e-9)
+    np.testing.assert_allclose(fit.pvalues, reference.pvalues, rtol=1e-6, atol=1e-12)
+    np.testing.assert_allclose([fit.rsquared, fit.rsquared_adj, fit.fvalue],
+                               [reference.rsquared, reference.rsquared_adj, reference.fvalue], rtol=1e-9)
+    np.testing.assert_allclose(fit.f_pvalue, reference.f_pvalue, rtol=1e-6, atol=1e-12)
+
+
+def test_confidence_band_matches_statsmodels():
+    x, y = sample(200)
+    fit = simple_ols(x, y)
+    grid = np.linspace(x.min(), x.max(), 7)
+    reference = sm.OLS(y, sm.add_constant(x)).fit().get_prediction(sm.add_constant(grid))
+    lower, upper = fit.confidence_band(grid, 0.95)
+    np.testing.assert_allclose(np.column_stack([lower, upper]), reference.conf_int(alpha=0.05), rtol=1e-7)
+
+
+def test_large_prices_keep_their_precision():
+    x, y = sample(1_000)
+    shifted = simple_ols(x, y + 1e9)
+    assert shifted.slope == pytest.approx(simple_ols(x, y).slope, rel=1e-6)
+
+
+def test_t_distribution_helpers():
+    assert t_quantile(0.95, 10) == pytest.approx(2.228138852, rel=1e-8)
+    assert t_two_sided_pvalue(2.228138852, 10) == pytest.approx(0.05, rel=1e-7)
+    assert np.isnan(simple_ols([1.0, 2.0], [3.0, 4.0]).slope)
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from outlier_sketches import Moments, QuantileSketch, SegmentSummaries
+
+
+def rank_error(values, estimate, q):
+    '''Distance between q and the rank of estimate among values, as a fraction.'''
+    return abs(np.searchsorted(np.sort(values), estimate) / len(values) - q)
+
+
+def test_merged_sketch_quantiles_within_rank_error():
+    rng = np.random.default_rng(0)
+    parts = [rng.lognormal(9 + i / 10, 0.5, 5_000) for i in range(8)]
+    sketch = QuantileSketch.from_values(parts[0], k=128)
+    for part in parts[1:]:
+        sketch = sketch.merge(QuantileSketch.from_values(part, k=128))
+    values = np.concatenate(parts)
+    for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+        assert rank_error(values, sketch.quantile(q), q) < 2 / 128
+
+
+def test_moments_merge_matches_pandas():
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(20_000, 5_000, 300), rng.normal(35_000, 9_000, 700)
+    merged = Moments.from_values(a).merge(Moments.from_values(b))
+    both = pd.Series(np.concatenate([a, b]))
+    assert np.isclose(merged.mean, both.mean())
+    assert np.isclose(merged.std, both.std())
+
+
+def test_segment_bounds_match_direct_computation():
+    rng = np.random.default_rng(2)
+    n = 20_000
+    data = pd.DataFrame({
+        'make': rng.choice(['ford', 'toyota', 'ram'], n),
+        'year': rng.integers(2000, 2024, n),
+        'price': rng.lognormal(9.8, 0.6, n),
+    })
+    summaries = SegmentSummaries(data, 'price', ['make', 'year'])
+    selected = data[data['make'].isin(['ford', 'ram']) & data['year'].between(2010, 2020)]['price']
+    lower, upper = summaries.std_bounds(2, {'make': ['ford', 'ram']}, {'year': (2010, 2020)})
+    assert np.isclose(lower, selected.mean() - 2 * selected.std())
+    assert np.isclose(upper, selected.mean() + 2 * selected.std())
+    sketch = summaries.sketch({'make': ['ford', 'ram']}, {'year': (2010, 2020)})
+    for q in (0.25, 0.75):
+        assert rank_error(selected, sketch.quantile(q), q) < 2 / 128
+    assert summaries.covers({'make': ['ford']}, {'year': (2010, 2020)})
+    assert not summaries.covers({'make': ['ford'], 'state': ['mt']})
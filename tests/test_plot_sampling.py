@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from plot_sampling import PlotSample
+
+
+def listings(n=2_000, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'make': rng.choice(['ford', 'toyota', None], n),
+        'model': rng.choice(['a', 'b', 'c'], n),
+        'price': rng.normal(20_000, 3_000, n),
+    })
+    data.loc[:9, 'price'] = 500_000  # a few extreme prices
+    return data
+
+
+def test_sample_keeps_outliers_and_rows_with_missing_strata():
+    data = listings()
+    sample = PlotSample(data).sample(data, 200)
+    assert len(sample) == 200
+    assert set(range(10)) <= set(sample.index)
+    assert sample['make'].isna().any()
+
+
+def test_sample_of_a_selection_stays_inside_it():
+    data = listings()
+    sampler = PlotSample(data)
+    subset = data[data['model'] == 'b']
+    sample = sampler.sample(subset, 100)
+    assert len(sample) == 100 and (sample['model'] == 'b').all()
+    assert sample.index.is_monotonic_increasing
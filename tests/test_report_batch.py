@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from report_batch import build_reports, unique_slugs
+
+
+def test_colliding_slugs_get_distinct_names():
+    names = unique_slugs([('ford', 'f-150'), ('ford', 'f 150'), ('ford', 'ranger')])
+    assert len(set(names.values())) == 3
+    assert names[('ford', 'ranger')] == 'ford--ranger'
+    assert names[('ford', 'f-150')].startswith('ford--f-150-')
+
+
+def test_build_reports_writes_every_segment_once(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 60
+    data = pd.DataFrame({
+        'make': 'ford', 'model': np.repeat(['f-150', 'f 150', 'ranger'], n // 3), 'state': 'mt',
+        'year': rng.integers(2005, 2022, n), 'odometer': rng.integers(5_000, 200_000, n),
+        'price': rng.integers(3_000, 50_000, n),
+        'latitude': rng.uniform(45, 49, n), 'longitude': rng.uniform(-115, -104, n),
+    })
+    levels = {'make_model': ['make', 'model']}
+    assert build_reports(data, str(tmp_path), levels, min_count=5, max_workers=1) == (3, 0)
+    assert len(os.listdir(tmp_path / 'make_model')) == 3
+    # Nothing changed, nothing is rendered again
+    assert build_reports(data, str(tmp_path), levels, min_count=5, max_workers=1) == (0, 3)
@@ -0,0 +1,63 @@
+import os
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from outlier_sketches import SegmentSummaries
+from plot_sampling import PlotSample
+from shared_dataset import SharedDataset, attach, publish, run_with_shared
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def listings(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'make': rng.choice(['ford', 'toyota', 'ram', None], n),
+        'model': rng.choice(['a', 'b', 'c'], n),
+        'year': rng.integers(2005, 2022, n),
+        'price': rng.integers(3_000, 50_000, n).astype(float),
+    })
+
+
+def test_select_matches_pandas():
+    data = listings()
+    dataset = SharedDataset.from_frame(data, index_columns=['make', 'model'])
+    rows = dataset.select({'make': ['ford', 'ram', 'ford'], 'model': ['b']}, {'price': (10_000, 30_000)})
+    expected = data[data['make'].isin(['ford', 'ram']) & (data['model'] == 'b')
+                    & data['price'].between(10_000, 30_000)]
+    assert rows.tolist() == expected.index.tolist()
+    pd.testing.assert_frame_equal(dataset.frame(rows, ['make', 'price']), expected[['make', 'price']],
+                                  check_index_type=False)
+
+
+def test_published_dataset_and_derived_states_round_trip():
+    data = listings()
+    dataset = SharedDataset.from_frame(data, index_columns=['make'])
+    summaries = SegmentSummaries(data, 'price', ['make', 'model'])
+    dataset.derived = {'price_summaries': summaries.state(), 'plot_sample': PlotSample(data).state()}
+    shm = publish(dataset)
+    try:
+        shared = attach(shm.name)
+        pd.testing.assert_frame_equal(shared.frame(), dataset.frame())
+        restored = SegmentSummaries.from_state(shared.derived['price_summaries'])
+        assert restored.iqr_bounds(1.5, {'make': ['ford']}) == summaries.iqr_bounds(1.5, {'make': ['ford']})
+        sample = PlotSample.from_state(shared.derived['plot_sample'], pd.RangeIndex(len(data)))
+        assert len(sample.sample(shared.frame(), 50)) == 50
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_block_is_unlinked_when_the_command_exits(tmp_path, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', ROOT)
+    name_file = tmp_path / 'name'
+    worker = ('import os, sys; from shared_dataset import attach; '
+              'name = os.environ["SHARED_DATASET"]; open(sys.argv[1], "w").write(name); '
+              'sys.exit(0 if len(attach(name).frame()) == 500 else 3)')
+    assert run_with_shared(listings(), [sys.executable, '-c', worker, str(name_file)]) == 0
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name_file.read_text())
@@ -0,0 +1,68 @@
+import base64
+import gzip
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+from static_export import encode_columns, export_dashboard, export_data
+
+
+def listings(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'price': rng.integers(2_000, 60_000, n).astype(float), 'odometer': rng.integers(1, 200_000, n),
+        'year': rng.integers(2000, 2022, n), 'latitude': rng.uniform(45, 49, n),
+        'longitude': rng.uniform(-116, -104, n),
+        'make': rng.choice(['ford', 'toyota', None], n), 'model': rng.choice(['a', 'b'], n),
+    })
+    data.loc[3, 'price'] = np.nan
+    return data
+
+
+def decode(blob, schema):
+    columns = {}
+    for column in schema['columns']:
+        assert column['offset'] % 8 == 0
+        values = np.frombuffer(blob, dtype=column['dtype'], count=column['length'], offset=column['offset'])
+        if 'categories' in column:
+            labels = np.array(column['categories'] + [None], dtype=object)
+            values = labels[values]
+        columns[column['name']] = values
+    return columns
+
+
+def test_encoded_columns_decode_to_the_data():
+    data = listings()
+    blob, schema = encode_columns(data)
+    columns = decode(blob, schema)
+    assert schema['rows'] == len(data)
+    np.testing.assert_allclose(columns['price'], data['price'].to_numpy(dtype=np.float32), equal_nan=True)
+    np.testing.assert_array_equal(columns['year'], data['year'].to_numpy(dtype=np.float32))
+    assert list(columns['make']) == [None if pd.isna(v) else v for v in data['make']]
+    assert 'type' not in columns
+
+
+def test_export_embeds_the_compressed_columns(tmp_path):
+    data = listings()
+    path = tmp_path / 'dashboard.html'
+    export_dashboard(data, str(path), plotly_js='plotly.min.js')
+    page = path.read_text()
+    payload = re.search(r'const PAYLOAD = "([^"]+)"', page).group(1)
+    schema = json.loads(re.search(r'const SCHEMA = (.*);', page).group(1))
+    columns = decode(gzip.decompress(base64.b64decode(payload)), schema)
+    # Listings without a price or make are not exported
+    assert schema['rows'] == len(export_data(data)) < len(data)
+    assert not np.isnan(columns['price']).any() and None not in set(columns['make'])
+    assert '<script src="plotly.min.js"></script>' in page
+
+
+def test_default_export_loads_plotly_from_a_local_copy(tmp_path):
+    path = tmp_path / 'dashboard.html'
+    size = export_dashboard(listings(), str(path))
+    # The page carries the data, not the 4.5 MB of plotly.js
+    assert size < 200_000
+    page = path.read_text()
+    src = re.search(r'<script src="(plotly-[^"]+\.min\.js)"></script>', page).group(1)
+    assert (tmp_path / src).stat().st_size > 1_000_000
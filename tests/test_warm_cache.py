@@ -0,0 +1,27 @@
+import warm_cache
+from warm_cache import FigureCache
+
+
+def test_cache_creates_nothing_until_written(tmp_path):
+    directory = tmp_path / 'figures'
+    cache = FigureCache(str(directory), version='v1')
+    assert cache.get('view', ['ford']) is None
+    assert not directory.exists()
+    cache.put({'figure': 1}, 'view', ['ford'])
+    assert cache.get('view', ['ford']) == {'figure': 1}
+
+
+def test_lookups_are_logged_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(warm_cache, 'LOG_EVERY', 10)
+    cache = FigureCache(str(tmp_path), version='v1')
+    cache.put({'figure': 1}, 'hot')
+    for _ in range(6):
+        cache.get('hot')
+        cache.get('cold')
+    # One batch of 10 lookups written, two still in memory
+    with open(cache.log_path) as f:
+        assert len(f.readlines()) == 2
+    cache.flush()
+    overall, table = cache.hit_rates()
+    assert overall == 0.5
+    assert table['requests'].tolist() == [6, 6]
@@ -0,0 +1,52 @@
+# Analytic OLS trendlines for the scatter plots.
+# The fit comes from the summary sums in ols_kernel.simple_ols, and the line is drawn
+# as a segment between its two end points. The optional confidence band for the mean
+# price is the closed-form OLS interval, sampled at a few dozen x positions. The
+# trendline payload therefore stays the same size however many listings are plotted,
+# unlike px trendline='ols', which fits with statsmodels and emits one point per row.
+
+import numpy as np
+import plotly.graph_objs as go
+
+from ols_kernel import simple_ols
+
+BAND_POINTS = 40
+
+
+def trendline_traces(fit, band=False, level=0.95, band_points=BAND_POINTS,
+                     name='OLS trendline', color='red'):
+    '''Plotly traces for a fitted simple_ols result: optional band, then the line.'''
+    traces = []
+    if band:
+        grid = np.linspace(fit.x_min, fit.x_max, band_points)
+        lower, upper = fit.confidence_band(grid, level)
+        traces.append(go.Scatter(
+            x=np.concatenate([grid, grid[::-1]]), y=np.concatenate([upper, lower[::-1]]),
+            fill='toself', fillcolor='rgba(255,0,0,0.15)', line=dict(width=0),
+            hoverinfo='skip', name=f'{level:.0%} confidence band'))
+    ends = np.array([fit.x_min, fit.x_max])
+    traces.append(go.Scatter(x=ends, y=fit.predict(ends), mode='lines', name=name,
+                             line=dict(color=color)))
+    return traces
+
+
+def fit_trendline(x, y, band=False, level=0.95, **kwargs):
+    '''(fit, traces): y fitted on x, and its trendline traces (and band).
+
+    Rows where x or y is missing are left out. With fewer than three rows
+    there are no traces.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ok = np.isfinite(x) & np.isfinite(y)
+    fit = simple_ols(x[ok], y[ok])
+    if fit.nobs >= 3 and np.isfinite(fit.slope):
+        return fit, trendline_traces(fit, band=band, level=level, **kwargs)
+    return fit, []
+
+
+def add_trendline(fig, x, y, band=False, level=0.95, **kwargs):
+    '''Fit y on x, add the trendline (and band) to fig and return the fit.'''
+    fit, traces = fit_trendline(x, y, band=band, level=level, **kwargs)
+    fig.add_traces(traces)
+    return fit
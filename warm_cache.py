@@ -0,0 +1,133 @@
+# Shared warm cache of rendered views for the Dash and Panel dashboards.
+# Most traffic goes to a few views: no filter, each top make, and each top make/model.
+# At deploy time the apps render those views once (--warm-cache) and store the
+# figure JSON and regression numbers as files in a directory shared by all workers,
+# so a cold worker serves them without filtering or fitting anything. Lookups are
+# counted per view in memory and the counts are appended to a log every LOG_EVERY
+# lookups (and at exit); hit_rates() shows which views are requested and how often
+# they were served from the cache, to tune how many views are warmed.
+#
+#   python warm_cache.py --cache cache/figures     (print the hit rates)
+
+import argparse
+import atexit
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+DEFAULT_DIRECTORY = os.path.join('cache', 'figures')
+LOG_EVERY = 200
+
+
+def dataset_version(path):
+    '''Size and modification time of the data file; a new file gets new cache keys.'''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    return f'{stat.st_size}-{int(stat.st_mtime)}'
+
+
+def filter_values(values):
+    '''Dropdown / widget value in a canonical form for cache keys.'''
+    if values is None or values == '' or values == []:
+        return []
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    return sorted(str(value) for value in values)
+
+
+def top_filter_states(data, n_makes=10, n_models=3):
+    '''No filter, each of the top makes, and the top models of each of those makes.'''
+    states = [{'make': [], 'model': []}]
+    top_makes = data['make'].value_counts().nlargest(n_makes).index
+    for make in top_makes:
+        states.append({'make': [make], 'model': []})
+        models = data.loc[data['make'] == make, 'model'].value_counts().nlargest(n_models).index
+        states.extend({'make': [make], 'model': [model]} for model in models)
+    return states
+
+
+class FigureCache:
+    '''JSON payloads on disk, one file per view, shared between worker processes.'''
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, version=''):
+        self.directory = directory
+        self.version = version
+        self.log_path = os.path.join(directory, 'requests.jsonl')
+        self.counts = {}  # view -> [requests, hits] not yet written to the log
+        self.pending = 0
+        atexit.register(self.flush)
+
+    def _label(self, parts):
+        return json.dumps(parts, default=str, sort_keys=True)
+
+    def _path(self, label):
+        digest = hashlib.sha1(f'{self.version}|{label}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def get(self, *parts):
+        '''Cached payload for the view, or None; the lookup is counted either way.'''
+        label = self._label(parts)
+        try:
+            with open(self._path(label), encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            payload = None
+        counts = self.counts.setdefault(label, [0, 0])
+        counts[0] += 1
+        counts[1] += payload is not None
+        self.pending += 1
+        if self.pending >= LOG_EVERY:
+            self.flush()
+        return payload
+
+    def flush(self):
+        '''Append the lookup counts gathered since the last flush to the log.'''
+        if not self.counts:
+            return
+        lines = ''.join(json.dumps({'view': view, 'requests': requests, 'hits': hits}) + '\n'
+                        for view, (requests, hits) in self.counts.items())
+        self.counts, self.pending = {}, 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # One write per flush, in append mode, so workers can share the log file
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError:
+            pass  # hit rates are best effort; never fail a request over them
+
+    def put(self, payload, *parts):
+        '''Store a JSON-serializable payload for the view.'''
+        path = self._path(self._label(parts))
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(temporary, path)
+
+    def hit_rates(self):
+        '''(overall hit rate, per-view table of requests, hits and hit rate).'''
+        if not os.path.exists(self.log_path):
+            return float('nan'), pd.DataFrame(columns=['requests', 'hits', 'hit_rate'])
+        log = pd.read_json(self.log_path, lines=True)
+        table = log.groupby('view')[['requests', 'hits']].sum()
+        table['hit_rate'] = table['hits'] / table['requests']
+        return table['hits'].sum() / table['requests'].sum(), table.sort_values('requests', ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show warm cache hit rates.')
+    parser.add_argument('--cache', default=DEFAULT_DIRECTORY)
+    parser.add_argument('--top', type=int, default=20, help='Most requested views to list.')
+    args = parser.parse_args()
+
+    overall, table = FigureCache(args.cache).hit_rates()
+    print(f'Overall hit rate: {overall:.1%} over {table["requests"].sum()} requests')
+    print(table.head(args.top).to_string())
+
+
+if __name__ == '__main__':
+    main()